@@ -1,64 +1,323 @@
 # backend/app.py
-from flask import Flask, jsonify, request, send_file
+from flask import Blueprint, Flask, current_app, jsonify, request, send_file
+from flask.cli import with_appcontext
 from flask_cors import CORS
+import click
+import collections
+import contextlib
 import os
 import datetime
-import openpyxl
-from PIL import Image, ImageDraw, ImageFont
 import io
-from flask_sqlalchemy import SQLAlchemy
+import threading
+from sqlalchemy import case, exists, func, literal, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
+import functools
+import hashlib
+import itertools
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import shutil
+import uuid
 import json
+import assets
+import catalog
+import changes
+import database
+import exports
+import importer
+import instrumentation
+import jobs
+import render
+import reports
+import responses
+import retention
+import search
+import sequences
+from models import db, School, RepairItem, Quotation, QuotationItem, IdempotencyKey, QuotationSequence, ExportJob, \
+    CacheVersion
 
-app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///repair_system.db'
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-CORS(app)  # 允许跨域请求，方便前后端分离开发
-db = SQLAlchemy(app)
-
-# --- 数据库模型 ---
-class School(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    items = db.relationship('RepairItem', backref='school', lazy=True)
-
-class RepairItem(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    unit = db.Column(db.String(20), nullable=False)
-    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
-
-class Quotation(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    quotation_number = db.Column(db.String(32), nullable=False)
-    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False)
-    school_name = db.Column(db.String(100), nullable=False)
-    repair_person = db.Column(db.String(100), nullable=False)
-    repair_location = db.Column(db.String(100), nullable=False)
-    repair_time = db.Column(db.String(32), nullable=False)
-    total_price = db.Column(db.Float, nullable=False)
-    created_at = db.Column(db.String(32), nullable=False)
-    items = db.relationship('QuotationItem', backref='quotation', lazy=True)
-
-class QuotationItem(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    quotation_id = db.Column(db.Integer, db.ForeignKey('quotation.id'), nullable=False)
-    item_id = db.Column(db.Integer, nullable=False)
-    name = db.Column(db.String(100), nullable=False)
-    price = db.Column(db.Float, nullable=False)
-    unit = db.Column(db.String(20), nullable=False)
-    quantity = db.Column(db.Integer, nullable=False)
-    subtotal = db.Column(db.Float, nullable=False)
-
-with app.app_context():
+api = Blueprint('api', __name__)
+
+def create_app(config=None):
+    """创建应用；config 中的配置优先于环境变量
+
+    导入本模块不会创建应用或访问数据库。flask 命令通过 FLASK_APP=app:create_app 调用，
+    生产环境由 serve.py 在主进程中调用一次
+    """
+    # /static 由 assets 提供，带内容指纹和预压缩
+    # 实例目录为仓库根目录下的 instance/，默认的 SQLite 数据库文件在这里
+    app = Flask(__name__, static_folder=None,
+                instance_path=os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'instance'))
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['UPLOADS_FOLDER'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
+    # 归档库目录，flask archive-quotations 把较早的计价单按年份移到这里
+    app.config['ARCHIVE_FOLDER'] = os.environ.get(
+        'ARCHIVE_FOLDER', os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'archive'))
+    # 中文字体路径，未配置时按 render.FONT_CANDIDATES 依次查找（含常见 Linux 字体）
+    app.config['CJK_FONT_PATH'] = os.environ.get('CJK_FONT_PATH')
+    app.config['RENDER_CACHE_MAX_BYTES'] = int(os.environ.get('RENDER_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    # 批量出图的进程数，默认等于 CPU 核数
+    app.config['RENDER_WORKERS'] = int(os.environ.get('RENDER_WORKERS', os.cpu_count() or 1))
+    app.config['BATCH_PDF_MAX_PAGES'] = int(os.environ.get('BATCH_PDF_MAX_PAGES', 300))
+    # 每个 worker 每次向数据库预留的计价单号数量
+    app.config['QUOTATION_NUMBER_BLOCK'] = int(os.environ.get('QUOTATION_NUMBER_BLOCK', 20))
+    # 多 worker 部署时，每个进程最多每隔多少秒检查一次其他进程是否修改过价目表和计价单（用于丢弃本地缓存）
+    app.config['CATALOG_SYNC_SECONDS'] = float(os.environ.get('CATALOG_SYNC_SECONDS', 1.0))
+    # 超过该大小的价目表文件在后台线程中导入
+    app.config['IMPORT_SYNC_MAX_BYTES'] = int(os.environ.get('IMPORT_SYNC_MAX_BYTES', 1024 * 1024))
+    app.config['IMPORT_CHUNK_SIZE'] = int(os.environ.get('IMPORT_CHUNK_SIZE', importer.DEFAULT_CHUNK_SIZE))
+    # 启动时自动建表和迁移；多 worker 部署可关闭并在发布时执行 flask migrate
+    app.config['AUTO_MIGRATE'] = os.environ.get('AUTO_MIGRATE', '1') == '1'
+    # 后台导出任务的线程数、产出文件保留小时数，以及心跳超过多少秒视为执行进程已退出
+    app.config['EXPORT_WORKERS'] = int(os.environ.get('EXPORT_WORKERS', 2))
+    app.config['EXPORT_RETENTION_HOURS'] = float(os.environ.get('EXPORT_RETENTION_HOURS', 24))
+    # 幂等键的有效小时数，超过后同一个 key 可以再次用于新的计价单
+    app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = float(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    app.config['EXPORT_STALE_SECONDS'] = int(os.environ.get('EXPORT_STALE_SECONDS', 600))
+    # 单个请求执行的 SQL 超过该条数时记录警告
+    app.config['QUERY_COUNT_WARN'] = int(os.environ.get('QUERY_COUNT_WARN', 30))
+    # 设置后，请求头 X-Profile 等于该值的请求会返回 cProfile 采样结果；未设置时不允许采样
+    app.config['PROFILE_TOKEN'] = os.environ.get('PROFILE_TOKEN')
+    # 超过该字节数的 JSON/文本响应按 Accept-Encoding 压缩
+    app.config['COMPRESS_MIN_BYTES'] = int(os.environ.get('COMPRESS_MIN_BYTES', 1024))
+    # GET 响应缓存的有效秒数（0 为关闭）、条目数和总字节数上限，有写入时立即失效
+    app.config['RESPONSE_CACHE_TTL'] = float(os.environ.get('RESPONSE_CACHE_TTL', 30))
+    app.config['RESPONSE_CACHE_MAX_ENTRIES'] = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    app.config['RESPONSE_CACHE_MAX_BYTES'] = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    # 报表默认读取按天汇总表，设为 0 时直接聚合明细
+    app.config['REPORT_ROLLUP'] = os.environ.get('REPORT_ROLLUP', '1') == '1'
+    if config:
+        app.config.update(config)
+    database.configure(app)
+    CORS(app)  # 允许跨域请求，方便前后端分离开发
+    db.init_app(app)
+    # 压缩在 instrumentation 之前注册，after_request 倒序执行，压缩最后进行
+    responses.init_app(app)
+    instrumentation.init_app(app, request_metrics)
+    assets.init_app(app)
+    app.register_blueprint(api)
+    app.cli.add_command(migrate_command)
+    app.cli.add_command(backfill_custom_items_command)
+    app.cli.add_command(import_catalog_command)
+    app.cli.add_command(rebuild_rollups_command)
+    app.cli.add_command(purge_exports_command)
+    app.cli.add_command(archive_quotations_command)
+    quotation_numbers.block_size = app.config['QUOTATION_NUMBER_BLOCK']
+    catalog_index.sync_interval = app.config['CATALOG_SYNC_SECONDS']
+    quotation_version.sync_interval = app.config['CATALOG_SYNC_SECONDS']
+    response_cache.ttl = app.config['RESPONSE_CACHE_TTL']
+    response_cache.max_entries = app.config['RESPONSE_CACHE_MAX_ENTRIES']
+    response_cache.max_bytes = app.config['RESPONSE_CACHE_MAX_BYTES']
+    if app.config['AUTO_MIGRATE']:
+        with app.app_context():
+            db.create_all()
+            database.migrate(db.engine)
+    return app
+
+@click.command('migrate')
+@with_appcontext
+def migrate_command():
+    """建表并把已有数据库升级到最新结构"""
+    print(current_app.config['DATABASE_DESCRIPTION'])
     db.create_all()
-    # 检查每个学校是否有"其他"项目，没有则添加
-    schools = School.query.all()
-    for school in schools:
-        exists = RepairItem.query.filter_by(school_id=school.id, name='其他').first()
-        if not exists:
-            db.session.add(RepairItem(name='其他', price=0.0, unit='项', school_id=school.id))
+    print(f"数据库版本: {database.migrate(db.engine)}")
+
+def backfill_custom_items():
+    """一条 INSERT ... SELECT 为所有缺少"其他"项目的学校补上该项目，返回补充的数量"""
+    table = RepairItem.__table__
+    last_id = db.session.query(func.max(RepairItem.id)).scalar() or 0
+    missing = select(literal(catalog.CUSTOM_PRICE_ITEM_NAME), literal(0.0), literal('项'), School.id) \
+        .where(~exists().where(RepairItem.school_id == School.id)
+               .where(RepairItem.name == catalog.CUSTOM_PRICE_ITEM_NAME))
+    result = db.session.execute(table.insert().from_select(
+        [table.c.name, table.c.price, table.c.unit, table.c.school_id], missing))
+    item_ids = [item_id for item_id, in db.session.query(RepairItem.id).filter(RepairItem.id > last_id)]
+    search.sync_items(item_ids)
+    changes.stamp_items(item_ids)
     db.session.commit()
+    catalog_index.invalidate()
+    return result.rowcount
+
+@click.command('backfill-custom-items')
+@with_appcontext
+def backfill_custom_items_command():
+    """为缺少"其他"项目的学校补充该项目"""
+    print(f"已补充 {backfill_custom_items()} 个学校的\"{catalog.CUSTOM_PRICE_ITEM_NAME}\"项目")
+
+def finish_catalog_import(report):
+    """导入结束后（无论成功与否）为已提交的块同步搜索索引、补上"其他"项目并让目录缓存失效"""
+    # 丢弃失败块未提交的写入
+    db.session.rollback()
+    if report.chunks:
+        search.sync_schools(report.school_ids)
+        db.session.commit()
+        backfill_custom_items()
+
+def run_catalog_import(path, fmt, chunk_size, progress=None, report=None):
+    """导入价目表文件，返回导入报告
+
+    中途失败时异常照常抛出，已提交的块仍然生效并在 finally 中完成收尾，
+    调用方传入 report 即可得知已提交的部分
+    """
+    report = report or importer.ImportReport()
+    try:
+        with open(path, 'rb') as f:
+            importer.import_catalog(importer.iter_records(f, fmt), chunk_size, progress, report)
+    finally:
+        finish_catalog_import(report)
+    return report
+
+@click.command('import-catalog')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(importer.FORMATS), help='默认按扩展名判断')
+@click.option('--chunk-size', type=int, default=importer.DEFAULT_CHUNK_SIZE, show_default=True)
+@with_appcontext
+def import_catalog_command(path, fmt, chunk_size):
+    """从 NDJSON/CSV/XLSX 文件批量导入维修项目"""
+    fmt = fmt or importer.detect_format(path)
+    if not fmt:
+        raise click.UsageError('无法从扩展名判断格式，请使用 --format 指定')
+
+    def progress(report):
+        print(f"第 {report.chunks} 块: 已处理 {report.processed} 行，新增 {report.inserted}，更新 {report.updated}")
+    report = run_catalog_import(path, fmt, chunk_size, progress)
+    print(json.dumps(report.to_dict(), ensure_ascii=False, indent=2))
+
+@click.command('rebuild-rollups')
+@with_appcontext
+def rebuild_rollups_command():
+    """从计价单明细重新生成按天汇总表（已归档的日期保持不变）"""
+    first_day = retention.rollup_start()
+    with db.engine.begin() as conn:
+        reports.rebuild_rollups(conn, first_day)
+    # 让各 worker 缓存的报表失效
+    quotation_version.bump()
+    print('汇总表已重建')
+
+@click.command('archive-quotations')
+@click.option('--months', type=click.IntRange(min=0), default=12, show_default=True,
+              help='主库保留最近几个月（另加当月）的计价单，更早的移入归档库')
+@click.option('--batch-size', type=click.IntRange(min=1), default=retention.ARCHIVE_BATCH_SIZE, show_default=True)
+@with_appcontext
+def archive_quotations_command(months, batch_size):
+    """把较早的计价单按年份移入归档库，并回收主库空间"""
+    before = retention.months_ago(months)
+    archived_ids = []
+    counts = collections.Counter()
+
+    def progress(year, quotation_ids, items):
+        archived_ids.extend(quotation_ids)
+        counts[year] += len(quotation_ids)
+        print(f"{year} 年: 已归档 {counts[year]} 张计价单（本批 {items} 条明细）")
+    try:
+        archived = retention.archive_quotations(before, current_app.config['ARCHIVE_FOLDER'], batch_size, progress)
+    except RuntimeError as e:
+        raise click.ClickException(str(e))
+    if not archived:
+        print(f"没有 {before:%Y-%m-%d} 之前的计价单需要归档")
+    else:
+        quotation_version.bump()
+        get_render_cache().invalidate_many(archived_ids)
+        for year, count in archived.items():
+            print(f"{year} 年共归档 {count} 张计价单 -> {retention.archive_path(current_app.config['ARCHIVE_FOLDER'], year)}")
+    size_before, size_after = retention.reclaim_space()
+    print(f"主库文件 {size_before / 1024 / 1024:.1f} MB -> {size_after / 1024 / 1024:.1f} MB")
+
+# 字体、图片缓存和出图进程池都在第一次出图时才创建
+_render_lock = threading.Lock()
+
+def get_fonts():
+    fonts = current_app.extensions.get('quotation_fonts')
+    if fonts is None:
+        with _render_lock:
+            fonts = current_app.extensions.get('quotation_fonts')
+            if fonts is None:
+                fonts = render.FontRegistry(current_app.config['CJK_FONT_PATH']).load()
+                current_app.extensions['quotation_fonts'] = fonts
+    return fonts
+
+def get_render_cache():
+    cache = current_app.extensions.get('render_cache')
+    if cache is None:
+        with _render_lock:
+            cache = current_app.extensions.get('render_cache')
+            if cache is None:
+                cache = render.RenderCache(os.path.join(current_app.config['UPLOADS_FOLDER'], 'quotation_images'),
+                                           max_bytes=current_app.config['RENDER_CACHE_MAX_BYTES'])
+                current_app.extensions['render_cache'] = cache
+    return cache
+
+def get_render_pool():
+    pool = current_app.extensions.get('render_pool')
+    if pool is None:
+        fonts = get_fonts()
+        with _render_lock:
+            pool = current_app.extensions.get('render_pool')
+            if pool is None:
+                pool = ProcessPoolExecutor(max_workers=current_app.config['RENDER_WORKERS'],
+                                           initializer=render.init_worker, initargs=(fonts.path,))
+                current_app.extensions['render_pool'] = pool
+    return pool
+
+def load_school_catalog(school_id):
+    rows = db.session.query(RepairItem.id, RepairItem.price, RepairItem.unit, RepairItem.name) \
+        .filter(RepairItem.school_id == school_id).order_by(RepairItem.id).all()
+    return {r.id: catalog.CatalogEntry(r.price, r.unit, r.name) for r in rows}
+
+def reserve_quotation_numbers(day, size):
+    """在独立的短事务中为 day 预留 size 个序号，返回预留区间的最后一个值"""
+    table = QuotationSequence.__table__
+    while True:
+        with db.engine.begin() as conn:
+            if conn.execute(table.update().where(table.c.day == day)
+                            .values(last_value=table.c.last_value + size)).rowcount:
+                return conn.execute(select(table.c.last_value).where(table.c.day == day)).scalar()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(day=day, last_value=size))
+            return size
+        except IntegrityError:
+            # 其他 worker 刚刚插入了当天的记录，重新走更新
+            continue
+
+quotation_numbers = sequences.BlockAllocator(reserve_quotation_numbers)
+
+def next_quotation_number(now=None):
+    day, value = quotation_numbers.allocate(now)
+    return f"Q{day}{value:06d}"
+
+def read_cache_version(name):
+    table = CacheVersion.__table__
+    with db.engine.connect() as conn:
+        return conn.execute(select(table.c.version).where(table.c.name == name)).scalar()
+
+def bump_cache_version(name, version):
+    """在独立的短事务中把共享版本号递增到不小于 version 的值，返回新值"""
+    table = CacheVersion.__table__
+    while True:
+        with db.engine.begin() as conn:
+            bumped = case((table.c.version >= version, table.c.version + 1), else_=version)
+            if conn.execute(table.update().where(table.c.name == name).values(version=bumped)).rowcount:
+                return conn.execute(select(table.c.version).where(table.c.name == name)).scalar()
+        try:
+            with db.engine.begin() as conn:
+                conn.execute(table.insert().values(name=name, version=version))
+            return version
+        except IntegrityError:
+            continue
+
+# 价目表索引，维修项目/学校的增删改接口负责让其失效；版本号写入数据库，多个 worker 进程间同步
+catalog_index = catalog.CatalogIndex(load_school_catalog,
+                                     read_version=functools.partial(read_cache_version, 'catalog'),
+                                     bump_version=functools.partial(bump_cache_version, 'catalog'))
+
+# 计价单数据的版本号，提交、删除计价单后递增，用于让缓存的列表和报表失效
+quotation_version = responses.SharedVersion(functools.partial(read_cache_version, 'quotations'),
+                                            functools.partial(bump_cache_version, 'quotations'))
+
+# GET 响应缓存，按视图所读数据的版本号失效
+response_cache = responses.ResponseCache()
 
 # --- 内存数据存储 (后续可以替换为数据库) ---
 schools = [
@@ -91,29 +350,70 @@ next_quotation_id = 1
 
 # --- API 路由 ---
 
-@app.route('/')
+# --- 监控指标 ---
+def catalog_hit_ratio():
+    stats = catalog_index.stats()
+    lookups = stats['hits'] + stats['misses']
+    return round(stats['hits'] / lookups, 4) if lookups else 0.0
+
+request_metrics = instrumentation.RequestMetrics()
+request_metrics.gauge('catalog_cache_hits_total', '价目表索引命中次数',
+                      lambda: catalog_index.stats()['hits'], kind='counter')
+request_metrics.gauge('catalog_cache_misses_total', '价目表索引未命中次数',
+                      lambda: catalog_index.stats()['misses'], kind='counter')
+request_metrics.gauge('catalog_cache_hit_ratio', '价目表索引命中率', catalog_hit_ratio)
+request_metrics.gauge('render_cache_hits_total', '图片缓存内存命中次数',
+                      lambda: get_render_cache().stats()['hits'], kind='counter')
+request_metrics.gauge('render_cache_disk_hits_total', '图片缓存磁盘命中次数',
+                      lambda: get_render_cache().stats()['disk_hits'], kind='counter')
+request_metrics.gauge('render_cache_misses_total', '图片缓存未命中次数',
+                      lambda: get_render_cache().stats()['misses'], kind='counter')
+request_metrics.gauge('render_cache_hit_ratio', '图片缓存命中率', lambda: get_render_cache().stats()['hit_ratio'])
+request_metrics.gauge('render_cache_bytes', '图片缓存占用的内存字节数', lambda: get_render_cache().stats()['bytes'])
+request_metrics.gauge('response_cache_hits_total', '响应缓存命中次数',
+                      lambda: response_cache.stats()['hits'], kind='counter')
+request_metrics.gauge('response_cache_misses_total', '响应缓存未命中次数',
+                      lambda: response_cache.stats()['misses'], kind='counter')
+request_metrics.gauge('response_cache_entries', '响应缓存条目数', lambda: response_cache.stats()['entries'])
+request_metrics.gauge('response_cache_bytes', '响应缓存占用的内存字节数', lambda: response_cache.stats()['bytes'])
+
+@api.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus 格式的指标，只包含当前进程"""
+    return current_app.response_class(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@api.route('/')
 def home():
     """首页，返回欢迎信息"""
     return jsonify({"message": "欢迎使用维修计价系统 API"})
 
 # --- 学校管理 ---
-@app.route('/api/schools', methods=['GET'])
+@api.route('/api/schools', methods=['GET'])
+@response_cache.cached(catalog_index.current_version)
 def get_schools():
     schools = School.query.all()
     return jsonify([{'id': s.id, 'name': s.name} for s in schools])
 
-@app.route('/api/schools', methods=['POST'])
+@api.route('/api/schools', methods=['POST'])
 def add_school():
     data = request.json
     name = data.get('name')
     if not name:
         return jsonify({'error': '缺少学校名称'}), 400
     school = School(name=name)
+    # 每个学校都带一个现场定价的"其他"项目
+    school.items.append(RepairItem(name=catalog.CUSTOM_PRICE_ITEM_NAME, price=0.0, unit='项'))
     db.session.add(school)
+    db.session.flush()
+    search.sync_items(item.id for item in school.items)
+    revision = changes.next_revision()
+    changes.stamp_schools([school.id], revision)
+    changes.stamp_items([item.id for item in school.items], revision)
     db.session.commit()
+    catalog_index.invalidate(school.id)
     return jsonify({'id': school.id, 'name': school.name}), 201
 
-@app.route('/api/schools/<int:school_id>', methods=['PUT'])
+@api.route('/api/schools/<int:school_id>', methods=['PUT'])
 def update_school(school_id):
     data = request.json
     name = data.get('name')
@@ -121,41 +421,109 @@ def update_school(school_id):
     if not school:
         return jsonify({'error': '未找到学校'}), 404
     school.name = name
+    changes.stamp_schools([school_id])
     db.session.commit()
+    catalog_index.invalidate(school_id)
     return jsonify({'id': school.id, 'name': school.name})
 
-@app.route('/api/schools/<int:school_id>', methods=['DELETE'])
+@api.route('/api/schools/<int:school_id>', methods=['DELETE'])
 def delete_school(school_id):
-    school = School.query.get(school_id)
-    if not school:
+    """删除学校及其维修项目和计价单（归档库中的计价单保留）"""
+    if not db.session.query(exists().where(School.id == school_id)).scalar():
         return jsonify({'error': '未找到学校'}), 404
-    db.session.delete(school)
+    revision = changes.next_revision()
+    changes.tombstone_items(RepairItem.school_id == school_id, revision=revision)
+    changes.tombstone_schools(School.id == school_id, revision=revision)
+    quotation_ids = retention.delete_quotations(Quotation.school_id == school_id)
+    # 连同已归档日期的汇总行一起删除，报表中不再出现该学校
+    reports.rebuild_rollups(db.session.connection(), school_id=school_id)
+    RepairItem.query.filter(RepairItem.school_id == school_id).delete(synchronize_session=False)
+    School.query.filter(School.id == school_id).delete(synchronize_session=False)
+    search.sync_schools([school_id])
     db.session.commit()
-    return jsonify({'message': '已删除'})
+    catalog_index.invalidate(school_id)
+    if quotation_ids:
+        quotation_version.bump()
+        get_render_cache().invalidate_many(quotation_ids)
+    return jsonify({'message': '已删除', 'deleted_quotations': len(quotation_ids)})
 
 # --- 维修项目管理 ---
-@app.route('/api/schools/<int:school_id>/items', methods=['GET'])
+def catalog_etag(*parts):
+    """由价目表版本号和查询参数生成强 ETag，判断 304 时无需访问数据库"""
+    version = catalog_index.current_version()
+    raw = json.dumps([version, *parts], ensure_ascii=False)
+    return f"{version}-{hashlib.md5(raw.encode('utf-8')).hexdigest()[:8]}"
+
+def catalog_response(etag, build):
+    """If-None-Match 命中时直接返回 304，否则调用 build() 生成 JSON"""
+    # 压缩后的响应带弱 ETag，按弱比较判断
+    if request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(build())
+    response.set_etag(etag)
+    # 允许浏览器和反向代理缓存，但每次使用前都要用 ETag 重新验证
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@api.route('/api/schools/<int:school_id>/items', methods=['GET'])
+@response_cache.cached(catalog_index.current_version)
 def get_repair_items_by_school(school_id):
-    items = RepairItem.query.filter_by(school_id=school_id).all()
-    return jsonify([{'id': i.id, 'name': i.name, 'price': i.price, 'unit': i.unit} for i in items])
+    def build():
+        entries = catalog_index.school(school_id)
+        return [{'id': item_id, 'name': e.name, 'price': e.price, 'unit': e.unit} for item_id, e in entries.items()]
+    return catalog_response(catalog_etag('school_items', school_id), build)
+
+ITEM_FIELDS = ('id', 'name', 'price', 'unit', 'school_id', 'school_name')
 
-@app.route('/api/items', methods=['GET'])
+@api.route('/api/items', methods=['GET'])
+@response_cache.cached(catalog_index.current_version)
 def get_all_repair_items():
-    items = RepairItem.query.all()
-    result = []
-    for item in items:
-        school = School.query.get(item.school_id)
-        result.append({
-            'id': item.id,
-            'name': item.name,
-            'price': item.price,
-            'unit': item.unit,
-            'school_id': item.school_id,
-            'school_name': school.name if school else '未知学校'
-        })
-    return jsonify(result)
+    """所有维修项目（附学校名称），支持 school_id 和名称关键字 q 筛选
+
+    format=columns 时按列返回 {'fields': [...], 'columns': [[...], ...]}
+    """
+    school_id = request.args.get('school_id', type=int)
+    keyword = request.args.get('q', '').strip()
+    try:
+        as_columns = responses.wants_columns()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    def build():
+        query = db.session.query(RepairItem.id, RepairItem.name, RepairItem.price, RepairItem.unit,
+                                 RepairItem.school_id, School.name.label('school_name')) \
+            .outerjoin(School, School.id == RepairItem.school_id)
+        if school_id:
+            query = query.filter(RepairItem.school_id == school_id)
+        if keyword:
+            query = query.filter(RepairItem.name.contains(keyword, autoescape=True))
+        items = [{
+            'id': row.id,
+            'name': row.name,
+            'price': row.price,
+            'unit': row.unit,
+            'school_id': row.school_id,
+            'school_name': row.school_name if row.school_name is not None else '未知学校'
+        } for row in query.order_by(RepairItem.id)]
+        return responses.columns(items, ITEM_FIELDS) if as_columns else items
+    return catalog_response(catalog_etag('items', school_id, keyword, as_columns), build)
+
+@api.route('/api/items/search', methods=['GET'])
+def search_repair_items():
+    """按名称搜索维修项目，支持中文片段、英文/型号和拼音首字母，按相关度返回前 limit 个"""
+    keyword = request.args.get('q', '').strip()
+    school_id = request.args.get('school_id', type=int)
+    limit = request.args.get('limit', search.DEFAULT_LIMIT, type=int)
+    if not keyword:
+        return jsonify({'error': '缺少搜索关键字 q'}), 400
+    if limit is None or limit <= 0:
+        return jsonify({'error': 'limit 必须是正整数'}), 400
+    rows = search.search(keyword, school_id, min(limit, search.MAX_LIMIT))
+    return jsonify([{'id': row.id, 'name': row.name, 'price': row.price, 'unit': row.unit, 'school_id': row.school_id}
+                    for row in rows])
 
-@app.route('/api/items', methods=['POST'])
+@api.route('/api/items', methods=['POST'])
 def add_repair_item():
     data = request.json
     school_id = data.get('school_id')
@@ -166,10 +534,31 @@ def add_repair_item():
         return jsonify({'error': '缺少必要参数'}), 400
     item = RepairItem(name=name, price=float(price), unit=unit, school_id=school_id)
     db.session.add(item)
+    db.session.flush()
+    search.sync_items([item.id])
+    changes.stamp_items([item.id])
     db.session.commit()
+    catalog_index.invalidate(item.school_id)
     return jsonify({'id': item.id, 'name': item.name, 'price': item.price, 'unit': item.unit, 'school_id': item.school_id}), 201
 
-@app.route('/api/items/<int:item_id>', methods=['PUT'])
+@api.route('/api/items/<int:item_id>', methods=['GET'])
+def get_repair_item(item_id):
+    """单个维修项目（附学校名称），字段与 /api/items 列表相同"""
+    row = db.session.query(RepairItem.id, RepairItem.name, RepairItem.price, RepairItem.unit,
+                           RepairItem.school_id, School.name.label('school_name')) \
+        .outerjoin(School, School.id == RepairItem.school_id).filter(RepairItem.id == item_id).first()
+    if not row:
+        return jsonify({'error': '未找到项目'}), 404
+    return jsonify({
+        'id': row.id,
+        'name': row.name,
+        'price': row.price,
+        'unit': row.unit,
+        'school_id': row.school_id,
+        'school_name': row.school_name if row.school_name is not None else '未知学校'
+    })
+
+@api.route('/api/items/<int:item_id>', methods=['PUT'])
 def update_repair_item(item_id):
     data = request.json
     item = RepairItem.query.get(item_id)
@@ -178,54 +567,217 @@ def update_repair_item(item_id):
     item.name = data.get('name', item.name)
     item.price = float(data.get('price', item.price))
     item.unit = data.get('unit', item.unit)
+    db.session.flush()
+    search.sync_items([item.id])
+    changes.stamp_items([item.id])
     db.session.commit()
+    catalog_index.invalidate(item.school_id)
     return jsonify({'id': item.id, 'name': item.name, 'price': item.price, 'unit': item.unit, 'school_id': item.school_id})
 
-@app.route('/api/items/<int:item_id>', methods=['DELETE'])
+@api.route('/api/items/<int:item_id>', methods=['DELETE'])
 def delete_repair_item(item_id):
     item = RepairItem.query.get(item_id)
     if not item:
         return jsonify({'error': '未找到项目'}), 404
+    changes.tombstone_items(RepairItem.id == item_id)
     db.session.delete(item)
+    db.session.flush()
+    search.sync_items([item_id])
     db.session.commit()
+    catalog_index.invalidate(item.school_id)
     return jsonify({'message': '项目已删除', 'item': {'id': item.id, 'name': item.name}})
 
 # --- 价格计算 ---
-@app.route('/api/calculate_price', methods=['POST'])
+@api.route('/api/calculate_price', methods=['POST'])
 def calculate_price():
-    """计算维修总价"""
-    data = request.json
+    """计算维修总价，价格取自内存价目表索引"""
+    data = request.json or {}
     selected_items = data.get('items', []) # 格式: [{'item_id': 101, 'quantity': 2, 'school_id': 1}, ...]
-    total_price = 0
+    try:
+        total_price = catalog_index.price_cart(selected_items)
+    except (catalog.InvalidPrice, catalog.InvalidQuantity) as e:
+        return jsonify({"error": str(e)}), 400
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({"error": '维修项目数据格式不正确'}), 400
+    return jsonify({"total_price": round(total_price, 2), "catalog_version": catalog_index.current_version()})
 
-    for selected in selected_items:
-        school_id = selected.get('school_id')
-        item_id = selected.get('item_id')
-        quantity = selected.get('quantity', 0)
+@api.route('/api/catalog/version', methods=['GET'])
+def get_catalog_version():
+    """价目表版本号，客户端据此判断本地缓存的项目列表是否过期"""
+    return jsonify({"version": catalog_index.current_version()})
 
-        if not school_id or not item_id or quantity <= 0:
-            continue
+@api.route('/api/sync', methods=['GET'])
+@response_cache.cached(catalog_index.current_version)
+def sync_catalog():
+    """价目表增量同步：返回修订号大于 since 的学校和维修项目，以及此后删除的 id
+
+    客户端保存返回的 revision，下次以 since 传回；since 省略或为 0 时返回全量。
+    full 为 true 时应先清空本地缓存；school_id 只限制返回的维修项目
+    """
+    try:
+        since = int(request.args.get('since', 0))
+    except ValueError:
+        return jsonify({'error': 'since 必须是整数'}), 400
+    return jsonify(changes.changes_since(since, request.args.get('school_id', type=int)))
 
-        items_at_school = RepairItem.query.filter_by(school_id=school_id).all()
-        item_info = next((item for item in items_at_school if item.id == item_id), None)
+# --- 计价单管理 ---
+# 列表接口可投影的字段，id 始终返回（分页游标依赖它）
+QUOTATION_FIELDS = ('id', 'quotation_number', 'school_id', 'school_name', 'repair_person',
+                    'repair_location', 'repair_time', 'items', 'total_price', 'created_at')
+QUOTATION_PAGE_DEFAULT = 100
+QUOTATION_PAGE_MAX = 500
 
-        if item_info:
-            total_price += item_info.price * quantity
+def quotation_item_to_dict(item):
+    return {
+        'item_id': item.item_id,
+        'name': item.name,
+        'price': item.price,
+        'unit': item.unit,
+        'quantity': item.quantity,
+        'subtotal': item.subtotal
+    }
 
-    return jsonify({"total_price": round(total_price, 2)})
+def quotation_to_dict(q, fields=QUOTATION_FIELDS):
+    """按 fields 序列化计价单，未请求 items 时不会触碰明细关系"""
+    result = {}
+    for field in fields:
+        if field == 'items':
+            result['items'] = [quotation_item_to_dict(item) for item in q.items]
+        elif field in ('repair_time', 'created_at'):
+            result[field] = getattr(q, field).isoformat()
+        else:
+            result[field] = getattr(q, field)
+    return result
 
-# --- 计价单管理 ---
-@app.route('/api/quotations', methods=['POST'])
+def parse_local_time(value):
+    """解析 ISO 日期或时间，返回不带时区的本地时间"""
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone().replace(tzinfo=None)
+    return parsed
+
+def parse_date_range(start, end):
+    """把 start/end 参数解析为 [start, end_before) 的半开区间，参数为空时对应端为 None
+
+    可以是日期（YYYY-MM-DD，end 包含当天）或 ISO 时间；格式不正确时抛出 ValueError。
+    带时区的时间换算为服务器本地时间，与 created_at 的存储方式一致
+    """
+    start_at = parse_local_time(start) if start else None
+    end_before = None
+    if end:
+        end_before = parse_local_time(end)
+        if len(end) == 10:
+            end_before += datetime.timedelta(days=1)
+        else:
+            # 精确到时间的 end 包含该时刻本身
+            end_before += datetime.timedelta(microseconds=1)
+    if start_at and end_before and start_at >= end_before:
+        raise ValueError('start 不能晚于 end')
+    return start_at, end_before
+
+def quotation_criteria(school_id, start, end):
+    """学校和创建时间的筛选条件，时间条件为一次索引范围扫描；时间格式不正确时抛出 ValueError"""
+    start_at, end_before = parse_date_range(start, end)
+    criteria = []
+    if school_id:
+        criteria.append(Quotation.school_id == school_id)
+    if start_at:
+        criteria.append(Quotation.created_at >= start_at)
+    if end_before:
+        criteria.append(Quotation.created_at < end_before)
+    return criteria
+
+def filter_quotations(query, school_id, start, end):
+    """把学校和创建时间筛选下推到 SQL；时间格式不正确时抛出 ValueError"""
+    return query.filter(*quotation_criteria(school_id, start, end))
+
+DATE_RANGE_ERROR = 'start 和 end 须为 YYYY-MM-DD 日期或 ISO 格式时间，且 start 不晚于 end'
+
+def price_quotation_lines(school_id, selected_items):
+    """按价目表重新计算每行价格，返回 (明细行, 总价)；数据无效时抛出 ValueError"""
+    lines = []
+    for selected in selected_items:
+        try:
+            quantity = catalog.parse_quantity(selected['quantity'])
+            quoted = catalog_index.quote_line(school_id, selected['item_id'], selected.get('price'))
+        except (catalog.InvalidPrice, catalog.InvalidQuantity):
+            raise
+        except (KeyError, TypeError, ValueError):
+            raise ValueError('维修项目数据格式不正确')
+        if quantity <= 0:
+            raise ValueError('维修项目数量必须大于 0')
+        if quoted is None:
+            raise ValueError(f"该学校不存在维修项目 {selected['item_id']}")
+        entry, price = quoted
+        if price < 0:
+            raise ValueError('维修项目单价不能为负数')
+        lines.append({
+            'item_id': selected['item_id'],
+            'name': entry.name,
+            'price': price,
+            'unit': entry.unit,
+            'quantity': quantity,
+            'subtotal': round(price * quantity, 2)
+        })
+    return lines, round(sum(line['subtotal'] for line in lines), 2)
+
+def quotation_request_hash(data):
+    """规范化后的计价单请求体摘要：只取影响计价单内容的字段，与键的顺序和空白无关"""
+    items = data.get('items') or []
+    normalized = {
+        'school_id': data.get('school_id'),
+        'repair_person': data.get('repair_person', '未指定'),
+        'repair_location': data.get('repair_location', '未指定'),
+        'repair_time': data.get('repair_time'),
+        'items': [{key: item.get(key) for key in ('item_id', 'quantity', 'price')} if isinstance(item, dict) else item
+                  for item in items] if isinstance(items, list) else items,
+    }
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+                          .encode('utf-8')).hexdigest()
+
+def idempotency_key_cutoff(now=None):
+    """早于该时间记录的幂等键已过期"""
+    return (now or datetime.datetime.now()) - datetime.timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+
+def idempotent_replay(key, request_hash):
+    """key 已使用过时返回首次创建的计价单；请求体与首次不同时返回 422，key 未使用或已过期时返回 None"""
+    record = IdempotencyKey.query.get(key)
+    if not record or record.created_at < idempotency_key_cutoff():
+        return None
+    # 旧版本记录的键没有摘要，仍按键重放
+    if record.request_hash is not None and record.request_hash != request_hash:
+        return jsonify({'error': 'Idempotency-Key 已用于内容不同的另一张计价单，请使用新的 key'}), 422
+    quotation = Quotation.query.options(selectinload(Quotation.items)).get(record.quotation_id)
+    if not quotation:
+        return None
+    response = jsonify(quotation_to_dict(quotation))
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+@api.route('/api/quotations', methods=['POST'])
 def submit_quotation():
+    """提交计价单
+
+    单价和总价由服务端按价目表计算，客户端提交的 price/subtotal/total_price 仅"其他"项目的单价生效。
+    计价单和全部明细在同一个事务中写入；带 Idempotency-Key 请求头重试时返回首次创建的计价单，
+    同一个 key 用于内容不同的请求时返回 422。
+    """
     data = request.json
     school_id = data.get('school_id')
     selected_items_details = data.get('items', [])
-    total_price = data.get('total_price')
     repair_person = data.get('repair_person', '未指定')
     repair_location = data.get('repair_location', '未指定')
     repair_time_str = data.get('repair_time')
-    if not all([school_id, selected_items_details, total_price is not None, repair_time_str]):
+    idempotency_key = request.headers.get('Idempotency-Key')
+    if not all([school_id, selected_items_details, repair_time_str]):
         return jsonify({'error': '缺少必要参数，请确保所有字段都已填写'}), 400
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= 64:
+        return jsonify({'error': 'Idempotency-Key 长度须为 1-64 个字符'}), 400
+    request_hash = quotation_request_hash(data) if idempotency_key else None
+    if idempotency_key:
+        replay = idempotent_replay(idempotency_key, request_hash)
+        if replay:
+            return replay
     try:
         repair_time = datetime.datetime.fromisoformat(repair_time_str)
     except ValueError:
@@ -233,300 +785,683 @@ def submit_quotation():
     school = School.query.get(school_id)
     if not school:
         return jsonify({'error': '无效的学校ID'}), 400
-    quotation_number = f"Q{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}{int(datetime.datetime.now().timestamp())%1000:03d}"
+    try:
+        lines, total_price = price_quotation_lines(school.id, selected_items_details)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    now = datetime.datetime.now()
+    quotation_number = next_quotation_number(now)
     quotation = Quotation(
         quotation_number=quotation_number,
-        school_id=school_id,
+        school_id=school.id,
         school_name=school.name,
         repair_person=repair_person,
         repair_location=repair_location,
-        repair_time=repair_time.isoformat(),
+        repair_time=repair_time,
         total_price=total_price,
-        created_at=datetime.datetime.now().isoformat()
+        created_at=now
     )
-    db.session.add(quotation)
-    db.session.commit()
-    for item in selected_items_details:
-        qitem = QuotationItem(
-            quotation_id=quotation.id,
-            item_id=item['item_id'],
-            name=item['name'],
-            price=item['price'],
-            unit=item['unit'],
-            quantity=item['quantity'],
-            subtotal=item['subtotal']
-        )
-        db.session.add(qitem)
-    db.session.commit()
-    return jsonify({
-        'id': quotation.id,
-        'quotation_number': quotation.quotation_number,
-        'school_id': quotation.school_id,
-        'school_name': quotation.school_name,
-        'repair_person': quotation.repair_person,
-        'repair_location': quotation.repair_location,
-        'repair_time': quotation.repair_time,
-        'items': [
-            {
-                'item_id': item.item_id,
-                'name': item.name,
-                'price': item.price,
-                'unit': item.unit,
-                'quantity': item.quantity,
-                'subtotal': item.subtotal
-            } for item in quotation.items
-        ],
-        'total_price': quotation.total_price,
-        'created_at': quotation.created_at
-    }), 201
+    try:
+        db.session.add(quotation)
+        db.session.flush()  # 获取id，尚未提交
+        for line in lines:
+            line['quotation_id'] = quotation.id
+        # 明细一次 executemany 批量插入，与计价单同一事务提交
+        db.session.execute(QuotationItem.__table__.insert(), lines)
+        reports.record_quotation(quotation, lines)
+        if idempotency_key:
+            # 与导出文件一样，记录新键时顺带清理过期的键（包括可能同名的旧键）
+            retention.purge_idempotency_keys(idempotency_key_cutoff(now))
+            db.session.add(IdempotencyKey(key=idempotency_key, quotation_id=quotation.id, request_hash=request_hash,
+                                          created_at=now))
+        db.session.commit()
+    except IntegrityError:
+        # 相同 Idempotency-Key 的并发请求已先行提交
+        db.session.rollback()
+        replay = idempotent_replay(idempotency_key, request_hash) if idempotency_key else None
+        if replay:
+            return replay
+        raise
+    quotation_version.bump()
+    return jsonify(quotation_to_dict(quotation)), 201
 
-@app.route('/api/quotations', methods=['GET'])
+@api.route('/api/quotations', methods=['GET'])
+@response_cache.cached(quotation_version.current)
 def get_quotations():
+    """计价单列表，支持按 id 倒序的游标分页（limit/after）和字段投影（fields）
+
+    不带 limit/after 时保持旧行为，返回完整数组；
+    带分页参数时返回 {'quotations': [...], 'next_after': 下一页游标或 null}。
+    format=columns 时计价单按列返回 {'fields': [...], 'columns': [[...], ...]}，
+    即 'quotations'（不分页时为整个响应）由行数组换成该对象
+    """
     school_id = request.args.get('school_id', type=int)
     start = request.args.get('start')
     end = request.args.get('end')
-    query = Quotation.query
-    if school_id:
-        query = query.filter(Quotation.school_id == school_id)
-    if start:
-        try:
-            start_dt = datetime.datetime.fromisoformat(start)
-            query = query.filter(Quotation.created_at >= start_dt.isoformat())
-        except Exception:
-            pass
-    if end:
+    limit = request.args.get('limit')
+    after = request.args.get('after')
+    fields_param = request.args.get('fields')
+    try:
+        as_columns = responses.wants_columns()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    fields = QUOTATION_FIELDS
+    if fields_param:
+        requested = [f.strip() for f in fields_param.split(',') if f.strip()]
+        unknown = [f for f in requested if f not in QUOTATION_FIELDS]
+        if unknown:
+            return jsonify({'error': f"未知字段: {', '.join(unknown)}"}), 400
+        fields = ('id',) + tuple(f for f in QUOTATION_FIELDS if f in requested and f != 'id')
+
+    paginated = limit is not None or after is not None
+    if paginated:
         try:
-            end_dt = datetime.datetime.fromisoformat(end)
-            query = query.filter(Quotation.created_at <= end_dt.isoformat())
-        except Exception:
-            pass
-    quotations = query.order_by(Quotation.id.desc()).all()
-    result = []
-    for q in quotations:
-        result.append({
-            'id': q.id,
-            'quotation_number': q.quotation_number,
-            'school_id': q.school_id,
-            'school_name': q.school_name,
-            'repair_person': q.repair_person,
-            'repair_location': q.repair_location,
-            'repair_time': q.repair_time,
-            'items': [
-                {
-                    'item_id': item.item_id,
-                    'name': item.name,
-                    'price': item.price,
-                    'unit': item.unit,
-                    'quantity': item.quantity,
-                    'subtotal': item.subtotal
-                } for item in q.items
-            ],
-            'total_price': q.total_price,
-            'created_at': q.created_at
-        })
-    return jsonify(result)
+            limit = int(limit) if limit is not None else QUOTATION_PAGE_DEFAULT
+            after = int(after) if after is not None else None
+        except ValueError:
+            return jsonify({'error': 'limit 和 after 必须是整数'}), 400
+        if limit <= 0:
+            return jsonify({'error': 'limit 必须大于 0'}), 400
+        limit = min(limit, QUOTATION_PAGE_MAX)
+
+    try:
+        query = filter_quotations(Quotation.query, school_id, start, end)
+    except ValueError:
+        return jsonify({'error': DATE_RANGE_ERROR}), 400
+    if 'items' in fields:
+        # 一次 IN 查询批量加载本页所有明细，避免逐单懒加载的 N+1
+        query = query.options(selectinload(Quotation.items))
+    query = query.order_by(Quotation.id.desc())
+
+    def rows(quotations):
+        dicts = [quotation_to_dict(q, fields) for q in quotations]
+        return responses.columns(dicts, fields) if as_columns else dicts
+
+    if not paginated:
+        return jsonify(rows(query.all()))
+
+    if after is not None:
+        query = query.filter(Quotation.id < after)
+    # 多取一条用于判断是否还有下一页
+    page = query.limit(limit + 1).all()
+    has_more = len(page) > limit
+    page = page[:limit]
+    return jsonify({
+        'quotations': rows(page),
+        'next_after': page[-1].id if has_more else None
+    })
+
+def parse_report_date(value, default):
+    if not value:
+        return default
+    return datetime.date.fromisoformat(value)
+
+@api.route('/api/reports/summary', methods=['GET'])
+@response_cache.cached(quotation_version.current)
+def get_report_summary():
+    """统计报表：总量、按学校/周期/维修人员汇总和金额最高的维修项目
+
+    start/end 为 YYYY-MM-DD，均包含在内，默认最近 30 天；period 为 day/week/month；
+    source=raw 时直接聚合明细，默认读取按天汇总表；已归档的计价单只计入汇总表
+    """
+    today = datetime.date.today()
+    try:
+        end = parse_report_date(request.args.get('end'), today)
+        start = parse_report_date(request.args.get('start'), end - datetime.timedelta(days=29))
+    except ValueError:
+        return jsonify({'error': 'start 和 end 须为 YYYY-MM-DD 格式的日期'}), 400
+    if start > end:
+        return jsonify({'error': 'start 不能晚于 end'}), 400
+    period = request.args.get('period', 'day')
+    if period not in reports.PERIODS:
+        return jsonify({'error': f"period 仅支持 {', '.join(reports.PERIODS)}"}), 400
+    top = request.args.get('top', reports.DEFAULT_TOP_ITEMS, type=int)
+    if top is None or top <= 0:
+        return jsonify({'error': 'top 必须是正整数'}), 400
+    source = request.args.get('source', 'rollup' if current_app.config['REPORT_ROLLUP'] else 'raw')
+    if source not in ('rollup', 'raw'):
+        return jsonify({'error': 'source 仅支持 rollup, raw'}), 400
+    return jsonify(reports.summary(start, end, request.args.get('school_id', type=int), period, min(top, 100),
+                                   use_rollup=source == 'rollup'))
+
+def quotation_render_payload(quotation):
+    """绘图所需的计价单数据（普通 dict，可跨进程传递）"""
+    return {
+        'quotation_number': quotation.quotation_number,
+        'created_at': quotation.created_at.isoformat(),
+        'school_name': quotation.school_name,
+        'total_price': quotation.total_price,
+        'items': [
+            {'name': item.name, 'price': item.price, 'quantity': item.quantity,
+             'unit': item.unit, 'subtotal': item.subtotal}
+            for item in quotation.items
+        ]
+    }
+
+@api.route('/api/quotations/by_number/<quotation_number>', methods=['GET'])
+def get_quotation_by_number(quotation_number):
+    quotation = Quotation.query.options(selectinload(Quotation.items)) \
+        .filter_by(quotation_number=quotation_number).first()
+    if not quotation:
+        return jsonify({"error": "未找到计价单"}), 404
+    return jsonify(quotation_to_dict(quotation))
+
+def cached_png(quotation_id, payload, digest):
+    """返回 (PNG, 缓存状态)，未命中时绘制并写入缓存"""
+    render_cache = get_render_cache()
+    data = render_cache.get(quotation_id, digest)
+    if data is not None:
+        return data, 'HIT'
+    data = render.render_quotation_png(payload, get_fonts())
+    render_cache.put(quotation_id, digest, data)
+    return data, 'MISS'
 
-@app.route('/api/quotations/<int:quotation_id>/image', methods=['GET'])
+@api.route('/api/quotations/<int:quotation_id>/image', methods=['GET'])
 def generate_quotation_image(quotation_id):
-    """生成计价单图片"""
-    quotation = Quotation.query.get(quotation_id)
+    """生成计价单图片
+
+    同一内容只绘制一次，结果按内容哈希缓存在内存和 uploads/ 下，
+    并以该哈希作为 ETag，客户端带 If-None-Match 时直接返回 304。
+    """
+    quotation = Quotation.query.options(selectinload(Quotation.items)).get(quotation_id)
     if not quotation:
         return jsonify({"error": "未找到计价单"}), 404
 
     try:
-        img_width = 800
-        img_height = 600 + len(quotation.items) * 30
-        img = Image.new('RGB', (img_width, img_height), color = 'white')
-        d = ImageDraw.Draw(img)
-        try:
-            font_path = "C:/Windows/Fonts/simsun.ttc"
-            if not os.path.exists(font_path):
-                 font_path = "arial.ttf"
-            title_font = ImageFont.truetype(font_path, 30)
-            text_font = ImageFont.truetype(font_path, 18)
-            small_font = ImageFont.truetype(font_path, 14)
-        except IOError:
-            title_font = ImageFont.load_default()
-            text_font = ImageFont.load_default()
-            small_font = ImageFont.load_default()
-        y_offset = 20
-        d.text((img_width/2, y_offset), "维修计价单", font=title_font, fill=(0,0,0), anchor="mt")
-        y_offset += 50
-        d.text((30, y_offset), f"单号: {quotation.quotation_number}", font=text_font, fill=(0,0,0))
-        d.text((img_width - 250, y_offset), f"日期: {datetime.datetime.fromisoformat(quotation.created_at).strftime('%Y-%m-%d')}", font=text_font, fill=(0,0,0))
-        y_offset += 30
-        d.text((30, y_offset), f"学校: {quotation.school_name}", font=text_font, fill=(0,0,0))
-        # 不再显示客户
-        y_offset += 40
-        d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
-        y_offset += 10
-        d.text((40, y_offset), "维修项目", font=text_font, fill=(0,0,0))
-        d.text((img_width/2 - 100, y_offset), "单价", font=text_font, fill=(0,0,0))
-        d.text((img_width/2 + 0, y_offset), "数量", font=text_font, fill=(0,0,0))
-        d.text((img_width/2 + 100, y_offset), "单位", font=text_font, fill=(0,0,0))
-        d.text((img_width - 150, y_offset), "小计", font=text_font, fill=(0,0,0))
-        y_offset += 20
-        d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
-        y_offset += 10
-        for item in quotation.items:
-            d.text((40, y_offset), str(item.name), font=text_font, fill=(0,0,0))
-            d.text((img_width/2 - 100, y_offset), f"{item.price:.2f}", font=text_font, fill=(0,0,0))
-            d.text((img_width/2 + 0, y_offset), str(item.quantity), font=text_font, fill=(0,0,0))
-            d.text((img_width/2 + 100, y_offset), str(item.unit), font=text_font, fill=(0,0,0))
-            d.text((img_width - 150, y_offset), f"{item.subtotal:.2f}", font=text_font, fill=(0,0,0))
-            y_offset += 30
-        d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
-        y_offset += 20
-        d.text((img_width - 250, y_offset), f"总计金额: {quotation.total_price:.2f} 元", font=title_font, fill=(0,0,0))
-        y_offset += 50
-        d.text((30, y_offset), "维修单位: 重庆星豫科技", font=small_font, fill=(100,100,100))
-        d.text((img_width - 150, y_offset), "签字: _________", font=small_font, fill=(100,100,100))
-        img_io = io.BytesIO()
-        img.save(img_io, 'PNG')
-        img_io.seek(0)
-        uploads_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-        return send_file(img_io, mimetype='image/png', as_attachment=True, download_name=f"{quotation.quotation_number}.png")
+        payload = quotation_render_payload(quotation)
+        digest = render.quotation_digest(payload, get_fonts())
+        if request.if_none_match.contains(digest):
+            response = current_app.response_class(status=304)
+            response.set_etag(digest)
+            return response
+        data, cache_status = cached_png(quotation_id, payload, digest)
+        response = send_file(io.BytesIO(data), mimetype='image/png', as_attachment=True,
+                             download_name=f"{quotation.quotation_number}.png", etag=digest)
+        response.headers['X-Render-Cache'] = cache_status
+        return response
     except Exception as e:
-        print(f"Error generating image: {e}")
+        current_app.logger.exception("generating image")
         return jsonify({"error": f"生成图片失败: {str(e)}"}), 500
 
-@app.route('/api/quotations/<int:quotation_id>/excel', methods=['GET'])
+BATCH_RENDER_CHUNK = 200
+
+def iter_rendered_quotations(query):
+    """按 id 分块加载计价单，缓存未命中的交给进程池并行绘制，产出 (计价单, PNG)"""
+    pool = get_render_pool()
+    fonts = get_fonts()
+    render_cache = get_render_cache()
+    last_id = 0
+    while True:
+        chunk = query.options(selectinload(Quotation.items)) \
+            .filter(Quotation.id > last_id) \
+            .order_by(Quotation.id) \
+            .limit(BATCH_RENDER_CHUNK).all()
+        if not chunk:
+            return
+        last_id = chunk[-1].id
+        payloads = [quotation_render_payload(q) for q in chunk]
+        digests = [render.quotation_digest(p, fonts) for p in payloads]
+        pngs = [render_cache.get(q.id, d) for q, d in zip(chunk, digests)]
+        missing = [i for i, png in enumerate(pngs) if png is None]
+        chunksize = max(1, len(missing) // (current_app.config['RENDER_WORKERS'] * 4))
+        rendered = pool.map(render.render_in_worker, [payloads[i] for i in missing], chunksize=chunksize)
+        for i, png in zip(missing, rendered):
+            pngs[i] = png
+            render_cache.put(chunk[i].id, digests[i], png)
+        yield from zip(chunk, pngs)
+
+# --- 导出 ---
+# 每种导出分为 plan 和 write 两步：plan 校验参数并统计数量（参数错误抛出 ValueError，
+# 没有数据抛出 LookupError），返回 (规范化后的参数, 总数)；write 把文件写入 fileobj，
+# 返回 (mimetype, 下载文件名)。同步接口和后台导出任务共用这些函数。
+
+def filter_params(source):
+    return {'school_id': source.get('school_id'), 'start': source.get('start'), 'end': source.get('end')}
+
+def filtered_criteria(params):
+    try:
+        school_id = int(params['school_id']) if params.get('school_id') else None
+        return quotation_criteria(school_id, params.get('start'), params.get('end'))
+    except ValueError:
+        raise ValueError(DATE_RANGE_ERROR)
+
+def filtered_quotations(query, params):
+    return query.filter(*filtered_criteria(params))
+
+def counted(iterable, progress):
+    """逐条产出并报告已产出的数量"""
+    for done, value in enumerate(iterable, 1):
+        yield value
+        progress(done)
+
+def no_progress(done):
+    pass
+
+def plan_quotation_images(params):
+    export_format = params.get('format') or 'zip'
+    if export_format not in ('zip', 'pdf'):
+        raise ValueError("format 仅支持 zip 或 pdf")
+    total = filtered_quotations(Quotation.query, params).count()
+    if not total:
+        raise LookupError("没有计价单可以导出")
+    if export_format == 'pdf' and total > current_app.config['BATCH_PDF_MAX_PAGES']:
+        raise ValueError(f"PDF 最多 {current_app.config['BATCH_PDF_MAX_PAGES']} 页，请缩小筛选范围或使用 zip 格式")
+    return dict(filter_params(params), format=export_format), total
+
+def write_quotation_images(params, fileobj, progress=no_progress):
+    rendered = counted(iter_rendered_quotations(filtered_quotations(Quotation.query, params)), progress)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    if params['format'] == 'pdf':
+        render.write_pdf([png for _, png in rendered], fileobj)
+        return 'application/pdf', f"批量计价单图片_{timestamp}.pdf"
+    # PNG 本身已压缩，直接存储即可
+    with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_STORED) as zf:
+        for quotation, png in rendered:
+            zf.writestr(f"{quotation.id}_{quotation.quotation_number}.png", png)
+    fileobj.seek(0)
+    return 'application/zip', f"批量计价单图片_{timestamp}.zip"
+
+@api.route('/api/quotations/images', methods=['GET'])
+def export_quotation_images():
+    """批量生成计价单图片，筛选参数同计价单列表
+
+    format=zip（默认）返回 PNG 压缩包，format=pdf 返回多页 PDF。
+    数量较多时请使用后台导出任务 POST /api/exports。
+    """
+    try:
+        params, _ = plan_quotation_images(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"message": str(e)}), 404
+    fileobj = exports.spooled_file()
+    try:
+        mimetype, filename = write_quotation_images(params, fileobj)
+        return send_file(fileobj, mimetype=mimetype, as_attachment=True, download_name=filename)
+    except Exception as e:
+        fileobj.close()
+        current_app.logger.exception("exporting quotation images")
+        return jsonify({"error": f"批量生成图片失败: {str(e)}"}), 500
+
+@api.route('/api/dev/render_cache', methods=['GET'])
+def get_render_cache_stats():
+    """图片缓存命中统计"""
+    return jsonify(get_render_cache().stats())
+
+# 单行模式导出用到的列，顺序与 exports.SINGLE_ROW_HEADERS 一致
+EXPORT_QUOTATION_COLUMNS = (Quotation.quotation_number, Quotation.school_name, Quotation.repair_person,
+                            Quotation.repair_location, Quotation.repair_time, Quotation.total_price)
+EXPORT_ITEM_COLUMNS = (QuotationItem.name, QuotationItem.price, QuotationItem.quantity,
+                       QuotationItem.unit, QuotationItem.subtotal)
+EXPORT_YIELD_PER = 1000
+# Excel 版式，见 exports.py
+EXPORT_LAYOUTS = ('single', 'detail')
+
+def export_layout(params, export_format='xlsx'):
+    layout = params.get('layout') or 'single'
+    if layout not in EXPORT_LAYOUTS:
+        raise ValueError(f"layout 仅支持 {' 或 '.join(EXPORT_LAYOUTS)}")
+    if layout == 'detail' and export_format != 'xlsx':
+        raise ValueError("明细模式仅支持 xlsx 格式")
+    return layout
+
+def plan_quotation(params):
+    try:
+        quotation_id = int(params.get('quotation_id'))
+    except (TypeError, ValueError):
+        raise ValueError('quotation_id 必须是整数')
+    if not db.session.query(exists().where(Quotation.id == quotation_id)).scalar():
+        raise LookupError("未找到计价单")
+    return {'quotation_id': quotation_id}, 1
+
+def plan_quotation_excel(params):
+    layout = export_layout(params)
+    params, total = plan_quotation(params)
+    return dict(params, layout=layout), total
+
+def write_quotation_excel(params, fileobj, progress=no_progress):
+    quotation = Quotation.query.options(selectinload(Quotation.items)).get(params['quotation_id'])
+    header = tuple(getattr(quotation, c.key) for c in EXPORT_QUOTATION_COLUMNS)
+    items = [tuple(getattr(item, c.key) for c in EXPORT_ITEM_COLUMNS) for item in quotation.items]
+    if params.get('layout') == 'detail':
+        exports.write_detail_xlsx([(header, items)], fileobj)
+    else:
+        exports.write_single_row_xlsx([(header, items)], len(items), fileobj, title="维修计价单")
+    progress(1)
+    return exports.XLSX_MIMETYPE, f"{quotation.quotation_number}.xlsx"
+
+def write_quotation_image(params, fileobj, progress=no_progress):
+    quotation = Quotation.query.options(selectinload(Quotation.items)).get(params['quotation_id'])
+    payload = quotation_render_payload(quotation)
+    data, _ = cached_png(quotation.id, payload, render.quotation_digest(payload, get_fonts()))
+    fileobj.write(data)
+    progress(1)
+    return 'image/png', f"{quotation.quotation_number}.png"
+
+@api.route('/api/quotations/<int:quotation_id>/excel', methods=['GET'])
 def export_quotation_excel(quotation_id):
-    """导出计价单为Excel（单行模式）"""
-    quotation = Quotation.query.get(quotation_id)
-    if not quotation:
-        return jsonify({"error": "未找到计价单"}), 404
+    """导出计价单为Excel，默认单行模式，layout=detail 时为明细模式"""
+    try:
+        params, _ = plan_quotation_excel({'quotation_id': quotation_id, 'layout': request.args.get('layout')})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"error": str(e)}), 404
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "维修计价单"
-        # 单行表头
-        headers = ["单号", "学校", "维修人员", "维修地点", "维修时间", "总金额"]
-        max_items = len(quotation.items)
-        for i in range(max_items):
-            headers += [f"项目{i+1}名称", f"项目{i+1}单价", f"项目{i+1}数量", f"项目{i+1}单位", f"项目{i+1}小计"]
-        ws.append(headers)
-        # 单行数据
-        row = [
-            quotation.quotation_number,
-            quotation.school_name,
-            quotation.repair_person,
-            quotation.repair_location,
-            quotation.repair_time,
-            quotation.total_price
-        ]
-        for item in quotation.items:
-            row += [item.name, item.price, item.quantity, item.unit, item.subtotal]
-        ws.append(row)
         excel_io = io.BytesIO()
-        wb.save(excel_io)
-        excel_io.seek(0)
-        uploads_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-        return send_file(excel_io, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name=f"{quotation.quotation_number}.xlsx")
+        mimetype, filename = write_quotation_excel(params, excel_io)
+        return send_file(excel_io, mimetype=mimetype, as_attachment=True, download_name=filename)
     except Exception as e:
-        print(f"Error exporting excel: {e}")
+        current_app.logger.exception("exporting excel")
         return jsonify({"error": f"导出Excel失败: {str(e)}"}), 500
 
-@app.route('/api/quotations/export_batch_excel', methods=['GET'])
+@contextlib.contextmanager
+def archive_connections(params):
+    """与导出筛选时间范围有重叠的归档库只读连接，按年份升序"""
+    start_at, end_before = parse_date_range(params.get('start'), params.get('end'))
+    with contextlib.ExitStack() as stack:
+        yield [stack.enter_context(retention.open_archive(current_app.config['ARCHIVE_FOLDER'], year))
+               for year in retention.archived_years(start_at, end_before)]
+
+def on_source(query, connection):
+    """connection 为 None 时在主库上执行 query，否则在该归档库连接上执行同样的语句"""
+    return query if connection is None else connection.execute(query.statement)
+
+def iter_export_rows(quotation_ids, connection=None):
+    """按计价单 id 顺序流式产出 (表头字段, [明细字段...])
+
+    一条 LEFT JOIN 查询配合 yield_per 分块拉取，内存只保留当前一张计价单
+    """
+    n = len(EXPORT_QUOTATION_COLUMNS)
+    query = db.session.query(Quotation.id, *EXPORT_QUOTATION_COLUMNS, *EXPORT_ITEM_COLUMNS) \
+        .outerjoin(QuotationItem, QuotationItem.quotation_id == Quotation.id) \
+        .filter(Quotation.id.in_(quotation_ids)) \
+        .order_by(Quotation.id, QuotationItem.id)
+    rows = on_source(query.yield_per(EXPORT_YIELD_PER), connection)
+    for _, group in itertools.groupby(rows, key=lambda r: r[0]):
+        group = list(group)
+        header = tuple(group[0][1:n + 1])
+        # 没有明细的计价单在 LEFT JOIN 中只有一行全空的明细列
+        items = [tuple(r[n + 1:]) for r in group if r[n + 1] is not None]
+        yield header, items
+
+def plan_quotations_excel(params):
+    export_format = params.get('format') or 'xlsx'
+    if export_format not in ('xlsx', 'csv'):
+        raise ValueError("format 仅支持 xlsx 或 csv")
+    layout = export_layout(params, export_format)
+    count = filtered_quotations(db.session.query(func.count(Quotation.id)), params)
+    with archive_connections(params) as connections:
+        total = sum(on_source(count, connection).scalar() for connection in connections + [None])
+    if not total:
+        raise LookupError("没有计价单可以导出")
+    return dict(filter_params(params), format=export_format, layout=layout), total
+
+def write_quotations_excel(params, fileobj, progress=no_progress):
+    filtered_ids = filtered_quotations(db.session.query(Quotation.id), params).subquery()
+    quotation_ids = db.session.query(filtered_ids.c.id)
+    timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+    with archive_connections(params) as connections:
+        # 归档库按年份在前、主库在后，整体按创建时间先后
+        sources = connections + [None]
+        rows = counted(itertools.chain.from_iterable(iter_export_rows(quotation_ids, source) for source in sources),
+                       progress)
+        if params.get('layout') == 'detail':
+            # 列数固定，不需要先统计最大项目数，一次 JOIN 查询边读边写两张表
+            exports.write_detail_xlsx(rows, fileobj)
+            return exports.XLSX_MIMETYPE, f"批量导出计价单明细_{timestamp}.xlsx"
+        # 一条聚合查询得到最大项目数，决定表头列数
+        counts = db.session.query(func.count(QuotationItem.id).label('n')) \
+            .select_from(Quotation) \
+            .outerjoin(QuotationItem, QuotationItem.quotation_id == Quotation.id) \
+            .filter(Quotation.id.in_(quotation_ids)) \
+            .group_by(Quotation.id) \
+            .subquery()
+        max_items = max(on_source(db.session.query(func.max(counts.c.n)), source).scalar() or 0 for source in sources)
+        if params['format'] == 'csv':
+            exports.write_single_row_csv(rows, max_items, fileobj)
+            return exports.CSV_MIMETYPE, f"批量导出计价单_{timestamp}.csv"
+        exports.write_single_row_xlsx(rows, max_items, fileobj)
+        return exports.XLSX_MIMETYPE, f"批量导出计价单_{timestamp}.xlsx"
+
+@api.route('/api/quotations/export_batch_excel', methods=['GET'])
 def export_batch_quotations_excel():
-    """批量导出所有计价单为Excel（单行模式，支持筛选）"""
-    # 获取筛选参数
-    school_id = request.args.get('school_id', type=int)
-    start = request.args.get('start')
-    end = request.args.get('end')
-    filtered = Quotation.query.all()
-    if school_id:
-        filtered = [q for q in filtered if q.school_id == school_id]
-    if start:
-        try:
-            start_dt = datetime.datetime.fromisoformat(start)
-            filtered = [q for q in filtered if datetime.datetime.fromisoformat(q.created_at) >= start_dt]
-        except Exception:
-            pass
-    if end:
-        try:
-            end_dt = datetime.datetime.fromisoformat(end)
-            filtered = [q for q in filtered if datetime.datetime.fromisoformat(q.created_at) <= end_dt]
-        except Exception:
-            pass
-    if not filtered:
-        return jsonify({"message": "没有计价单可以导出"}), 404
+    """批量导出所有计价单为Excel（默认单行模式，支持筛选）
+
+    layout=detail 时为明细模式（计价单、明细两张表），format=csv 时导出 CSV（仅单行模式）。
+    筛选范围内已归档的计价单从归档库读取，一并导出。筛选在 SQL 中完成，工作簿以只写模式写入
+    临时文件后分块流式返回，不在内存中保留整本工作簿。
+    数量较多时请使用后台导出任务 POST /api/exports。
+    """
     try:
-        wb = openpyxl.Workbook()
-        ws = wb.active
-        ws.title = "批量计价单"
-        # 计算最大项目数
-        max_items = max(len(q.items) for q in filtered)
-        headers = ["单号", "学校", "维修人员", "维修地点", "维修时间", "总金额"]
-        for i in range(max_items):
-            headers += [f"项目{i+1}名称", f"项目{i+1}单价", f"项目{i+1}数量", f"项目{i+1}单位", f"项目{i+1}小计"]
-        ws.append(headers)
-        for quotation in filtered:
-            row = [
-                quotation.quotation_number,
-                quotation.school_name,
-                quotation.repair_person,
-                quotation.repair_location,
-                quotation.repair_time,
-                quotation.total_price
-            ]
-            for item in quotation.items:
-                row += [item.name, item.price, item.quantity, item.unit, item.subtotal]
-            # 补齐空项目
-            for _ in range(max_items - len(quotation.items)):
-                row += ["", "", "", "", ""]
-            ws.append(row)
-        excel_io = io.BytesIO()
-        wb.save(excel_io)
-        excel_io.seek(0)
-        uploads_dir = os.path.join(os.path.dirname(__file__), '..', 'uploads')
-        if not os.path.exists(uploads_dir):
-            os.makedirs(uploads_dir)
-        filename = f"批量导出计价单_{datetime.datetime.now().strftime('%Y%m%d%H%M%S')}.xlsx"
-        return send_file(excel_io, mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', as_attachment=True, download_name=filename)
+        params, _ = plan_quotations_excel(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except LookupError as e:
+        return jsonify({"message": str(e)}), 404
+    fileobj = exports.spooled_file()
+    try:
+        mimetype, filename = write_quotations_excel(params, fileobj)
+        # send_file 会分块读取临时文件，并在响应结束后关闭它
+        return send_file(fileobj, mimetype=mimetype, as_attachment=True, download_name=filename)
     except Exception as e:
-        print(f"Error exporting batch excel: {e}")
+        fileobj.close()
+        current_app.logger.exception("exporting batch excel")
         return jsonify({"error": f"批量导出Excel失败: {str(e)}"}), 500
 
-@app.route('/api/dev/clear_schools_and_items', methods=['POST'])
+# 后台导出任务支持的类型: (plan, write)
+EXPORT_KINDS = {
+    'quotations_excel': (plan_quotations_excel, write_quotations_excel),
+    'quotation_images': (plan_quotation_images, write_quotation_images),
+    'quotation_excel': (plan_quotation_excel, write_quotation_excel),
+    'quotation_image': (plan_quotation, write_quotation_image),
+}
+
+def run_export(kind, params, fileobj, progress):
+    return EXPORT_KINDS[kind][1](params, fileobj, progress)
+
+export_jobs = jobs.ExportJobQueue(run_export)
+
+@api.before_app_first_request
+def recover_export_jobs():
+    export_jobs.recover(current_app._get_current_object())
+
+@click.command('purge-exports')
+@with_appcontext
+def purge_exports_command():
+    """删除超过保留期的导出文件和过期的幂等键"""
+    print(f"已清理 {export_jobs.purge_expired(current_app._get_current_object())} 个导出文件")
+    keys = retention.purge_idempotency_keys(idempotency_key_cutoff())
+    db.session.commit()
+    print(f"已清理 {keys} 个过期的幂等键")
+
+@api.route('/api/exports', methods=['POST'])
+def create_export_job():
+    """创建后台导出任务
+
+    请求体为 {"kind": 类型, ...参数}，类型见 EXPORT_KINDS：
+    quotations_excel / quotation_images 接受 school_id、start、end、format，
+    quotation_excel / quotation_image 接受 quotation_id，两种 Excel 导出另接受 layout。
+    返回 202 和任务地址，轮询到 status 为 done 后从 download_url 下载。
+    """
+    data = request.json or {}
+    kind = data.get('kind')
+    if kind not in EXPORT_KINDS:
+        return jsonify({'error': f"kind 仅支持 {', '.join(EXPORT_KINDS)}"}), 400
+    try:
+        params, total = EXPORT_KINDS[kind][0](data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+    job_id = export_jobs.submit(current_app._get_current_object(), kind, params, total)
+    return jsonify({'job_id': job_id, 'status_url': f"/api/exports/{job_id}"}), 202
+
+@api.route('/api/exports/<job_id>', methods=['GET'])
+def get_export_job(job_id):
+    job = ExportJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': '未找到导出任务'}), 404
+    return jsonify(jobs.job_to_dict(job))
+
+@api.route('/api/exports/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    """下载导出文件，支持 Range 断点续传"""
+    job = ExportJob.query.get(job_id)
+    if not job:
+        return jsonify({'error': '未找到导出任务'}), 404
+    if job.status == 'expired':
+        return jsonify({'error': '导出文件已过期，请重新导出'}), 410
+    if job.status != 'done':
+        return jsonify({'error': '导出尚未完成', 'status': job.status}), 409
+    response = send_file(export_jobs.path(current_app, job), mimetype=job.mimetype, as_attachment=True,
+                         download_name=job.filename, conditional=True)
+    # Werkzeug 只在收到 Range 请求时才声明，这里提前告知客户端可以断点续传
+    response.headers['Accept-Ranges'] = 'bytes'
+    return response
+
+@api.route('/api/dev/clear_schools_and_items', methods=['POST'])
 def clear_schools_and_items():
+    revision = changes.next_revision()
+    changes.tombstone_items(revision=revision)
+    changes.tombstone_schools(revision=revision)
     RepairItem.query.delete()
     School.query.delete()
+    search.sync_schools()
     db.session.commit()
+    catalog_index.invalidate()
     return jsonify({'message': '已清空所有学校和维修项目'})
 
-@app.route('/api/dev/import_school_repair_items', methods=['POST'])
+@api.route('/api/dev/import_school_repair_items', methods=['POST'])
 def import_school_repair_items():
     data = request.json
     # data: {schools: [{name: '学校名', items: [{name, price}]}]}
-    for school in data['schools']:
-        s = School(name=school['name'])
-        db.session.add(s)
-        db.session.flush()  # 获取id
-        for item in school['items']:
-            db.session.add(RepairItem(name=item['name'], price=item['price'], unit='项', school_id=s.id))
-    db.session.commit()
-    return jsonify({'message': '导入完成'})
+    schools = data.get('schools') if isinstance(data, dict) else None
+    if not isinstance(schools, list):
+        return jsonify({'error': '请求体须为 {"schools": [...]}'}), 400
+    report = importer.ImportReport()
+    try:
+        importer.import_catalog(importer.iter_school_items(schools), current_app.config['IMPORT_CHUNK_SIZE'],
+                                report=report)
+    finally:
+        finish_catalog_import(report)
+    return jsonify({'message': '导入完成', 'report': report.to_dict()})
+
+def import_failure(error, report):
+    """导入失败的响应体；已提交的块不会回滚，partial 表示部分数据已经导入"""
+    body = {'error': f"导入失败: {str(error)}", 'partial': report.chunks > 0, 'report': report.to_dict()}
+    if report.chunks:
+        body['message'] = f"已导入前 {report.chunks} 块（新增 {report.inserted}，更新 {report.updated}），之后的数据未导入"
+    return body
+
+# 后台导入任务的进度，只保存在当前进程内
+import_jobs = {}
+import_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='catalog-import')
 
-@app.route('/api/quotations/<int:quotation_id>', methods=['DELETE'])
+def run_import_job(app, job, path):
+    def progress(report):
+        job['progress'] = report.to_dict()
+    with app.app_context():
+        job['status'] = 'running'
+        report = importer.ImportReport()
+        try:
+            run_catalog_import(path, job['format'], app.config['IMPORT_CHUNK_SIZE'], progress, report)
+            job['status'] = 'done'
+        except Exception as e:
+            current_app.logger.exception("importing catalog")
+            job['status'] = 'failed'
+            failure = import_failure(e, report)
+            # 报告放在 progress 中
+            del failure['report']
+            job.update(failure)
+        finally:
+            job['progress'] = report.to_dict()
+            job['finished_at'] = datetime.datetime.now().isoformat()
+            os.remove(path)
+
+@api.route('/api/dev/import_catalog', methods=['POST'])
+def import_catalog_file():
+    """批量导入价目表（NDJSON/CSV/XLSX）
+
+    以 multipart 字段 file 上传，或直接把文件作为请求体并用 ?format= 指明格式。
+    小文件同步导入并返回报告；超过 IMPORT_SYNC_MAX_BYTES 的文件在后台导入，
+    返回 202 和任务地址，可轮询进度。
+    """
+    upload = request.files.get('file')
+    fmt = request.args.get('format') or importer.detect_format(upload.filename if upload else None)
+    if fmt not in importer.FORMATS:
+        return jsonify({'error': f"format 仅支持 {', '.join(importer.FORMATS)}"}), 400
+    imports_dir = os.path.join(current_app.config['UPLOADS_FOLDER'], 'imports')
+    os.makedirs(imports_dir, exist_ok=True)
+    job_id = uuid.uuid4().hex
+    path = os.path.join(imports_dir, f"{job_id}.{fmt}")
+    if upload:
+        upload.save(path)
+    else:
+        with open(path, 'wb') as f:
+            shutil.copyfileobj(request.stream, f)
+    if os.path.getsize(path) <= current_app.config['IMPORT_SYNC_MAX_BYTES']:
+        report = importer.ImportReport()
+        try:
+            run_catalog_import(path, fmt, current_app.config['IMPORT_CHUNK_SIZE'], report=report)
+        except Exception as e:
+            current_app.logger.exception("importing catalog")
+            return jsonify(import_failure(e, report)), 400
+        finally:
+            os.remove(path)
+        return jsonify({'message': '导入完成', 'report': report.to_dict()})
+    job = {'id': job_id, 'status': 'queued', 'format': fmt, 'progress': None, 'error': None,
+           'created_at': datetime.datetime.now().isoformat(), 'finished_at': None}
+    import_jobs[job_id] = job
+    import_executor.submit(run_import_job, current_app._get_current_object(), job, path)
+    return jsonify({'job_id': job_id, 'status_url': f"/api/dev/import_catalog/{job_id}"}), 202
+
+@api.route('/api/dev/import_catalog/<job_id>', methods=['GET'])
+def get_import_job(job_id):
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': '未找到导入任务'}), 404
+    return jsonify(job)
+
+@api.route('/api/quotations/<int:quotation_id>', methods=['DELETE'])
 def delete_quotation(quotation_id):
-    quotation = Quotation.query.get(quotation_id)
-    if not quotation:
+    if not retention.delete_quotations(Quotation.id == quotation_id):
         return jsonify({'error': '未找到计价单'}), 404
-    # 先删除明细
-    for item in quotation.items:
-        db.session.delete(item)
-    db.session.delete(quotation)
     db.session.commit()
+    quotation_version.bump()
+    get_render_cache().invalidate(quotation_id)
     return jsonify({'message': '计价单已删除'})
 
+@api.route('/api/quotations/bulk_delete', methods=['POST'])
+def bulk_delete_quotations():
+    """按筛选条件批量删除计价单
+
+    请求体为 {"school_id", "start", "end", "dry_run"}，筛选参数同计价单列表，至少需指定一个；
+    dry_run 为 true 时只返回匹配的数量。已归档的计价单不受影响。
+    """
+    data = request.json or {}
+    params = filter_params(data)
+    if not any(params.values()):
+        return jsonify({'error': '请至少指定 school_id、start、end 中的一个'}), 400
+    try:
+        criteria = filtered_criteria(params)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if data.get('dry_run'):
+        return jsonify({'matched': db.session.query(func.count(Quotation.id)).filter(*criteria).scalar()})
+    quotation_ids = retention.delete_quotations(*criteria)
+    db.session.commit()
+    if quotation_ids:
+        quotation_version.bump()
+        get_render_cache().invalidate_many(quotation_ids)
+    return jsonify({'message': f"已删除 {len(quotation_ids)} 张计价单", 'deleted': len(quotation_ids)})
+
 if __name__ == '__main__':
+    app = create_app()
+    print(app.config['DATABASE_DESCRIPTION'])
     # 确保 uploads 文件夹存在
-    uploads_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'uploads')
+    uploads_folder = app.config['UPLOADS_FOLDER']
     if not os.path.exists(uploads_folder):
         os.makedirs(uploads_folder)
     app.run(debug=True, port=5001) # 使用与前端不同的端口，避免冲突
\ No newline at end of file
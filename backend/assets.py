@@ -0,0 +1,143 @@
+# backend/assets.py
+"""前端静态文件：内容指纹、长期缓存和预压缩
+
+HTML 中引用的本地 js/css 改写为 "app.js?v=<内容哈希>"，带当前指纹的请求返回一年的
+immutable 缓存头，文件内容变化后指纹随之变化，浏览器自然会请求新地址；
+HTML 本身和不带指纹的请求使用 no-cache，每次凭 ETag 重新验证。
+
+每个文件首次被请求（或 serve.py 启动时预热）时读入内存，同时生成 gzip 和 brotli
+（需安装 brotli 包）两个压缩版本，按请求的 Accept-Encoding 选择，不在请求中压缩。
+文件修改时间或大小变化后重新生成，开发时修改前端文件无需重启。
+"""
+import collections
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import abort, current_app, request
+from werkzeug.security import safe_join
+
+MAX_AGE = 365 * 24 * 3600
+# 小于该字节数的文件压缩收益不抵额外的往返开销
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+# HTML 中的相对路径引用，如 src="app.js"、href="style.css"
+_REFERENCE = re.compile(r'''(\b(?:src|href)=")([^"?#:/][^"?#:]*\.(?:js|css))(")''')
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+Asset = collections.namedtuple('Asset', ['mtime', 'size', 'digest', 'mimetype', 'variants', 'references'])
+
+
+class StaticAssets:
+    def __init__(self, folder):
+        self.folder = folder
+        self._assets = {}  # 相对路径 -> Asset
+        self._lock = threading.Lock()
+
+    def _path(self, filename):
+        path = safe_join(self.folder, filename)
+        if path is None or not os.path.isfile(path):
+            return None
+        return path
+
+    def get(self, filename):
+        """返回文件的 Asset，文件不存在时返回 None"""
+        path = self._path(filename)
+        if path is None:
+            return None
+        stat = os.stat(path)
+        asset = self._assets.get(filename)
+        if asset is not None and (asset.mtime, asset.size) == (stat.st_mtime, stat.st_size) \
+                and all(self.digest(ref) == digest for ref, digest in asset.references.items()):
+            return asset
+        asset = self._build(filename, path, stat)
+        with self._lock:
+            self._assets[filename] = asset
+        return asset
+
+    def digest(self, filename):
+        asset = self.get(filename)
+        return asset.digest if asset else None
+
+    def _build(self, filename, path, stat):
+        with open(path, 'rb') as f:
+            data = f.read()
+        mimetype = mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        references = {}
+        if mimetype == 'text/html':
+            data, references = self._fingerprint_references(filename, data)
+        variants = {'identity': data}
+        if len(data) >= MIN_COMPRESS_BYTES and mimetype.startswith(COMPRESSIBLE_TYPES):
+            compressed = {'gzip': gzip.compress(data, compresslevel=9, mtime=0)}
+            if brotli is not None:
+                compressed['br'] = brotli.compress(data, quality=11)
+            variants.update((encoding, body) for encoding, body in compressed.items() if len(body) < len(data))
+        digest = hashlib.sha256(data).hexdigest()[:12]
+        return Asset(stat.st_mtime, stat.st_size, digest, mimetype, variants, references)
+
+    def _fingerprint_references(self, filename, data):
+        base = os.path.dirname(filename)
+        references = {}
+
+        def replace(match):
+            ref = os.path.normpath(os.path.join(base, match.group(2))).replace(os.sep, '/')
+            digest = self.digest(ref)
+            if digest is None:
+                return match.group(0)
+            references[ref] = digest
+            return f"{match.group(1)}{match.group(2)}?v={digest}{match.group(3)}"
+
+        text = _REFERENCE.sub(replace, data.decode('utf-8'))
+        return text.encode('utf-8'), references
+
+    def warm(self):
+        """预先读入并压缩全部文件，返回文件数"""
+        count = 0
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                if self.get(os.path.relpath(os.path.join(root, name), self.folder).replace(os.sep, '/')):
+                    count += 1
+        return count
+
+    @staticmethod
+    def _encoding(asset):
+        accepted = request.accept_encodings
+        for encoding in ('br', 'gzip'):
+            if encoding in asset.variants and accepted[encoding] > 0:
+                return encoding
+        return 'identity'
+
+    def response(self, filename):
+        asset = self.get(filename)
+        if asset is None:
+            abort(404)
+        encoding = self._encoding(asset)
+        response = current_app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+        if len(asset.variants) > 1:
+            response.vary.add('Accept-Encoding')
+        response.set_etag(f"{asset.digest}-{encoding}")
+        if request.args.get('v') == asset.digest:
+            response.headers['Cache-Control'] = f'public, max-age={MAX_AGE}, immutable'
+        else:
+            response.headers['Cache-Control'] = 'no-cache'
+        return response.make_conditional(request)
+
+
+def init_app(app):
+    """用带指纹和预压缩的 /static 路由替换 Flask 自带的静态文件路由
+
+    app 需以 static_folder=None 创建
+    """
+    assets = StaticAssets(os.path.join(app.root_path, 'static'))
+    app.extensions['static_assets'] = assets
+    app.add_url_rule('/static/<path:filename>', endpoint='static', view_func=assets.response)
+    return assets
@@ -0,0 +1,176 @@
+# backend/catalog.py
+"""维修项目价目表的进程内索引
+
+每个学校缓存一份 {item_id: CatalogEntry}，首次用到时从数据库加载，
+之后计价不再访问数据库；项目或学校被修改时由调用方 invalidate。
+多进程部署时通过 read_version/bump_version 共享版本号：本进程 invalidate
+会写入新版本号，其他进程每隔 sync_interval 秒读取一次，版本变化时清空本地缓存。
+"""
+import collections
+import math
+import re
+import threading
+import time
+
+CatalogEntry = collections.namedtuple('CatalogEntry', ['price', 'unit', 'name'])
+
+# 该项目的单价由维修人员现场填写，价目表中的价格只是占位
+CUSTOM_PRICE_ITEM_NAME = '其他'
+
+
+class InvalidPrice(ValueError):
+    """单价不是有限的非负数"""
+
+
+INTEGER_PATTERN = re.compile(r'-?[0-9]+')
+
+
+class InvalidQuantity(ValueError):
+    """客户端提交的数量不是整数"""
+
+
+def parse_quantity(value):
+    """数量须为整数或整数字符串（如 2、2.0、"2"）；1.7、"1e3"、true 等不做转换，直接抛出 InvalidQuantity"""
+    if isinstance(value, bool):
+        raise InvalidQuantity('维修项目数量必须是整数')
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, str) and INTEGER_PATTERN.fullmatch(value.strip()):
+        return int(value)
+    raise InvalidQuantity('维修项目数量必须是整数')
+
+
+def parse_price(value):
+    """单价须为有限的非负数，否则抛出 InvalidPrice；用于客户端提交的单价和导入的价目表"""
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        raise InvalidPrice('维修项目单价不是有效数字')
+    if not math.isfinite(price):
+        raise InvalidPrice('维修项目单价不是有效数字')
+    if price < 0:
+        raise InvalidPrice('维修项目单价不能为负数')
+    return price
+
+
+class CatalogIndex:
+    def __init__(self, loader, read_version=None, bump_version=None, sync_interval=1.0):
+        """loader(school_id) 返回该学校的 {item_id: CatalogEntry}
+
+        read_version() 返回共享的版本号（尚未写入过时为 None），bump_version(version)
+        把共享版本号递增到不小于 version 的值并返回；两者为空时只在进程内失效
+        """
+        self.loader = loader
+        self.read_version = read_version
+        self.bump_version = bump_version
+        self.sync_interval = sync_interval
+        self.hits = 0
+        self.misses = 0
+        self._schools = {}
+        self._lock = threading.Lock()
+        self._synced_at = None
+        self.version = self._next_version(0)
+
+    @staticmethod
+    def _next_version(current):
+        # 毫秒时间戳，进程重启后也不会与旧版本号重复
+        return max(current + 1, int(time.time() * 1000))
+
+    def sync(self):
+        """距上次检查超过 sync_interval 秒时读取共享版本号，与本地不同则清空缓存"""
+        if self.read_version is None:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return
+            self._synced_at = now
+        version = self.read_version()
+        if version is None and self.bump_version is not None:
+            # 共享存储中还没有版本号（未执行迁移）：写入本进程的版本号，之后各进程都以共享的值为准
+            version = self.bump_version(self.version)
+        with self._lock:
+            if version is not None and version != self.version:
+                self._schools.clear()
+                self.version = version
+
+    def current_version(self):
+        """版本号，用于 ETag 和客户端判断缓存是否过期"""
+        self.sync()
+        return self.version
+
+    def school(self, school_id):
+        self.sync()
+        with self._lock:
+            entries = self._schools.get(school_id)
+            if entries is not None:
+                self.hits += 1
+                return entries
+            self.misses += 1
+            version = self.version
+        entries = self.loader(school_id)
+        with self._lock:
+            # 加载期间发生过失效则不缓存，避免写入旧数据
+            if self.version == version:
+                self._schools[school_id] = entries
+        return entries
+
+    def lookup(self, school_id, item_id):
+        return self.school(school_id).get(item_id)
+
+    def quote_line(self, school_id, item_id, client_price=None):
+        """返回 (CatalogEntry, 单价)，项目不存在时返回 None
+
+        只有"其他"项目采用客户端提交的单价，其余一律以价目表为准；
+        该单价不是有限的非负数时抛出 InvalidPrice
+        """
+        entry = self.lookup(school_id, item_id)
+        if entry is None:
+            return None
+        if entry.name == CUSTOM_PRICE_ITEM_NAME and client_price is not None:
+            return entry, parse_price(client_price)
+        return entry, entry.price
+
+    def invalidate(self, school_id=None):
+        """school_id 为空时清空所有学校"""
+        with self._lock:
+            if school_id is None:
+                self._schools.clear()
+            else:
+                self._schools.pop(school_id, None)
+            self.version = self._next_version(self.version)
+            version = self.version
+        if self.bump_version is not None:
+            # 其他进程可能在同一毫秒内递增过，以共享存储返回的值为准
+            version = self.bump_version(version)
+            with self._lock:
+                self.version = version
+
+    def price_cart(self, selected_items):
+        """一次遍历计算总价，格式: [{'item_id': 101, 'quantity': 2, 'school_id': 1}, ...]
+
+        不存在的项目和数量不为正的行会被忽略；"其他"项目的单价无效时抛出 InvalidPrice，
+        数量不是整数时抛出 InvalidQuantity
+        """
+        total_price = 0
+        for selected in selected_items:
+            school_id = selected.get('school_id')
+            item_id = selected.get('item_id')
+            quantity = parse_quantity(selected.get('quantity', 0))
+            if not school_id or not item_id or quantity <= 0:
+                continue
+            quoted = self.quote_line(school_id, item_id, selected.get('price'))
+            if quoted:
+                total_price += quoted[1] * quantity
+        return total_price
+
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self.version,
+                'schools': len(self._schools),
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,101 @@
+# backend/changes.py
+"""价目表（学校和维修项目）的变更跟踪，供客户端增量同步
+
+每个修改价目表的事务用 next_revision() 取一个递增的修订号，写入被修改行的
+revision 列；删除的行先用 tombstone_* 记入 catalog_tombstone。计数器与数据在
+同一事务中更新，写事务串行提交，修订号的先后即提交的先后，客户端记住上次同步到的
+修订号，下次只取更大的即可。迁移前已有的数据修订号为 0，只在全量同步时返回。
+
+与 search.sync_* 一样由写入价目表的调用方显式调用，在当前事务中执行，不负责提交。
+需在应用上下文中调用。
+"""
+from sqlalchemy import literal, select
+
+from models import db, CacheVersion, CatalogTombstone, RepairItem, School
+
+REVISION_COUNTER = 'catalog_revision'
+
+
+def current_revision():
+    table = CacheVersion.__table__
+    return db.session.execute(select(table.c.version).where(table.c.name == REVISION_COUNTER)).scalar() or 0
+
+
+def next_revision():
+    """递增计数器并返回新的修订号；更新计数器会占用写锁，直到事务提交"""
+    table = CacheVersion.__table__
+    if not db.session.execute(table.update().where(table.c.name == REVISION_COUNTER)
+                              .values(version=table.c.version + 1)).rowcount:
+        db.session.execute(table.insert().values(name=REVISION_COUNTER, version=1))
+    return current_revision()
+
+
+def _stamp(model, ids, revision):
+    ids = list(ids)
+    if ids:
+        db.session.execute(model.__table__.update().where(model.__table__.c.id.in_(ids))
+                           .values(revision=revision or next_revision()))
+
+
+def stamp_schools(school_ids, revision=None):
+    """把这些学校标记为在 revision（默认取新修订号）中修改过"""
+    _stamp(School, school_ids, revision)
+
+
+def stamp_items(item_ids, revision=None):
+    _stamp(RepairItem, item_ids, revision)
+
+
+def _tombstone(query, revision):
+    table = CatalogTombstone.__table__
+    db.session.execute(table.insert().from_select(
+        [table.c.kind, table.c.record_id, table.c.school_id, table.c.revision],
+        query.add_columns(literal(revision or next_revision()))))
+
+
+def tombstone_items(*criteria, revision=None):
+    """在删除之前调用：为满足 criteria（为空时为全部）的维修项目记录删除"""
+    _tombstone(select(literal('item'), RepairItem.id, RepairItem.school_id).where(*criteria), revision)
+
+
+def tombstone_schools(*criteria, revision=None):
+    _tombstone(select(literal('school'), School.id, School.id).where(*criteria), revision)
+
+
+def changes_since(since, school_id=None):
+    """返回修订号大于 since 的学校、维修项目和删除记录
+
+    since 为 0 或大于当前修订号（如数据库从备份恢复）时返回全量，full 为 True，
+    客户端应丢弃本地缓存。school_id 只限制维修项目，学校总是全部返回。
+    """
+    revision = current_revision()
+    full = since <= 0 or since > revision
+    schools = db.session.query(School.id, School.name, School.revision)
+    items = db.session.query(RepairItem.id, RepairItem.name, RepairItem.price, RepairItem.unit,
+                             RepairItem.school_id, RepairItem.revision)
+    if not full:
+        schools = schools.filter(School.revision > since)
+        items = items.filter(RepairItem.revision > since)
+    if school_id:
+        items = items.filter(RepairItem.school_id == school_id)
+    result = {
+        'revision': revision,
+        'full': full,
+        'schools': [{'id': s.id, 'name': s.name, 'revision': s.revision} for s in schools.order_by(School.id)],
+        'items': [{'id': i.id, 'name': i.name, 'price': i.price, 'unit': i.unit, 'school_id': i.school_id,
+                   'revision': i.revision} for i in items.order_by(RepairItem.id)],
+        'deleted': {'schools': [], 'items': []},
+    }
+    if full:
+        return result
+    tombstones = db.session.query(CatalogTombstone.kind, CatalogTombstone.record_id) \
+        .filter(CatalogTombstone.revision > since)
+    if school_id:
+        # 学校的删除记录 school_id 即其自身，按学校筛选时仍需返回
+        tombstones = tombstones.filter((CatalogTombstone.school_id == school_id) | (CatalogTombstone.kind == 'school'))
+    # SQLite 会复用已删除的最大 id：同一 id 删除后又新建时只返回新建的行
+    present = {'school': {s['id'] for s in result['schools']}, 'item': {i['id'] for i in result['items']}}
+    for kind, record_id in tombstones.distinct().order_by(CatalogTombstone.record_id):
+        if record_id not in present[kind]:
+            result['deleted'][kind + 's'].append(record_id)
+    return result
@@ -0,0 +1,264 @@
+# backend/database.py
+"""数据库配置：SQLite 连接参数、PostgreSQL 连接池和结构迁移
+
+默认使用 SQLite，并在每个连接上启用 WAL 等适合多 worker 并发的参数；
+设置 DATABASE_URL 可切换到 PostgreSQL 等数据库。
+"""
+import datetime
+import os
+import sqlite3
+import time
+import urllib.request
+
+from sqlalchemy import bindparam, create_engine, event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import NullPool, QueuePool
+
+# 未设置 DATABASE_URL 时使用实例目录（仓库根目录下的 instance/）中的这个文件
+DEFAULT_DATABASE_FILE = 'repair_system.db'
+
+# 每个 SQLite 连接建立时执行的 PRAGMA，均可用同名环境变量覆盖
+SQLITE_PRAGMAS = {
+    # 只对新建的数据库生效（须在建表之前设置），已有数据库由 flask archive-quotations 首次执行时转换，
+    # 之后删除数据释放的页可用 PRAGMA incremental_vacuum 归还给文件系统
+    'SQLITE_AUTO_VACUUM': ('auto_vacuum', 'INCREMENTAL'),
+    'SQLITE_JOURNAL_MODE': ('journal_mode', 'WAL'),
+    'SQLITE_SYNCHRONOUS': ('synchronous', 'NORMAL'),
+    'SQLITE_BUSY_TIMEOUT_MS': ('busy_timeout', '5000'),
+    'SQLITE_MMAP_SIZE': ('mmap_size', str(256 * 1024 * 1024)),
+    # 负数表示 KiB，即 64MB 页缓存
+    'SQLITE_CACHE_SIZE': ('cache_size', '-64000'),
+}
+
+
+# SQLite 文件库保留的连接数，未设置 DB_POOL_SIZE 时取 WEB_THREADS
+SQLITE_POOL_SIZE = 4
+
+# 当前生效的 PRAGMA，由 configure 设置
+_pragmas = {}
+
+
+def is_memory_sqlite(uri):
+    return uri in ('sqlite://', 'sqlite:///:memory:') or 'mode=memory' in uri
+
+
+def default_database_uri(app):
+    """实例目录中数据库文件的绝对地址；相对的 sqlite:/// 地址在 Flask-SQLAlchemy 2.x 中按应用根目录解析，不能用"""
+    os.makedirs(app.instance_path, exist_ok=True)
+    return 'sqlite:///' + os.path.join(app.instance_path, DEFAULT_DATABASE_FILE)
+
+
+def describe(uri):
+    """启动时打印的数据库说明：SQLite 为文件路径（不存在时注明将新建），其他数据库隐藏密码"""
+    url = make_url(uri)
+    if url.get_backend_name() != 'sqlite':
+        return f"数据库: {url!r}"
+    if not url.database or is_memory_sqlite(uri):
+        return '数据库: SQLite 内存库'
+    path = os.path.abspath(url.database)
+    return f"数据库: {path}" + ('' if os.path.exists(path) else '（文件不存在，已新建空数据库）')
+
+
+def configure(app):
+    """根据环境变量设置数据库地址和引擎参数，已在 app.config 中指定的地址优先"""
+    uri = app.config.get('SQLALCHEMY_DATABASE_URI') or os.environ.get('DATABASE_URL') or default_database_uri(app)
+    # 部分平台提供的是 postgres:// 前缀，SQLAlchemy 只认 postgresql://
+    if uri.startswith('postgres://'):
+        uri = 'postgresql://' + uri[len('postgres://'):]
+    app.config['SQLALCHEMY_DATABASE_URI'] = uri
+    # 在建表之前记录，便于看出是否打开了已有的数据库
+    app.config['DATABASE_DESCRIPTION'] = describe(uri)
+    app.config['SQLITE_PRAGMAS'] = {
+        pragma: os.environ.get(env, default) for env, (pragma, default) in SQLITE_PRAGMAS.items()
+    }
+    if uri.startswith('sqlite'):
+        busy_timeout = int(app.config['SQLITE_PRAGMAS']['busy_timeout'])
+        options = {'connect_args': {'timeout': busy_timeout / 1000}}
+        if not is_memory_sqlite(uri):
+            # 文件库默认不使用连接池，每次请求都新建连接、重新执行 PRAGMA，页缓存和内存映射也随连接丢弃；
+            # 改为按线程数保留连接，连接会被不同线程复用
+            options['connect_args']['check_same_thread'] = False
+            options.update({
+                'poolclass': QueuePool,
+                'pool_size': int(os.environ.get('DB_POOL_SIZE', os.environ.get('WEB_THREADS', SQLITE_POOL_SIZE))),
+                'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            })
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+    else:
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+            'pool_size': int(os.environ.get('DB_POOL_SIZE', 5)),
+            'max_overflow': int(os.environ.get('DB_MAX_OVERFLOW', 10)),
+            'pool_recycle': int(os.environ.get('DB_POOL_RECYCLE', 1800)),
+            'pool_pre_ping': True,
+        }
+    _pragmas.clear()
+    _pragmas.update(app.config['SQLITE_PRAGMAS'])
+
+
+class ReadOnlyConnection(sqlite3.Connection):
+    """只读打开的 SQLite 文件（如归档库），不应用 SQLITE_PRAGMAS"""
+
+
+def readonly_sqlite_engine(path):
+    """只读访问另一个 SQLite 文件的引擎，不使用连接池，用完后 dispose 即关闭文件"""
+    uri = f"file:{urllib.request.pathname2url(os.path.abspath(path))}?mode=ro"
+    return create_engine('sqlite://', poolclass=NullPool, creator=lambda: sqlite3.connect(
+        uri, uri=True, factory=ReadOnlyConnection, check_same_thread=False))
+
+
+@event.listens_for(Engine, 'connect')
+def apply_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection) or isinstance(dbapi_connection, ReadOnlyConnection):
+        return
+    cursor = dbapi_connection.cursor()
+    for pragma, value in _pragmas.items():
+        cursor.execute(f'PRAGMA {pragma}={value}')
+    cursor.close()
+
+
+# --- 结构迁移 ---
+def _rebuild_rollups(conn):
+    # 汇总表依赖模型定义，延迟导入避免循环引用
+    import reports
+    reports.rebuild_rollups(conn)
+
+
+def _create_search_index(conn):
+    import search
+    search.create_index(conn)
+
+
+# SQLAlchemy 在 SQLite 中保存 DateTime 的文本格式，按字典序比较即按时间先后
+SQLITE_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+DATETIME_MIGRATION_BATCH = 5000
+
+
+def _typed_quotation_datetimes(conn):
+    """把计价单的 created_at / repair_time 从 ISO 字符串转为 DateTime 列"""
+    if conn.dialect.name != 'sqlite':
+        for column in ('created_at', 'repair_time'):
+            conn.execute(text(f'ALTER TABLE quotation ALTER COLUMN {column} TYPE TIMESTAMP '
+                              f'USING {column}::timestamp'))
+        return
+    # SQLite 不校验列类型，只需把旧的 2024-01-01T10:00 格式统一改写为 DateTime 的存储格式
+    update = text('UPDATE quotation SET created_at = :created_at, repair_time = :repair_time WHERE id = :id') \
+        .bindparams(bindparam('id'), bindparam('created_at'), bindparam('repair_time'))
+    last_id = 0
+    while True:
+        rows = conn.execute(text('SELECT id, created_at, repair_time FROM quotation WHERE id > :id ORDER BY id LIMIT :n'),
+                            {'id': last_id, 'n': DATETIME_MIGRATION_BATCH}).fetchall()
+        if not rows:
+            break
+        conn.execute(update, [{
+            'id': row_id,
+            'created_at': datetime.datetime.fromisoformat(created_at).strftime(SQLITE_DATETIME_FORMAT),
+            'repair_time': datetime.datetime.fromisoformat(repair_time).strftime(SQLITE_DATETIME_FORMAT),
+        } for row_id, created_at, repair_time in rows])
+        last_id = rows[-1][0]
+
+
+def _add_catalog_revisions(conn):
+    """为学校和维修项目加上修订号列；新建的数据库已由 create_all 建好该列"""
+    for table in ('school', 'repair_item'):
+        if 'revision' not in {column['name'] for column in inspect(conn).get_columns(table)}:
+            conn.execute(text(f'ALTER TABLE {table} ADD COLUMN revision INTEGER NOT NULL DEFAULT 0'))
+        conn.execute(text(f'CREATE INDEX IF NOT EXISTS ix_{table}_revision ON {table} (revision)'))
+    # 修订号计数器从 1 开始：已有数据的修订号为 0，全量同步返回的修订号不为 0，客户端下次即可增量同步
+    if conn.execute(text("SELECT 1 FROM cache_version WHERE name = 'catalog_revision'")).first() is None:
+        conn.execute(text("INSERT INTO cache_version (name, version) VALUES ('catalog_revision', 1)"))
+
+
+def _add_idempotency_request_hash(conn):
+    """幂等键记录请求体摘要；已有的键没有摘要，重放时不校验"""
+    if 'request_hash' not in {column['name'] for column in inspect(conn).get_columns('idempotency_key')}:
+        conn.execute(text('ALTER TABLE idempotency_key ADD COLUMN request_hash VARCHAR(64)'))
+
+
+def _typed_idempotency_created_at(conn):
+    """把幂等键的 created_at 从 ISO 字符串转为 DateTime 列"""
+    if conn.dialect.name != 'sqlite':
+        conn.execute(text('ALTER TABLE idempotency_key ALTER COLUMN created_at TYPE TIMESTAMP '
+                          'USING created_at::timestamp'))
+        return
+    rows = conn.execute(text('SELECT key, created_at FROM idempotency_key')).fetchall()
+    if rows:
+        conn.execute(text('UPDATE idempotency_key SET created_at = :created_at WHERE key = :key'), [
+            {'key': key, 'created_at': datetime.datetime.fromisoformat(created_at).strftime(SQLITE_DATETIME_FORMAT)}
+            for key, created_at in rows])
+
+
+def _seed_cache_versions(conn):
+    """写入价目表和计价单的共享版本号：缺少这两行时各 worker 会各自生成版本号，ETag 和同步游标不一致
+
+    初始值取毫秒时间戳（与 CatalogIndex 相同），大于此前各进程自行生成的版本号，客户端缓存的旧 ETag 不会误中
+    """
+    version = int(time.time() * 1000)
+    for name in ('catalog', 'quotations'):
+        if conn.execute(text('SELECT 1 FROM cache_version WHERE name = :name'), {'name': name}).first() is None:
+            conn.execute(text('INSERT INTO cache_version (name, version) VALUES (:name, :version)'),
+                         {'name': name, 'version': version})
+
+
+# 每项为 (版本号, 说明, 步骤列表)，只追加不修改；步骤为 SQL 字符串或接收连接的函数，须可重复执行
+MIGRATIONS = [
+    (1, '计价单号去重并建立唯一索引', [
+        # 旧版本同一秒内提交会产生重复单号：保留最早的一条，其余追加 -id
+        "UPDATE quotation SET quotation_number = quotation_number || '-' || id "
+        "WHERE id NOT IN (SELECT MIN(id) FROM quotation GROUP BY quotation_number)",
+        'CREATE UNIQUE INDEX IF NOT EXISTS ix_quotation_quotation_number ON quotation (quotation_number)',
+    ]),
+    (2, '为列表、筛选和导出常用的列建立索引', [
+        'CREATE INDEX IF NOT EXISTS ix_repair_item_school_id ON repair_item (school_id)',
+        'CREATE INDEX IF NOT EXISTS ix_quotation_school_id ON quotation (school_id)',
+        'CREATE INDEX IF NOT EXISTS ix_quotation_created_at ON quotation (created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_quotation_school_id_created_at ON quotation (school_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_quotation_item_quotation_id ON quotation_item (quotation_id)',
+    ]),
+    (3, '从已有计价单生成按天汇总表', [
+        _rebuild_rollups,
+    ]),
+    (4, '计价单时间改为 DateTime 列并为维修时间建立索引', [
+        _typed_quotation_datetimes,
+        'CREATE INDEX IF NOT EXISTS ix_quotation_repair_time ON quotation (repair_time)',
+    ]),
+    (5, '建立维修项目名称的全文索引', [
+        _create_search_index,
+    ]),
+    (6, '为学校和维修项目记录修订号，用于客户端增量同步', [
+        _add_catalog_revisions,
+    ]),
+    (7, '幂等键记录请求体摘要', [
+        _add_idempotency_request_hash,
+    ]),
+    (8, '幂等键时间改为 DateTime 列并建立索引，用于清理过期的键', [
+        _typed_idempotency_created_at,
+        'CREATE INDEX IF NOT EXISTS ix_idempotency_key_created_at ON idempotency_key (created_at)',
+    ]),
+    (9, '写入价目表和计价单的共享版本号初始值', [
+        _seed_cache_versions,
+    ]),
+]
+
+
+def current_version(engine):
+    with engine.begin() as conn:
+        conn.execute(text('CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)'))
+        return conn.execute(text('SELECT MAX(version) FROM schema_version')).scalar() or 0
+
+
+def migrate(engine, migrations=MIGRATIONS):
+    """把数据库升级到最新版本，每个版本在单独的事务中执行，返回升级后的版本号"""
+    version = current_version(engine)
+    for target, description, statements in migrations:
+        if target <= version:
+            continue
+        with engine.begin() as conn:
+            for statement in statements:
+                if callable(statement):
+                    statement(conn)
+                else:
+                    conn.execute(text(statement))
+            conn.execute(text('INSERT INTO schema_version (version) VALUES (:version)'), {'version': target})
+        print(f"数据库已升级到版本 {target}: {description}")
+        version = target
+    return version
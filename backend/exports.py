@@ -0,0 +1,143 @@
+# backend/exports.py
+"""计价单导出写入器
+
+这里只负责把已经查询好的行写成 Excel/CSV，不依赖 Flask 应用上下文，
+方便在请求线程之外（后台任务、命令行）复用。openpyxl 在第一次导出 Excel 时才导入。
+
+两种版式：
+- 单行模式：每张计价单一行，每个项目追加 5 列，列数由项目最多的计价单决定
+- 明细模式：计价单表每张计价单一行，明细表每个项目一行，两表以单号关联，
+  列数固定，文件大小与项目总数成正比
+"""
+import codecs
+import csv
+import io
+import tempfile
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+CSV_MIMETYPE = 'text/csv'
+
+# 导出文件先写入内存，超过该大小后自动转存到磁盘临时文件
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+SINGLE_ROW_HEADERS = ["单号", "学校", "维修人员", "维修地点", "维修时间", "总金额"]
+EMPTY_ITEM_CELLS = ("", "", "", "", "")
+
+MONEY_FORMAT = '#,##0.00'
+DATETIME_FORMAT = 'yyyy-mm-dd hh:mm'
+# 明细模式各表的列: (表头, 列宽, 数字格式)
+DETAIL_QUOTATION_COLUMNS = (("单号", 20, None), ("学校", 24, None), ("维修人员", 12, None),
+                            ("维修地点", 24, None), ("维修时间", 18, DATETIME_FORMAT),
+                            ("总金额", 12, MONEY_FORMAT), ("项目数", 8, None))
+DETAIL_LINE_COLUMNS = (("单号", 20, None), ("序号", 6, None), ("项目名称", 30, None), ("单价", 10, MONEY_FORMAT),
+                       ("数量", 8, None), ("单位", 8, None), ("小计", 12, MONEY_FORMAT))
+
+
+def spooled_file():
+    """返回一个内存优先、过大时落盘的临时文件"""
+    return tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE, mode='w+b')
+
+
+def single_row_headers(max_items):
+    headers = list(SINGLE_ROW_HEADERS)
+    for i in range(max_items):
+        headers += [f"项目{i+1}名称", f"项目{i+1}单价", f"项目{i+1}数量", f"项目{i+1}单位", f"项目{i+1}小计"]
+    return headers
+
+
+def single_row(quotation, items, max_items):
+    """单行模式的一行数据
+
+    quotation: (单号, 学校, 维修人员, 维修地点, 维修时间, 总金额)
+    items: [(名称, 单价, 数量, 单位, 小计), ...]
+    """
+    row = list(quotation)
+    for item in items:
+        row += item
+    # 补齐空项目
+    for _ in range(max_items - len(items)):
+        row += EMPTY_ITEM_CELLS
+    return row
+
+
+def write_single_row_xlsx(rows, max_items, fileobj, title="批量计价单"):
+    """用只写模式工作簿逐行写出，内存占用与行数无关
+
+    rows: 可迭代的 (quotation, items)，格式同 single_row
+    """
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet(title)
+    ws.append(single_row_headers(max_items))
+    for quotation, items in rows:
+        ws.append(single_row(quotation, items, max_items))
+    wb.save(fileobj)
+    fileobj.seek(0)
+    return fileobj
+
+
+def _detail_sheet(wb, title, columns):
+    """创建只写工作表并写入表头，返回逐行写入的函数
+
+    只写模式下列宽须在写入第一行之前设置。带数字格式的列各预先建好一个设置了格式的单元格，
+    每行只替换其中的值，不必为每个单元格重新设置样式
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+    ws = wb.create_sheet(title)
+    for i, (_, width, _) in enumerate(columns, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+    ws.freeze_panes = 'A2'
+    ws.append([header for header, _, _ in columns])
+    styled = {}
+    for i, (_, _, number_format) in enumerate(columns):
+        if number_format:
+            styled[i] = WriteOnlyCell(ws)
+            styled[i].number_format = number_format
+
+    def append(values):
+        values = list(values)
+        for i, cell in styled.items():
+            if values[i] is not None:
+                cell.value = values[i]
+                values[i] = cell
+        ws.append(values)
+    return append
+
+
+def write_detail_xlsx(rows, fileobj):
+    """明细模式：一次遍历 rows 同时写计价单表和明细表
+
+    rows: 可迭代的 (quotation, items)，格式同 single_row，按计价单顺序产出
+    """
+    import openpyxl
+    wb = openpyxl.Workbook(write_only=True)
+    append_quotation = _detail_sheet(wb, "计价单", DETAIL_QUOTATION_COLUMNS)
+    append_line = _detail_sheet(wb, "明细", DETAIL_LINE_COLUMNS)
+    for quotation, items in rows:
+        append_quotation((*quotation, len(items)))
+        for i, item in enumerate(items, 1):
+            append_line((quotation[0], i, *item))
+    wb.save(fileobj)
+    fileobj.seek(0)
+    return fileobj
+
+
+def write_single_row_csv(rows, max_items, fileobj):
+    """CSV 版本，带 BOM 以便 Excel 正确识别中文"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    fileobj.write(codecs.BOM_UTF8)
+
+    def flush():
+        fileobj.write(buffer.getvalue().encode('utf-8'))
+        buffer.seek(0)
+        buffer.truncate()
+
+    writer.writerow(single_row_headers(max_items))
+    flush()
+    for quotation, items in rows:
+        writer.writerow(single_row(quotation, items, max_items))
+        flush()
+    fileobj.seek(0)
+    return fileobj
@@ -0,0 +1,219 @@
+# backend/importer.py
+"""维修项目价目表批量导入
+
+支持 NDJSON / CSV / XLSX，每条记录为 学校名称 + 项目名称 + 单价 (+ 单位)。
+按 (学校, 项目名称) 分块 upsert：已有项目更新价格和单位，没有的批量插入，
+不存在的学校会自动创建。每块使用一个价目表修订号（见 changes.py），
+价格和单位都没有变化的项目不改写，重复导入同一份价目表不会让客户端重新同步。
+每块单独提交，中途失败时之前的块已经生效，ImportReport 记录已提交的部分。
+需在应用上下文中调用。
+"""
+import codecs
+import csv
+import io
+import json
+
+from sqlalchemy import bindparam
+
+import catalog
+import changes
+from models import db, School, RepairItem
+
+FORMATS = ('ndjson', 'csv', 'xlsx')
+DEFAULT_UNIT = '项'
+DEFAULT_CHUNK_SIZE = 500
+
+# 表头别名，CSV/XLSX 的第一行可以用中文或英文列名
+COLUMN_ALIASES = {
+    'school': 'school', '学校': 'school', 'school_name': 'school',
+    'name': 'name', '项目': 'name', '项目名称': 'name', '维修项目': 'name',
+    'price': 'price', '单价': 'price', '价格': 'price', 'baseprice': 'price',
+    'unit': 'unit', '单位': 'unit',
+}
+
+
+class ImportReport:
+    def __init__(self):
+        self.processed = 0
+        self.inserted = 0
+        self.updated = 0
+        self.schools_created = 0
+        self.chunks = 0
+        self.errors = []
+        # 已提交的块涉及的学校 id，中途失败时调用方据此同步搜索索引
+        self.school_ids = set()
+
+    def to_dict(self):
+        return {
+            'processed': self.processed,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'schools_created': self.schools_created,
+            'chunks': self.chunks,
+            # 错误可能很多，只返回前 100 条
+            'errors': self.errors[:100],
+            'error_count': len(self.errors)
+        }
+
+
+def detect_format(filename, default=None):
+    ext = filename.rsplit('.', 1)[-1].lower() if filename and '.' in filename else ''
+    if ext in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if ext in FORMATS:
+        return ext
+    return default
+
+
+def _normalize_header(row):
+    return [COLUMN_ALIASES.get(str(cell or '').strip().lower(), str(cell or '').strip()) for cell in row]
+
+
+def iter_records(fileobj, fmt):
+    """从二进制文件对象中逐条产出 (行号, 原始记录 dict)"""
+    if fmt == 'ndjson':
+        for line_no, line in enumerate(codecs.getreader('utf-8-sig')(fileobj), 1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError:
+                    yield line_no, None
+    elif fmt == 'csv':
+        reader = csv.reader(io.TextIOWrapper(fileobj, encoding='utf-8-sig', newline=''))
+        header = None
+        for line_no, row in enumerate(reader, 1):
+            if header is None:
+                header = _normalize_header(row)
+                continue
+            if any(row):
+                yield line_no, dict(zip(header, row))
+    elif fmt == 'xlsx':
+        import openpyxl
+        wb = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        try:
+            header = None
+            for line_no, row in enumerate(wb.active.iter_rows(values_only=True), 1):
+                if header is None:
+                    header = _normalize_header(row)
+                    continue
+                if any(cell not in (None, '') for cell in row):
+                    yield line_no, dict(zip(header, row))
+        finally:
+            wb.close()
+    else:
+        raise ValueError(f"不支持的格式: {fmt}")
+
+
+def iter_school_items(schools):
+    """把 [{name: 学校, items: [{name, price}]}] 展开为 (序号, 原始记录)，与 iter_records 的产出相同
+
+    缺少字段或结构不对的条目照样产出，由 clean_record 作为该行的错误报告
+    """
+    line_no = 0
+    for school in schools:
+        items = school.get('items') if isinstance(school, dict) else None
+        if not isinstance(items, list):
+            line_no += 1
+            yield line_no, None
+            continue
+        for item in items:
+            line_no += 1
+            yield line_no, {'school': school.get('name'), 'name': item.get('name'),
+                            'price': item.get('price')} if isinstance(item, dict) else None
+
+
+def clean_record(raw):
+    """校验并规范化一条记录，返回 (学校, 项目, 单价, 单位)；无效时抛出 ValueError"""
+    if not isinstance(raw, dict):
+        raise ValueError('无法解析该行')
+    school = str(raw.get('school') or '').strip()
+    name = str(raw.get('name') or '').strip()
+    if not school or not name:
+        raise ValueError('缺少学校或项目名称')
+    # nan、inf、1e400 等也会被拒绝，只跳过该行
+    price = catalog.parse_price(raw.get('price'))
+    unit = str(raw.get('unit') or '').strip() or DEFAULT_UNIT
+    return school, name, price, unit
+
+
+def _school_ids(names, report, revision):
+    """返回 {学校名称: id}，不存在的学校批量创建"""
+    names = set(names)
+    found = dict(db.session.query(School.name, School.id).filter(School.name.in_(names)))
+    missing = [{'name': name, 'revision': revision} for name in names if name not in found]
+    if missing:
+        db.session.execute(School.__table__.insert(), missing)
+        report.schools_created += len(missing)
+        found.update(db.session.query(School.name, School.id)
+                     .filter(School.name.in_([m['name'] for m in missing])))
+    return found
+
+
+def _upsert_chunk(records, report):
+    # 同一块内重复的 (学校, 项目) 以最后一条为准
+    latest = {}
+    for school, name, price, unit in records:
+        latest[(school, name)] = (price, unit)
+    revision = changes.next_revision()
+    school_ids = _school_ids([school for school, _ in latest], report, revision)
+    existing = {}
+    rows = db.session.query(RepairItem.id, RepairItem.school_id, RepairItem.name, RepairItem.price, RepairItem.unit) \
+        .filter(RepairItem.school_id.in_(set(school_ids.values())),
+                RepairItem.name.in_({name for _, name in latest}))
+    for item_id, school_id, name, price, unit in rows:
+        existing.setdefault((school_id, name), (item_id, price, unit))
+    inserts, updates = [], []
+    unchanged = 0
+    for (school, name), (price, unit) in latest.items():
+        school_id = school_ids[school]
+        item_id, old_price, old_unit = existing.get((school_id, name), (None, None, None))
+        if item_id is None:
+            inserts.append({'name': name, 'price': price, 'unit': unit, 'school_id': school_id,
+                            'revision': revision})
+        elif (old_price, old_unit) == (price, unit):
+            unchanged += 1
+        else:
+            updates.append({'item_id': item_id, 'price': price, 'unit': unit, 'revision': revision})
+    table = RepairItem.__table__
+    if inserts:
+        db.session.execute(table.insert(), inserts)
+    if updates:
+        db.session.execute(table.update().where(table.c.id == bindparam('item_id'))
+                           .values(price=bindparam('price'), unit=bindparam('unit'),
+                                   revision=bindparam('revision')), updates)
+    db.session.commit()
+    report.inserted += len(inserts)
+    # 与之前一致，已存在的项目都计入 updated
+    report.updated += len(updates) + unchanged
+    return set(school_ids.values())
+
+
+def import_catalog(records, chunk_size=DEFAULT_CHUNK_SIZE, progress=None, report=None):
+    """导入 iter_records 产出的记录，每块单独提交，返回 ImportReport
+
+    progress(report) 在每块提交后调用。传入 report 时结果累加到其中，
+    这样抛出异常时调用方仍能拿到已提交部分的统计和 school_ids
+    """
+    report = report or ImportReport()
+    chunk = []
+
+    def flush():
+        report.school_ids.update(_upsert_chunk(chunk, report))
+        report.chunks += 1
+        chunk.clear()
+        if progress:
+            progress(report)
+
+    for line_no, raw in records:
+        try:
+            chunk.append(clean_record(raw))
+        except ValueError as e:
+            report.errors.append({'line': line_no, 'error': str(e)})
+            continue
+        finally:
+            report.processed += 1
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    return report
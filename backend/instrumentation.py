@@ -0,0 +1,177 @@
+# backend/instrumentation.py
+"""请求计时、SQL 计数和指标导出
+
+- 每个请求统计总耗时、SQL 条数和 SQL 耗时，写入 Server-Timing 响应头
+- SQL 条数超过 QUERY_COUNT_WARN 时记录警告日志，便于发现 N+1 查询
+- RequestMetrics 按路由累计延迟和 SQL 条数的直方图，以 Prometheus 文本格式导出
+- 配置了 PROFILE_TOKEN 时，请求头 X-Profile 与之相同的单个请求会用 cProfile 采样，
+  响应体替换为按累计耗时排序的统计结果
+
+指标只在当前进程内累计，多 worker 部署时每个进程分别导出。
+"""
+import contextvars
+import cProfile
+import io
+import pstats
+import threading
+import time
+
+from flask import g, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+PROFILE_HEADER = 'X-Profile'
+PROFILE_TOP_FUNCTIONS = 40
+
+# 当前请求的 SQL 统计，请求之外（后台任务等）为 None
+_query_stats = contextvars.ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _query_stats.get() is not None:
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _query_stats.get()
+    if stats is not None and conn.info.get('query_start'):
+        stats.count += 1
+        stats.seconds += time.perf_counter() - conn.info['query_start'].pop()
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _labels(labels):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{k}="{escape(v)}"' for k, v in labels.items())
+
+
+class RequestMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency = {}  # (method, route, status) -> Histogram
+        self._queries = {}  # (method, route) -> Histogram
+        self._query_seconds = {}  # (method, route) -> 秒
+        self._gauges = []  # (name, help, fn, kind)
+
+    def observe(self, method, route, status, seconds, query_stats):
+        with self._lock:
+            self._latency.setdefault((method, route, status), Histogram(LATENCY_BUCKETS)).observe(seconds)
+            self._queries.setdefault((method, route), Histogram(QUERY_COUNT_BUCKETS)).observe(query_stats.count)
+            self._query_seconds[(method, route)] = self._query_seconds.get((method, route), 0.0) + query_stats.seconds
+
+    def gauge(self, name, help_text, fn, kind='gauge'):
+        """注册导出时才求值的指标，fn 返回数值；累计值（如缓存命中次数）kind 用 counter"""
+        self._gauges.append((name, help_text, fn, kind))
+
+    @staticmethod
+    def _histogram_lines(name, key_names, histograms):
+        for key, hist in sorted(histograms.items()):
+            labels = dict(zip(key_names, key))
+            for bound, count in zip(hist.buckets, hist.counts):
+                yield f'{name}_bucket{{{_labels(dict(labels, le=bound))}}} {count}'
+            yield f'{name}_bucket{{{_labels(dict(labels, le="+Inf"))}}} {hist.count}'
+            yield f'{name}_sum{{{_labels(labels)}}} {hist.sum:.6f}'
+            yield f'{name}_count{{{_labels(labels)}}} {hist.count}'
+
+    def render(self):
+        """Prometheus 文本格式"""
+        with self._lock:
+            lines = ['# HELP http_request_duration_seconds 请求处理耗时',
+                     '# TYPE http_request_duration_seconds histogram']
+            lines += self._histogram_lines('http_request_duration_seconds', ('method', 'route', 'status'),
+                                           self._latency)
+            lines += ['# HELP http_request_db_queries 每个请求执行的 SQL 条数',
+                      '# TYPE http_request_db_queries histogram']
+            lines += self._histogram_lines('http_request_db_queries', ('method', 'route'), self._queries)
+            lines += ['# HELP http_request_db_seconds_total 请求中执行 SQL 的累计耗时',
+                      '# TYPE http_request_db_seconds_total counter']
+            lines += [f'http_request_db_seconds_total{{{_labels(dict(method=m, route=r))}}} {v:.6f}'
+                      for (m, r), v in sorted(self._query_seconds.items())]
+        for name, help_text, fn, kind in self._gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}', f'{name} {fn()}']
+        return '\n'.join(lines) + '\n'
+
+
+def _route():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_app(app, metrics):
+    """注册请求钩子；metrics 为 RequestMetrics"""
+    app.config.setdefault('QUERY_COUNT_WARN', 30)
+    app.config.setdefault('PROFILE_TOKEN', None)
+
+    @app.before_request
+    def start_instrumentation():
+        g.request_started = time.perf_counter()
+        g.query_stats = QueryStats()
+        g.query_stats_token = _query_stats.set(g.query_stats)
+        token = app.config['PROFILE_TOKEN']
+        if token and request.headers.get(PROFILE_HEADER) == token:
+            g.profiler = cProfile.Profile()
+            g.profiler.enable()
+
+    @app.after_request
+    def finish_instrumentation(response):
+        if 'request_started' not in g:
+            return response
+        profiler = g.pop('profiler', None)
+        if profiler:
+            profiler.disable()
+        elapsed = time.perf_counter() - g.request_started
+        stats = g.query_stats
+        route = _route()
+        metrics.observe(request.method, route, response.status_code, elapsed, stats)
+        response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.1f}')
+        response.headers.add('Server-Timing', f'db;dur={stats.seconds * 1000:.1f};desc="{stats.count} queries"')
+        if stats.count > app.config['QUERY_COUNT_WARN']:
+            app.logger.warning('%s %s 执行了 %d 条 SQL（阈值 %d），耗时 %.1f ms，可能存在 N+1 查询',
+                               request.method, request.full_path.rstrip('?'), stats.count,
+                               app.config['QUERY_COUNT_WARN'], stats.seconds * 1000)
+        if profiler:
+            output = io.StringIO()
+            output.write(f'{request.method} {request.full_path.rstrip("?")} -> {response.status_code}, '
+                         f'{elapsed * 1000:.1f} ms, {stats.count} queries ({stats.seconds * 1000:.1f} ms)\n\n')
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+            # 丢弃原响应体（可能是打开的文件），换成采样结果
+            if hasattr(response.response, 'close'):
+                response.response.close()
+            response.direct_passthrough = False
+            response.set_data(output.getvalue())
+            response.mimetype = 'text/plain'
+            response.headers.pop('Content-Disposition', None)
+            response.headers.pop('ETag', None)
+            response.headers['X-Profiled-Status'] = str(response.status_code)
+            response.status_code = 200
+        return response
+
+    @app.teardown_request
+    def reset_instrumentation(exc):
+        token = g.pop('query_stats_token', None)
+        if token is not None:
+            _query_stats.reset(token)
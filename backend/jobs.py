@@ -0,0 +1,186 @@
+# backend/jobs.py
+"""后台导出任务队列
+
+任务记录保存在 export_job 表中，由进程内的线程池执行，产出文件写入
+uploads/exports/。执行期间由单独的线程定时刷新心跳，进程重启后，排队中和心跳超时的任务会重新执行；
+完成的文件超过保留期后删除，任务状态改为 expired。
+多个 worker 进程共用一张任务表，领取任务时用条件 UPDATE 保证只执行一次。
+需在应用上下文中调用。
+"""
+import datetime
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from models import db, ExportJob
+
+# 两次写入进度之间的最短间隔（秒），避免频繁写库
+PROGRESS_INTERVAL = 1.0
+# 心跳间隔为 EXPORT_STALE_SECONDS 的几分之一
+HEARTBEAT_DIVISOR = 4
+
+
+class ExportJobQueue:
+    def __init__(self, runner):
+        """runner(kind, params, fileobj, progress) 把文件写入 fileobj，返回 (mimetype, 下载文件名)
+
+        progress(done) 报告已处理的条数
+        """
+        self.runner = runner
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _pool(self, app):
+        with self._lock:
+            # fork 出的子进程不能沿用父进程的线程池
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ThreadPoolExecutor(max_workers=app.config['EXPORT_WORKERS'],
+                                                    thread_name_prefix='export-job')
+                self._pid = os.getpid()
+            return self._executor
+
+    @staticmethod
+    def directory(app):
+        return os.path.join(app.config['UPLOADS_FOLDER'], 'exports')
+
+    def path(self, app, job):
+        return os.path.join(self.directory(app), job.id + os.path.splitext(job.filename or '')[1])
+
+    @staticmethod
+    def _update(job_id, **values):
+        # 单独的短事务，不影响任务线程中正在流式读取的查询
+        with db.engine.begin() as conn:
+            return conn.execute(ExportJob.__table__.update()
+                                .where(ExportJob.__table__.c.id == job_id).values(**values)).rowcount
+
+    def submit(self, app, kind, params, total=None):
+        """登记任务并交给线程池，返回任务 id"""
+        self.purge_expired(app)
+        job = ExportJob(id=uuid.uuid4().hex, kind=kind, params=json.dumps(params, ensure_ascii=False),
+                        status='queued', progress=0, total=total, created_at=datetime.datetime.now())
+        db.session.add(job)
+        db.session.commit()
+        self._pool(app).submit(self._run, app, job.id)
+        return job.id
+
+    def _claim(self, job_id):
+        now = datetime.datetime.now()
+        with db.engine.begin() as conn:
+            table = ExportJob.__table__
+            return conn.execute(table.update()
+                                .where(table.c.id == job_id, table.c.status == 'queued')
+                                .values(status='running', started_at=now, heartbeat_at=now)).rowcount == 1
+
+    @staticmethod
+    def _heartbeat(app, job_id, stopped):
+        """任务执行期间定时刷新心跳，渲染等长时间不报告进度的步骤不会被 recover 误判为超时"""
+        interval = app.config['EXPORT_STALE_SECONDS'] / HEARTBEAT_DIVISOR
+        table = ExportJob.__table__
+        with app.app_context():
+            while not stopped.wait(interval):
+                try:
+                    with db.engine.begin() as conn:
+                        conn.execute(table.update().where(table.c.id == job_id, table.c.status == 'running')
+                                     .values(heartbeat_at=datetime.datetime.now()))
+                except Exception:
+                    app.logger.exception("Error refreshing heartbeat of export job %s", job_id)
+
+    def _run(self, app, job_id):
+        with app.app_context():
+            if not self._claim(job_id):
+                return
+            stopped = threading.Event()
+            heartbeat = threading.Thread(target=self._heartbeat, args=(app, job_id, stopped),
+                                         name=f"export-heartbeat-{job_id[:8]}", daemon=True)
+            heartbeat.start()
+            try:
+                self._execute(app, job_id)
+            finally:
+                stopped.set()
+                heartbeat.join()
+
+    def _execute(self, app, job_id):
+        """在应用上下文中执行已领取的任务，结果写回任务表"""
+        job = ExportJob.query.get(job_id)
+        kind, params = job.kind, json.loads(job.params)
+        db.session.remove()
+        os.makedirs(self.directory(app), exist_ok=True)
+        part = os.path.join(self.directory(app), f"{job_id}.part")
+        state = {'done': 0, 'reported': 0.0}
+
+        def progress(done):
+            state['done'] = done
+            now = time.monotonic()
+            if now - state['reported'] >= PROGRESS_INTERVAL:
+                state['reported'] = now
+                self._update(job_id, progress=done, heartbeat_at=datetime.datetime.now())
+
+        try:
+            with open(part, 'wb') as f:
+                mimetype, filename = self.runner(kind, params, f, progress)
+            path = os.path.join(self.directory(app), job_id + os.path.splitext(filename)[1])
+            os.replace(part, path)
+            now = datetime.datetime.now()
+            self._update(job_id, status='done', progress=state['done'], filename=filename, mimetype=mimetype,
+                         size=os.path.getsize(path), finished_at=now, heartbeat_at=now,
+                         expires_at=now + datetime.timedelta(hours=app.config['EXPORT_RETENTION_HOURS']))
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception("Error running export job %s", job_id)
+            if os.path.exists(part):
+                os.remove(part)
+            self._update(job_id, status='failed', progress=state['done'], error=str(e),
+                         finished_at=datetime.datetime.now())
+        finally:
+            db.session.remove()
+
+    def recover(self, app):
+        """重新执行排队中的任务，以及心跳超时（执行它的进程已退出）的任务"""
+        stale_before = datetime.datetime.now() - datetime.timedelta(seconds=app.config['EXPORT_STALE_SECONDS'])
+        table = ExportJob.__table__
+        with db.engine.begin() as conn:
+            conn.execute(table.update()
+                         .where(table.c.status == 'running', table.c.heartbeat_at < stale_before)
+                         .values(status='queued'))
+        job_ids = [job_id for job_id, in db.session.query(ExportJob.id)
+                   .filter(ExportJob.status == 'queued').order_by(ExportJob.created_at)]
+        for job_id in job_ids:
+            self._pool(app).submit(self._run, app, job_id)
+        return len(job_ids)
+
+    def purge_expired(self, app, now=None):
+        """删除超过保留期的文件，返回清理的任务数"""
+        now = now or datetime.datetime.now()
+        jobs = ExportJob.query.filter(ExportJob.status == 'done', ExportJob.expires_at < now).all()
+        for job in jobs:
+            path = self.path(app, job)
+            if os.path.exists(path):
+                os.remove(path)
+            job.status = 'expired'
+        if jobs:
+            db.session.commit()
+        return len(jobs)
+
+
+def job_to_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'params': json.loads(job.params),
+        'status': job.status,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': round(100 * job.progress / job.total, 1) if job.total else None,
+        'filename': job.filename,
+        'size': job.size,
+        'error': job.error,
+        'created_at': job.created_at.isoformat(),
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'expires_at': job.expires_at.isoformat() if job.expires_at else None,
+        'download_url': f"/api/exports/{job.id}/download" if job.status == 'done' else None
+    }
@@ -0,0 +1,120 @@
+# backend/models.py
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+# --- 数据库模型 ---
+class School(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    # 最后一次修改时的价目表修订号，见 changes.py
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+    items = db.relationship('RepairItem', backref='school', lazy=True)
+
+class RepairItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(20), nullable=False)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True)
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0', index=True)
+
+class Quotation(db.Model):
+    __table_args__ = (db.Index('ix_quotation_school_id_created_at', 'school_id', 'created_at'),)
+    id = db.Column(db.Integer, primary_key=True)
+    quotation_number = db.Column(db.String(32), nullable=False, unique=True, index=True)
+    school_id = db.Column(db.Integer, db.ForeignKey('school.id'), nullable=False, index=True)
+    school_name = db.Column(db.String(100), nullable=False)
+    repair_person = db.Column(db.String(100), nullable=False)
+    repair_location = db.Column(db.String(100), nullable=False)
+    repair_time = db.Column(db.DateTime, nullable=False, index=True)
+    total_price = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+    items = db.relationship('QuotationItem', backref='quotation', lazy=True)
+
+class QuotationItem(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    quotation_id = db.Column(db.Integer, db.ForeignKey('quotation.id'), nullable=False, index=True)
+    item_id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    price = db.Column(db.Float, nullable=False)
+    unit = db.Column(db.String(20), nullable=False)
+    quantity = db.Column(db.Integer, nullable=False)
+    subtotal = db.Column(db.Float, nullable=False)
+
+class IdempotencyKey(db.Model):
+    """记录带 Idempotency-Key 提交的计价单，重试时直接返回已创建的结果"""
+    key = db.Column(db.String(64), primary_key=True)
+    quotation_id = db.Column(db.Integer, db.ForeignKey('quotation.id'), nullable=False)
+    # 规范化请求体的 SHA-256，同一个 key 用于不同内容时据此拒绝
+    request_hash = db.Column(db.String(64))
+    # 超过 IDEMPOTENCY_KEY_TTL_HOURS 的键视为不存在，并在记录新键或 flask purge-exports 时删除
+    created_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class QuotationSequence(db.Model):
+    """按天记录已预留的最大计价单序号"""
+    day = db.Column(db.String(8), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False)
+
+class DailyRollup(db.Model):
+    """按 日期 × 学校 × 维修人员 汇总的计价单数量和金额，随提交/删除计价单增量维护"""
+    __tablename__ = 'daily_rollup'
+    day = db.Column(db.String(10), primary_key=True)
+    school_id = db.Column(db.Integer, primary_key=True)
+    repair_person = db.Column(db.String(100), primary_key=True)
+    quotation_count = db.Column(db.Integer, nullable=False, default=0)
+    total_amount = db.Column(db.Float, nullable=False, default=0.0)
+
+class DailyItemRollup(db.Model):
+    """按 日期 × 学校 × 项目名称 汇总的明细数量和金额"""
+    __tablename__ = 'daily_item_rollup'
+    day = db.Column(db.String(10), primary_key=True)
+    school_id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), primary_key=True)
+    line_count = db.Column(db.Integer, nullable=False, default=0)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    amount = db.Column(db.Float, nullable=False, default=0.0)
+
+class ExportJob(db.Model):
+    """后台导出任务，产出文件保存在 uploads/exports/<id><扩展名>"""
+    __tablename__ = 'export_job'
+    id = db.Column(db.String(32), primary_key=True)
+    kind = db.Column(db.String(32), nullable=False)
+    params = db.Column(db.Text, nullable=False)  # JSON
+    status = db.Column(db.String(16), nullable=False, index=True)  # queued/running/done/failed/expired
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    filename = db.Column(db.String(200))
+    mimetype = db.Column(db.String(100))
+    size = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, index=True)
+
+class CacheVersion(db.Model):
+    """多个 worker 进程共用的缓存版本号，某个进程修改数据后递增，其他进程据此丢弃本地缓存"""
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(32), primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False)
+
+class CatalogTombstone(db.Model):
+    """已删除的学校和维修项目，客户端增量同步时据此移除本地缓存"""
+    __tablename__ = 'catalog_tombstone'
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(8), nullable=False)  # school/item
+    record_id = db.Column(db.Integer, nullable=False)
+    school_id = db.Column(db.Integer, nullable=False)
+    revision = db.Column(db.Integer, nullable=False, index=True)
+
+class QuotationArchive(db.Model):
+    """已移入归档库的计价单，每个年份一行，归档库文件见 retention.py"""
+    __tablename__ = 'quotation_archive'
+    year = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    quotation_count = db.Column(db.Integer, nullable=False, default=0)
+    item_count = db.Column(db.Integer, nullable=False, default=0)
+    # 最近一次归档的截止时间，更早创建的计价单均已移出主库
+    archived_before = db.Column(db.DateTime, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
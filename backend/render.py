@@ -0,0 +1,250 @@
+# backend/render.py
+"""计价单图片绘制与渲染缓存
+
+绘制函数只接收普通的 dict，不依赖 Flask 应用上下文或数据库会话。
+Pillow 在第一次绘图时才导入，只提供 JSON 接口的 worker 不需要加载它。
+"""
+import collections
+import glob
+import hashlib
+import io
+import json
+import os
+import threading
+
+# 修改绘制布局时递增，使旧的缓存图片全部失效
+RENDER_VERSION = 1
+
+# 按顺序尝试的中文字体，配置的 CJK_FONT_PATH 优先
+FONT_CANDIDATES = (
+    "C:/Windows/Fonts/simsun.ttc",
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/usr/share/fonts/wqy-microhei/wqy-microhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "arial.ttf",
+)
+FONT_SIZES = {'title': 30, 'text': 18, 'small': 14}
+# 找不到任何 TrueType 字体时使用 Pillow 内置字体
+DEFAULT_FONT = 'default'
+
+
+class FontRegistry:
+    """进程内只加载一次的字体表"""
+
+    def __init__(self, font_path=None):
+        self.font_path = font_path
+        self.path = None
+        self.fonts = {}
+        self._lock = threading.Lock()
+
+    def load(self):
+        from PIL import ImageFont
+        with self._lock:
+            if self.fonts:
+                return self
+            candidates = ((self.font_path,) if self.font_path else ()) + FONT_CANDIDATES
+            for path in candidates:
+                try:
+                    self.fonts = {name: ImageFont.truetype(path, size) for name, size in FONT_SIZES.items()}
+                    self.path = path
+                    break
+                except (IOError, OSError):
+                    continue
+            else:
+                print("Warning: 未找到可用的中文字体，图片中的中文将无法正常显示")
+                self.fonts = {name: ImageFont.load_default() for name in FONT_SIZES}
+                self.path = DEFAULT_FONT
+        return self
+
+    def __getitem__(self, name):
+        if not self.fonts:
+            self.load()
+        return self.fonts[name]
+
+
+def quotation_digest(quotation, fonts):
+    """计价单内容 + 字体 + 布局版本的哈希，用作缓存键和 ETag"""
+    payload = json.dumps([RENDER_VERSION, fonts.path, quotation], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:32]
+
+
+def render_quotation_image(quotation, fonts):
+    """把计价单画成 PIL 图片
+
+    quotation: {'quotation_number', 'created_at', 'school_name', 'total_price',
+                'items': [{'name', 'price', 'quantity', 'unit', 'subtotal'}, ...]}
+    """
+    from PIL import Image, ImageDraw
+    title_font, text_font, small_font = fonts['title'], fonts['text'], fonts['small']
+    items = quotation['items']
+    img_width = 800
+    img_height = 600 + len(items) * 30
+    img = Image.new('RGB', (img_width, img_height), color = 'white')
+    d = ImageDraw.Draw(img)
+    y_offset = 20
+    d.text((img_width/2, y_offset), "维修计价单", font=title_font, fill=(0,0,0), anchor="mt")
+    y_offset += 50
+    d.text((30, y_offset), f"单号: {quotation['quotation_number']}", font=text_font, fill=(0,0,0))
+    d.text((img_width - 250, y_offset), f"日期: {quotation['created_at'][:10]}", font=text_font, fill=(0,0,0))
+    y_offset += 30
+    d.text((30, y_offset), f"学校: {quotation['school_name']}", font=text_font, fill=(0,0,0))
+    # 不再显示客户
+    y_offset += 40
+    d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
+    y_offset += 10
+    d.text((40, y_offset), "维修项目", font=text_font, fill=(0,0,0))
+    d.text((img_width/2 - 100, y_offset), "单价", font=text_font, fill=(0,0,0))
+    d.text((img_width/2 + 0, y_offset), "数量", font=text_font, fill=(0,0,0))
+    d.text((img_width/2 + 100, y_offset), "单位", font=text_font, fill=(0,0,0))
+    d.text((img_width - 150, y_offset), "小计", font=text_font, fill=(0,0,0))
+    y_offset += 20
+    d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
+    y_offset += 10
+    for item in items:
+        d.text((40, y_offset), str(item['name']), font=text_font, fill=(0,0,0))
+        d.text((img_width/2 - 100, y_offset), f"{item['price']:.2f}", font=text_font, fill=(0,0,0))
+        d.text((img_width/2 + 0, y_offset), str(item['quantity']), font=text_font, fill=(0,0,0))
+        d.text((img_width/2 + 100, y_offset), str(item['unit']), font=text_font, fill=(0,0,0))
+        d.text((img_width - 150, y_offset), f"{item['subtotal']:.2f}", font=text_font, fill=(0,0,0))
+        y_offset += 30
+    d.line([(30, y_offset), (img_width - 30, y_offset)], fill=(0,0,0), width=1)
+    y_offset += 20
+    d.text((img_width - 250, y_offset), f"总计金额: {quotation['total_price']:.2f} 元", font=title_font, fill=(0,0,0))
+    y_offset += 50
+    d.text((30, y_offset), "维修单位: 重庆星豫科技", font=small_font, fill=(100,100,100))
+    d.text((img_width - 150, y_offset), "签字: _________", font=small_font, fill=(100,100,100))
+    return img
+
+
+def render_quotation_png(quotation, fonts):
+    img_io = io.BytesIO()
+    render_quotation_image(quotation, fonts).save(img_io, 'PNG')
+    return img_io.getvalue()
+
+
+# --- 进程池工作进程 ---
+_worker_fonts = None
+
+
+def init_worker(font_path):
+    """进程池初始化：每个工作进程只加载一次字体"""
+    global _worker_fonts
+    _worker_fonts = FontRegistry(None if font_path == DEFAULT_FONT else font_path).load()
+
+
+def render_in_worker(quotation):
+    return render_quotation_png(quotation, _worker_fonts)
+
+
+def write_pdf(pngs, fileobj):
+    """把多张 PNG 合并为多页 PDF"""
+    from PIL import Image
+    pages = [Image.open(io.BytesIO(png)) for png in pngs]
+    pages[0].save(fileobj, 'PDF', save_all=True, append_images=pages[1:], resolution=100.0)
+    fileobj.seek(0)
+    return fileobj
+
+
+class RenderCache:
+    """计价单图片缓存：内存 LRU（按字节数限制）+ 磁盘文件
+
+    以 (计价单id, 内容哈希) 为键，磁盘文件名为 <id>-<digest>.png，
+    删除计价单时按 id 清理。
+    """
+
+    def __init__(self, directory, max_bytes=32 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, quotation_id, digest):
+        return os.path.join(self.directory, f"{quotation_id}-{digest}.png")
+
+    def _remember(self, key, data):
+        # 调用方需持有锁
+        if key in self._entries:
+            return
+        self._entries[key] = data
+        self.size += len(data)
+        while self.size > self.max_bytes and self._entries:
+            _, evicted = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def get(self, quotation_id, digest):
+        key = (quotation_id, digest)
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return data
+        try:
+            with open(self._path(quotation_id, digest), 'rb') as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.disk_hits += 1
+            self._remember(key, data)
+        return data
+
+    def put(self, quotation_id, digest, data):
+        path = self._path(quotation_id, digest)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Error writing render cache: {e}")
+        with self._lock:
+            self._remember((quotation_id, digest), data)
+
+    def invalidate(self, quotation_id):
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == quotation_id]:
+                self.size -= len(self._entries.pop(key))
+        for path in glob.glob(os.path.join(self.directory, f"{quotation_id}-*.png")):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def invalidate_many(self, quotation_ids):
+        """清理多张计价单的缓存，只遍历一次缓存目录"""
+        quotation_ids = set(quotation_ids)
+        with self._lock:
+            for key in [k for k in self._entries if k[0] in quotation_ids]:
+                self.size -= len(self._entries.pop(key))
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                prefix = entry.name.split('-', 1)[0]
+                if prefix.isdigit() and int(prefix) in quotation_ids:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_ratio': round((self.hits + self.disk_hits) / lookups, 4) if lookups else 0.0,
+                'entries': len(self._entries),
+                'bytes': self.size
+            }
@@ -0,0 +1,202 @@
+# backend/reports.py
+"""统计报表：SQL 聚合查询和按天汇总表的增量维护
+
+汇总既可以直接对 quotation/quotation_item 做 GROUP BY（raw），
+也可以读取按天预聚合的 daily_rollup/daily_item_rollup（rollup），
+后者的开销只与天数有关。需在应用上下文中调用。
+"""
+import datetime
+
+from sqlalchemy import DateTime, Integer, cast, func
+from sqlalchemy.dialects import postgresql, sqlite
+
+from models import db, School, Quotation, QuotationItem, DailyRollup, DailyItemRollup
+
+PERIODS = ('day', 'week', 'month')
+SQLITE_PERIOD_FORMATS = {'day': '%Y-%m-%d', 'month': '%Y-%m'}
+POSTGRES_PERIOD_FORMATS = {'day': 'YYYY-MM-DD', 'week': 'IYYY-"W"IW', 'month': 'YYYY-MM'}
+DEFAULT_TOP_ITEMS = 10
+# 支持 INSERT ... ON CONFLICT DO UPDATE 的方言
+UPSERT_INSERTS = {'sqlite': sqlite.insert, 'postgresql': postgresql.insert}
+
+
+def _sqlite_iso_week(column):
+    """ISO 周（如 2024-W01），与 PostgreSQL 的 IYYY-"W"IW 一致
+
+    SQLite 的 strftime 没有 %G/%V：ISO 周的年份和序号都由该周的星期四决定，
+    先退 3 天再取之后（含当天）的第一个星期四即是
+    """
+    thursday = func.date(column, '-3 days', 'weekday 4')
+    week = (cast(func.strftime('%j', thursday), Integer) - 1) / 7 + 1
+    return func.printf('%s-W%02d', func.strftime('%Y', thursday), week)
+
+
+def period_expr(column, period, dialect_name):
+    """把时间列（DateTime 或 YYYY-MM-DD 字符串）格式化为日/周/月的分组键，周为 ISO 周"""
+    if dialect_name == 'sqlite':
+        if period == 'week':
+            return _sqlite_iso_week(column)
+        return func.strftime(SQLITE_PERIOD_FORMATS[period], column)
+    return func.to_char(cast(column, DateTime), POSTGRES_PERIOD_FORMATS[period])
+
+
+def day_of(value):
+    """计价单创建时间所在的日期，形如 2024-01-01"""
+    if isinstance(value, datetime.datetime):
+        return value.date().isoformat()
+    return str(value)[:10]
+
+
+# --- 汇总表增量维护 ---
+def _increment(model, key_names, rows):
+    """对每行按 key_names 定位汇总行并累加其余列，汇总行不存在时插入
+
+    SQLite/PostgreSQL 用 INSERT ... ON CONFLICT DO UPDATE，两个事务同时插入同一汇总行时
+    后者等待并改为累加，不会因主键冲突失败；其他数据库先 UPDATE、没有命中再 INSERT
+    """
+    table = model.__table__
+    value_names = [name for name in rows[0] if name not in key_names]
+    upsert = UPSERT_INSERTS.get(db.engine.dialect.name)
+    if upsert is not None:
+        statement = upsert(table)
+        db.session.execute(statement.on_conflict_do_update(
+            index_elements=[table.c[name] for name in key_names],
+            set_={name: table.c[name] + statement.excluded[name] for name in value_names}), rows)
+        return
+    for row in rows:
+        condition = [table.c[name] == row[name] for name in key_names]
+        updated = db.session.execute(table.update().where(*condition).values(
+            {name: table.c[name] + row[name] for name in value_names})).rowcount
+        if not updated:
+            db.session.execute(table.insert().values(**row))
+
+
+def record_quotation(quotation, lines, sign=1):
+    """在当前事务中把一张计价单计入（sign=1）或移出（sign=-1）汇总表
+
+    lines 为带 name/quantity/subtotal 的 dict 或 QuotationItem
+    """
+    day = day_of(quotation.created_at)
+    _increment(DailyRollup, ('day', 'school_id', 'repair_person'),
+               [{'day': day, 'school_id': quotation.school_id, 'repair_person': quotation.repair_person,
+                 'quotation_count': sign, 'total_amount': sign * quotation.total_price}])
+    item_rows = []
+    for line in lines:
+        line = line if isinstance(line, dict) else {
+            'name': line.name, 'quantity': line.quantity, 'subtotal': line.subtotal}
+        item_rows.append({'day': day, 'school_id': quotation.school_id, 'name': line['name'],
+                          'line_count': sign, 'quantity': sign * line['quantity'], 'amount': sign * line['subtotal']})
+    if item_rows:
+        _increment(DailyItemRollup, ('day', 'school_id', 'name'), item_rows)
+
+
+def rebuild_rollups(conn, first_day=None, last_day=None, school_id=None):
+    """用 INSERT ... SELECT 从明细重建汇总表，可用作迁移步骤
+
+    first_day/last_day（YYYY-MM-DD，均包含在内）和 school_id 限定只重建这部分汇总行，
+    其余保持不变；已归档的计价单不在主库中，重建时应从归档截止日期开始，见 retention.py
+    """
+    day = period_expr(Quotation.created_at, 'day', conn.dialect.name)
+    quotation_filter, rollup_filter, item_rollup_filter = [], [], []
+    if first_day:
+        quotation_filter.append(Quotation.created_at >= datetime.datetime.fromisoformat(first_day))
+        rollup_filter.append(DailyRollup.day >= first_day)
+        item_rollup_filter.append(DailyItemRollup.day >= first_day)
+    if last_day:
+        end_before = datetime.datetime.fromisoformat(last_day) + datetime.timedelta(days=1)
+        quotation_filter.append(Quotation.created_at < end_before)
+        rollup_filter.append(DailyRollup.day <= last_day)
+        item_rollup_filter.append(DailyItemRollup.day <= last_day)
+    if school_id is not None:
+        quotation_filter.append(Quotation.school_id == school_id)
+        rollup_filter.append(DailyRollup.school_id == school_id)
+        item_rollup_filter.append(DailyItemRollup.school_id == school_id)
+    conn.execute(DailyRollup.__table__.delete().where(*rollup_filter))
+    conn.execute(DailyItemRollup.__table__.delete().where(*item_rollup_filter))
+    conn.execute(DailyRollup.__table__.insert().from_select(
+        ['day', 'school_id', 'repair_person', 'quotation_count', 'total_amount'],
+        db.select(day, Quotation.school_id, Quotation.repair_person,
+                  func.count(Quotation.id), func.sum(Quotation.total_price))
+        .where(*quotation_filter)
+        .group_by(day, Quotation.school_id, Quotation.repair_person)))
+    conn.execute(DailyItemRollup.__table__.insert().from_select(
+        ['day', 'school_id', 'name', 'line_count', 'quantity', 'amount'],
+        db.select(day, Quotation.school_id, QuotationItem.name, func.count(QuotationItem.id),
+                  func.sum(QuotationItem.quantity), func.sum(QuotationItem.subtotal))
+        .select_from(QuotationItem)
+        .join(Quotation, Quotation.id == QuotationItem.quotation_id)
+        .where(*quotation_filter)
+        .group_by(day, Quotation.school_id, QuotationItem.name)))
+
+
+# --- 报表查询 ---
+def _rows(query, key_names):
+    return [dict(zip(key_names, row[:len(key_names)]), quotations=int(row[-2] or 0), amount=round(row[-1] or 0, 2))
+            for row in query]
+
+
+def _school_names(rows):
+    ids = {row['school_id'] for row in rows}
+    names = dict(db.session.query(School.id, School.name).filter(School.id.in_(ids))) if ids else {}
+    for row in rows:
+        row['school_name'] = names.get(row['school_id'], '未知学校')
+    return rows
+
+
+def summary(start, end, school_id=None, period='day', top=DEFAULT_TOP_ITEMS, use_rollup=True):
+    """start/end 为 datetime.date，均包含在内"""
+    dialect = db.engine.dialect.name
+    if use_rollup:
+        count_col, amount_col = func.sum(DailyRollup.quotation_count), func.sum(DailyRollup.total_amount)
+        base = db.session.query(DailyRollup).filter(DailyRollup.day >= start.isoformat(),
+                                                     DailyRollup.day <= end.isoformat())
+        if school_id:
+            base = base.filter(DailyRollup.school_id == school_id)
+        period_col = period_expr(DailyRollup.day, period, dialect)
+        school_col, person_col = DailyRollup.school_id, DailyRollup.repair_person
+        items = db.session.query(DailyItemRollup.name, func.sum(DailyItemRollup.quantity),
+                                 func.sum(DailyItemRollup.line_count), func.sum(DailyItemRollup.amount)) \
+            .filter(DailyItemRollup.day >= start.isoformat(), DailyItemRollup.day <= end.isoformat())
+        if school_id:
+            items = items.filter(DailyItemRollup.school_id == school_id)
+        items = items.group_by(DailyItemRollup.name).order_by(func.sum(DailyItemRollup.amount).desc())
+    else:
+        count_col, amount_col = func.count(Quotation.id), func.sum(Quotation.total_price)
+        # 结束日期包含当天：created_at < end + 1 天
+        start_at = datetime.datetime.combine(start, datetime.time())
+        end_before = datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time())
+        range_filter = (Quotation.created_at >= start_at, Quotation.created_at < end_before)
+        base = db.session.query(Quotation).filter(*range_filter)
+        if school_id:
+            base = base.filter(Quotation.school_id == school_id)
+        period_col = period_expr(Quotation.created_at, period, dialect)
+        school_col, person_col = Quotation.school_id, Quotation.repair_person
+        items = db.session.query(QuotationItem.name, func.sum(QuotationItem.quantity),
+                                 func.count(QuotationItem.id), func.sum(QuotationItem.subtotal)) \
+            .join(Quotation, Quotation.id == QuotationItem.quotation_id) \
+            .filter(*range_filter)
+        if school_id:
+            items = items.filter(Quotation.school_id == school_id)
+        items = items.group_by(QuotationItem.name).order_by(func.sum(QuotationItem.subtotal).desc())
+
+    quotations, amount = base.with_entities(count_col, amount_col).one()
+    by_school = _rows(base.with_entities(school_col, count_col, amount_col)
+                      .group_by(school_col).order_by(amount_col.desc()), ['school_id'])
+    by_period = _rows(base.with_entities(period_col, count_col, amount_col)
+                      .group_by(period_col).order_by(period_col), ['period'])
+    by_person = _rows(base.with_entities(person_col, count_col, amount_col)
+                      .group_by(person_col).order_by(amount_col.desc()), ['repair_person'])
+    top_items = [{'name': name, 'quantity': int(quantity or 0), 'lines': int(lines or 0), 'amount': round(total or 0, 2)}
+                 for name, quantity, lines, total in items.limit(top)]
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'period': period,
+        'source': 'rollup' if use_rollup else 'raw',
+        'totals': {'quotations': int(quotations or 0), 'amount': round(amount or 0, 2)},
+        # 删除计价单后汇总表中可能残留数量为 0 的行
+        'by_school': _school_names([r for r in by_school if r['quotations']]),
+        'by_period': [r for r in by_period if r['quotations']],
+        'by_repair_person': [r for r in by_person if r['quotations']],
+        'top_items': [r for r in top_items if r['lines']]
+    }
@@ -0,0 +1,217 @@
+# backend/responses.py
+"""JSON 响应的编码、压缩和缓存
+
+- OrjsonEncoder: 用 orjson 序列化 jsonify 的数据（需安装 orjson，否则沿用标准库），
+  日期等类型仍交给 Flask 的 JSONEncoder.default 处理，输出与原来一致，只是中文不再转义
+- 压缩: 超过 COMPRESS_MIN_BYTES 的文本类响应按 Accept-Encoding 用 brotli（需安装 brotli）
+  或 gzip 压缩；已编码、流式和直接传文件的响应不处理。压缩后 ETag 改为弱 ETag
+- columns: 把行字典列表转换为按列存放的数组，省去每行重复的键名
+- ResponseCache: 按完整 URL 缓存 GET 响应，条目记录生成时的数据版本号，
+  版本变化（有写入）或超过 TTL 即失效；按条目数和总字节数做 LRU 淘汰
+- SharedVersion: 多个 worker 进程共用的数据版本号，写入后递增
+"""
+import collections
+import functools
+import gzip
+import threading
+import time
+
+from flask import current_app, request
+from flask.json import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'image/svg+xml')
+GZIP_LEVEL = 6
+# 动态响应在请求中压缩，brotli 取中等质量，压缩率仍优于 gzip 且耗时相近
+BROTLI_QUALITY = 5
+ROW_FORMATS = ('rows', 'columns')
+
+
+class OrjsonEncoder(JSONEncoder):
+    def encode(self, o):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if self.indent:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(o, default=self.default, option=option).decode('utf-8')
+        except orjson.JSONEncodeError:
+            # 超出 64 位的整数、NaN 之外的特殊值等，交给标准库
+            return super().encode(o)
+
+
+def wants_columns():
+    """请求参数 format=columns 时返回 True；format 取值不合法时抛出 ValueError"""
+    row_format = request.args.get('format', 'rows')
+    if row_format not in ROW_FORMATS:
+        raise ValueError(f"format 须为 {' 或 '.join(ROW_FORMATS)}")
+    return row_format == 'columns'
+
+
+def columns(rows, fields):
+    """[{'id': 1, 'name': 'a'}, ...] -> {'fields': ['id', 'name'], 'columns': [[1, ...], ['a', ...]]}"""
+    fields = list(fields)
+    return {'fields': fields, 'columns': [[row[field] for row in rows] for field in fields]}
+
+
+def _encoding():
+    accepted = request.accept_encodings
+    if brotli is not None and accepted['br'] > 0:
+        return 'br'
+    if accepted['gzip'] > 0:
+        return 'gzip'
+    return None
+
+
+def compress_response(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304) \
+            or response.direct_passthrough or response.is_streamed \
+            or 'Content-Encoding' in response.headers \
+            or not (response.mimetype or '').startswith(COMPRESSIBLE_TYPES):
+        return response
+    data = response.get_data()
+    if len(data) < current_app.config['COMPRESS_MIN_BYTES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    encoding = _encoding()
+    if encoding is None:
+        return response
+    if encoding == 'br':
+        body = brotli.compress(data, quality=BROTLI_QUALITY)
+    else:
+        body = gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        # 压缩后的字节与原 ETag 对应的内容不同，只能作为弱 ETag
+        response.set_etag(etag, weak=True)
+    return response
+
+
+class SharedVersion:
+    def __init__(self, read, bump, sync_interval=1.0):
+        """read() 返回共享的版本号（尚未写入时为 None），bump(version) 递增到不小于 version 并返回新值
+
+        本进程 bump 后立即可见，其他进程最多 sync_interval 秒后读到
+        """
+        self.read = read
+        self._bump = bump
+        self.sync_interval = sync_interval
+        self.version = 0
+        self._synced_at = None
+        self._lock = threading.Lock()
+
+    def current(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._synced_at is not None and now - self._synced_at < self.sync_interval:
+                return self.version
+            self._synced_at = now
+        version = self.read()
+        with self._lock:
+            if version is not None:
+                self.version = version
+            return self.version
+
+    def bump(self):
+        with self._lock:
+            version = max(self.version + 1, int(time.time() * 1000))
+        version = self._bump(version)
+        with self._lock:
+            self.version = version
+        return version
+
+
+CachedResponse = collections.namedtuple('CachedResponse', ['version', 'expires', 'status', 'headers', 'body'])
+
+
+class ResponseCache:
+    def __init__(self, ttl=30, max_entries=256, max_bytes=32 * 1024 * 1024):
+        """ttl 为 0 时不缓存"""
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()  # 键 -> CachedResponse
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, version):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.version == version and entry.expires > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, key, version, response):
+        body = response.get_data()
+        if len(body) > self.max_bytes // 4:
+            return
+        headers = [(k, v) for k, v in response.headers if k.lower() != 'content-length']
+        entry = CachedResponse(version, time.monotonic() + self.ttl, response.status_code, headers, body)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self._bytes += len(body)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        self._bytes -= len(self._entries.pop(key).body)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._bytes, 'hits': self.hits, 'misses': self.misses}
+
+    def cached(self, version):
+        """装饰 GET 视图：version() 返回视图所读数据的当前版本号；只缓存 200 响应
+
+        命中时仍按 If-None-Match 返回 304
+        """
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                if not self.ttl or request.method != 'GET':
+                    return view(*args, **kwargs)
+                key = request.full_path
+                current = version()
+                entry = self.get(key, current)
+                if entry is not None:
+                    response = current_app.response_class(entry.body, status=entry.status, headers=entry.headers)
+                    return response.make_conditional(request)
+                response = current_app.make_response(view(*args, **kwargs))
+                if response.status_code == 200 and not response.direct_passthrough and not response.is_streamed:
+                    self.put(key, current, response)
+                return response
+            return wrapper
+        return decorator
+
+
+def init_app(app):
+    app.config.setdefault('COMPRESS_MIN_BYTES', 1024)
+    if orjson is not None:
+        app.json_encoder = OrjsonEncoder
+    app.after_request(compress_response)
@@ -0,0 +1,216 @@
+# backend/retention.py
+"""计价单的级联删除和归档
+
+删除: delete_quotations 用几条集合式 DELETE ... WHERE 删除计价单及其明细和幂等键，
+再只重建被删计价单所在日期的汇总行，不逐条加载 ORM 对象；purge_idempotency_keys 删除过期的幂等键。
+
+归档: archive_quotations 把早于截止时间的计价单按创建年份移入 ARCHIVE_FOLDER 下的
+quotations_<年份>.db。归档库是只含 quotation/quotation_item 两张表的 SQLite 文件，
+列与主库相同，写完后 VACUUM 成紧凑的文件，仍可直接查询：导出用 open_archive 只读打开，
+执行与主库相同的查询。汇总表保留已归档计价单的数据，按汇总表统计的报表不受影响；
+直接聚合明细（source=raw）只统计主库中的计价单。归档后用 reclaim_space 回收主库空间。
+
+每批计价单在一个事务中先写入归档库再从主库删除。主库为 WAL 模式时两个文件的提交
+不是原子的，中断后归档库中可能已有这批计价单，重新执行时按单号先删掉再写入，
+不会丢失也不会重复。归档仅支持 SQLite，需在应用上下文中调用。
+"""
+import contextlib
+import datetime
+import os
+
+from sqlalchemy import Column, Index, MetaData, Table, func, select
+
+import database
+import reports
+from models import db, IdempotencyKey, Quotation, QuotationArchive, QuotationItem
+
+ARCHIVE_SCHEMA = 'archive'
+ARCHIVE_BATCH_SIZE = 1000
+# PRAGMA auto_vacuum 的取值
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+# --- 删除 ---
+def delete_quotations(*criteria):
+    """在当前事务中删除满足 criteria 的计价单及其明细和幂等键，返回被删除的计价单 id
+
+    criteria 只能引用 quotation 表的列；汇总表只重建这些计价单的日期范围（都属于同一学校时只重建该学校）
+    """
+    ids = [quotation_id for quotation_id, in db.session.execute(select(Quotation.id).where(*criteria))]
+    if not ids:
+        return ids
+    first, last, min_school, max_school = db.session.execute(
+        select(func.min(Quotation.created_at), func.max(Quotation.created_at),
+               func.min(Quotation.school_id), func.max(Quotation.school_id)).where(*criteria)).one()
+    selected = select(Quotation.id).where(*criteria)
+    db.session.execute(IdempotencyKey.__table__.delete().where(IdempotencyKey.quotation_id.in_(selected)))
+    db.session.execute(QuotationItem.__table__.delete().where(QuotationItem.quotation_id.in_(selected)))
+    db.session.execute(Quotation.__table__.delete().where(*criteria))
+    reports.rebuild_rollups(db.session.connection(), reports.day_of(first), reports.day_of(last),
+                            min_school if min_school == max_school else None)
+    return ids
+
+
+def purge_idempotency_keys(before):
+    """在当前事务中删除 before 之前记录的幂等键，返回删除的数量"""
+    table = IdempotencyKey.__table__
+    return db.session.execute(table.delete().where(table.c.created_at < before)).rowcount
+
+
+# --- 归档 ---
+def months_ago(months, today=None):
+    """today 所在月份往前 months 个月的 1 日零点，如 2024-05-20 往前 3 个月为 2024-02-01"""
+    today = today or datetime.date.today()
+    index = today.year * 12 + today.month - 1 - months
+    return datetime.datetime(index // 12, index % 12 + 1, 1)
+
+
+def archive_path(folder, year):
+    return os.path.join(folder, f"quotations_{year}.db")
+
+
+def archived_years(start_at=None, end_before=None):
+    """与 [start_at, end_before) 有重叠的归档年份，升序"""
+    query = db.session.query(QuotationArchive.year).order_by(QuotationArchive.year)
+    if start_at:
+        query = query.filter(QuotationArchive.year >= start_at.year)
+    if end_before:
+        query = query.filter(QuotationArchive.year <= (end_before - datetime.timedelta(microseconds=1)).year)
+    return [year for year, in query]
+
+
+def rollup_start():
+    """已归档部分的截止日期（YYYY-MM-DD），重建汇总表时应从这一天开始；没有归档时为 None"""
+    before = db.session.query(func.max(QuotationArchive.archived_before)).scalar()
+    return reports.day_of(before) if before else None
+
+
+@contextlib.contextmanager
+def open_archive(folder, year):
+    """只读打开某一年的归档库，返回连接"""
+    engine = database.readonly_sqlite_engine(archive_path(folder, year))
+    try:
+        with engine.connect() as conn:
+            yield conn
+    finally:
+        engine.dispose()
+
+
+def _archive_tables(schema):
+    """归档库中的表：列与主库相同，不带外键，只建导出筛选用到的索引"""
+    metadata = MetaData(schema=schema)
+    quotation, item = (Table(model.__table__.name, metadata,
+                             *[Column(c.name, c.type, primary_key=c.primary_key, nullable=c.nullable)
+                               for c in model.__table__.columns])
+                       for model in (Quotation, QuotationItem))
+    Index('ix_quotation_quotation_number', quotation.c.quotation_number, unique=True)
+    Index('ix_quotation_created_at', quotation.c.created_at)
+    Index('ix_quotation_school_id_created_at', quotation.c.school_id, quotation.c.created_at)
+    Index('ix_quotation_item_quotation_id', item.c.quotation_id)
+    return metadata, quotation, item
+
+
+def _move_batch(conn, tables, batch):
+    """把满足 batch 条件的计价单从主库移到已附加的归档库，返回 (计价单数, 明细数)"""
+    archive_quotation, archive_item = tables
+    numbers = select(Quotation.quotation_number).where(*batch)
+    leftover = select(archive_quotation.c.id).where(archive_quotation.c.quotation_number.in_(numbers))
+    conn.execute(archive_item.delete().where(archive_item.c.quotation_id.in_(leftover)))
+    conn.execute(archive_quotation.delete().where(archive_quotation.c.quotation_number.in_(numbers)))
+
+    selected = select(Quotation.id).where(*batch)
+    quotation_columns = [c.name for c in archive_quotation.columns]
+    item_columns = [c.name for c in archive_item.columns]
+    conn.execute(archive_quotation.insert().from_select(
+        quotation_columns, select(*[Quotation.__table__.c[name] for name in quotation_columns]).where(*batch)))
+    conn.execute(archive_item.insert().from_select(
+        item_columns, select(*[QuotationItem.__table__.c[name] for name in item_columns])
+        .where(QuotationItem.quotation_id.in_(selected))))
+
+    conn.execute(IdempotencyKey.__table__.delete().where(IdempotencyKey.quotation_id.in_(selected)))
+    items = conn.execute(QuotationItem.__table__.delete().where(QuotationItem.quotation_id.in_(selected))).rowcount
+    quotations = conn.execute(Quotation.__table__.delete().where(*batch)).rowcount
+    return quotations, items
+
+
+def _record_archive(conn, year, before, tables):
+    archive_quotation, archive_item = tables
+    table = QuotationArchive.__table__
+    values = {
+        'quotation_count': conn.execute(select(func.count()).select_from(archive_quotation)).scalar(),
+        'item_count': conn.execute(select(func.count()).select_from(archive_item)).scalar(),
+        'updated_at': datetime.datetime.now(),
+    }
+    previous = conn.execute(select(table.c.archived_before).where(table.c.year == year)).scalar()
+    if previous is None:
+        conn.execute(table.insert().values(year=year, archived_before=before, **values))
+    else:
+        conn.execute(table.update().where(table.c.year == year)
+                     .values(archived_before=max(previous, before), **values))
+
+
+def _archive_year(year, before, folder, batch_size, progress):
+    in_year = (Quotation.created_at >= datetime.datetime(year, 1, 1),
+               Quotation.created_at < min(datetime.datetime(year + 1, 1, 1), before))
+    metadata, *tables = _archive_tables(ARCHIVE_SCHEMA)
+    moved = last_id = 0
+    with db.engine.connect() as conn:
+        # ATTACH/DETACH/VACUUM 都不能在事务中执行
+        conn.exec_driver_sql(f"ATTACH DATABASE ? AS {ARCHIVE_SCHEMA}", (archive_path(folder, year),))
+        try:
+            with conn.begin():
+                metadata.create_all(conn)
+            while True:
+                with conn.begin():
+                    ids = [quotation_id for quotation_id, in conn.execute(
+                        select(Quotation.id).where(*in_year, Quotation.id > last_id)
+                        .order_by(Quotation.id).limit(batch_size))]
+                    if not ids:
+                        break
+                    quotations, items = _move_batch(conn, tables, (*in_year, Quotation.id.between(ids[0], ids[-1])))
+                moved += quotations
+                last_id = ids[-1]
+                if progress:
+                    progress(year, ids, items)
+            with conn.begin():
+                _record_archive(conn, year, before, tables)
+            conn.exec_driver_sql(f"VACUUM {ARCHIVE_SCHEMA}")
+        finally:
+            conn.exec_driver_sql(f"DETACH DATABASE {ARCHIVE_SCHEMA}")
+    return moved
+
+
+def archive_quotations(before, folder, batch_size=ARCHIVE_BATCH_SIZE, progress=None):
+    """把 created_at 早于 before 的计价单移入按年份划分的归档库，返回 {年份: 本次移动的计价单数}
+
+    每移动一批调用 progress(年份, 计价单 id 列表, 明细数)
+    """
+    if db.engine.dialect.name != 'sqlite':
+        raise RuntimeError('归档仅支持 SQLite 数据库')
+    os.makedirs(folder, exist_ok=True)
+    year = func.strftime('%Y', Quotation.created_at)
+    with db.engine.connect() as conn:
+        years = [int(y) for y, in conn.execute(
+            select(year).where(Quotation.created_at < before).distinct().order_by(year))]
+    return {y: _archive_year(y, before, folder, batch_size, progress) for y in years}
+
+
+def reclaim_space():
+    """把主库中删除数据空出的页归还给文件系统，返回 (回收前, 回收后) 的文件字节数
+
+    数据库还不是增量 auto_vacuum 模式时先执行一次完整 VACUUM 转换（期间其他连接无法写入），
+    之后每次只需 PRAGMA incremental_vacuum
+    """
+    with db.engine.connect() as conn:
+        def size():
+            return conn.exec_driver_sql('PRAGMA page_count').scalar() * conn.exec_driver_sql('PRAGMA page_size').scalar()
+        before = size()
+        if conn.exec_driver_sql('PRAGMA auto_vacuum').scalar() != AUTO_VACUUM_INCREMENTAL:
+            conn.exec_driver_sql('PRAGMA auto_vacuum=INCREMENTAL')
+            conn.exec_driver_sql('VACUUM')
+        else:
+            # sqlite3 模块的 execute 只执行一步，每次只释放一页；executescript 会执行到结束
+            conn.connection.executescript('PRAGMA incremental_vacuum')
+        # WAL 模式下释放的页先写入 -wal 文件，检查点之后主文件才会变小
+        conn.exec_driver_sql('PRAGMA wal_checkpoint(TRUNCATE)').fetchall()
+        return before, size()
@@ -0,0 +1,166 @@
+# backend/search.py
+"""维修项目名称搜索（SQLite FTS5）
+
+FTS5 自带的分词器不会切分中文，这里在写入索引前自行分词：
+中文按单字和相邻两字（bigram）切分，字母数字按整词，另外为每段中文生成
+拼音首字母的全部后缀（如 "挂机更换" -> _pygjgh、_pyjgh ...），
+这样 "挂机"、"gj"、"2p" 都能命中 "2P柜、挂机更换四通阀"。
+学校 id 也作为一个词写入，按学校筛选同样走索引。
+
+索引表不随 repair_item 自动更新，增删改项目后由调用方 sync_items / sync_schools。
+非 SQLite 数据库或 SQLite 未编译 FTS5 时退回 LIKE 查询。需在应用上下文中调用。
+"""
+import functools
+import re
+
+from sqlalchemy import func, text
+
+from models import db, RepairItem
+
+FTS_TABLE = 'repair_item_fts'
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+# 辅助词以下划线开头，用户输入只会生成字母数字词，不会误命中它们
+PINYIN_PREFIX = '_py'
+SCHOOL_PREFIX = '_s'
+
+_CJK_RUN = re.compile(r'[㐀-鿿]+')
+_WORD = re.compile(r'[0-9a-z]+')
+
+# None 表示尚未检测
+_fts_available = None
+_pinyin_initials = None
+
+
+@functools.lru_cache(maxsize=None)
+def _char_initial(char):
+    return _pinyin_initials(char)[:1]
+
+
+def pinyin_initials(chars):
+    """中文字符串的拼音首字母，未安装 pypinyin 时返回空字符串
+
+    逐字取首字母并缓存，多音字按最常用读音处理
+    """
+    global _pinyin_initials
+    if _pinyin_initials is None:
+        try:
+            from pypinyin import Style, lazy_pinyin
+            _pinyin_initials = lambda s: ''.join(p[0] for p in lazy_pinyin(s, style=Style.FIRST_LETTER) if p)
+        except ImportError:
+            print("Warning: 未安装 pypinyin，项目搜索不支持拼音首字母")
+            _pinyin_initials = lambda s: ''
+    return ''.join(_char_initial(char) for char in chars).lower()
+
+
+def item_tokens(name, school_id):
+    """写入索引的词，空格分隔"""
+    name = name.lower()
+    tokens = [f"{SCHOOL_PREFIX}{school_id}"]
+    tokens += _WORD.findall(name)
+    for run in _CJK_RUN.findall(name):
+        tokens += list(run)
+        tokens += [run[i:i + 2] for i in range(len(run) - 1)]
+        initials = pinyin_initials(run)
+        tokens += [PINYIN_PREFIX + initials[i:] for i in range(len(initials))]
+    return ' '.join(tokens)
+
+
+def match_expression(q, school_id=None):
+    """把用户输入转换为 FTS5 MATCH 表达式，没有可搜索的内容时返回 None"""
+    q = q.lower()
+    terms = []
+    for run in _CJK_RUN.findall(q):
+        grams = [run] if len(run) == 1 else [run[i:i + 2] for i in range(len(run) - 1)]
+        terms += [f'"{gram}"' for gram in grams]
+    for word in _WORD.findall(q):
+        # 字母既可能是名称中的英文/型号，也可能是拼音首字母
+        if word.isdigit():
+            terms.append(f'"{word}"*')
+        else:
+            terms.append(f'("{word}"* OR "{PINYIN_PREFIX}{word}"*)')
+    if not terms:
+        return None
+    if school_id:
+        terms.append(f'"{SCHOOL_PREFIX}{school_id}"')
+    return ' AND '.join(terms)
+
+
+def fts_available():
+    global _fts_available
+    if _fts_available is None:
+        _fts_available = db.engine.dialect.name == 'sqlite' and bool(db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}).scalar())
+    return _fts_available
+
+
+def create_index(conn):
+    """建立索引表并写入全部项目，可用作迁移步骤；不支持 FTS5 时跳过"""
+    global _fts_available
+    if conn.dialect.name != 'sqlite':
+        return
+    try:
+        conn.execute(text(f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                          f"USING fts5(tokens, tokenize=\"unicode61 tokenchars '_'\")"))
+    except Exception as e:
+        print(f"Warning: SQLite 不支持 FTS5，项目搜索将使用 LIKE 查询: {e}")
+        return
+    _fts_available = None
+    _reindex(conn, conn.execute(text('SELECT id, name, school_id FROM repair_item')).fetchall(), clear=True)
+
+
+def _reindex(conn, rows, clear=False, ids=()):
+    if clear:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    elif ids:
+        conn.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({','.join(str(int(i)) for i in ids)})"))
+    if rows:
+        conn.execute(text(f"INSERT INTO {FTS_TABLE} (rowid, tokens) VALUES (:id, :tokens)"),
+                     [{'id': item_id, 'tokens': item_tokens(name, school_id)} for item_id, name, school_id in rows])
+
+
+def sync_items(item_ids):
+    """按 repair_item 的当前内容刷新这些项目的索引（已删除的项目会移出索引），在当前事务中执行"""
+    item_ids = list(item_ids)
+    if not item_ids or not fts_available():
+        return
+    rows = db.session.query(RepairItem.id, RepairItem.name, RepairItem.school_id) \
+        .filter(RepairItem.id.in_(item_ids)).all()
+    _reindex(db.session, rows, ids=item_ids)
+
+
+def sync_schools(school_ids=None):
+    """重建这些学校（None 为全部）的索引，用于批量导入和清空之后"""
+    if not fts_available():
+        return
+    query = db.session.query(RepairItem.id, RepairItem.name, RepairItem.school_id)
+    if school_ids is None:
+        _reindex(db.session, query.all(), clear=True)
+        return
+    school_ids = list(school_ids)
+    if not school_ids:
+        return
+    tokens = ' OR '.join(f'"{SCHOOL_PREFIX}{int(school_id)}"' for school_id in school_ids)
+    db.session.execute(text(f"DELETE FROM {FTS_TABLE} WHERE rowid IN "
+                            f"(SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :tokens)"), {'tokens': tokens})
+    _reindex(db.session, query.filter(RepairItem.school_id.in_(school_ids)).all())
+
+
+def search(q, school_id=None, limit=DEFAULT_LIMIT):
+    """按相关度返回前 limit 个项目 [(id, name, price, unit, school_id), ...]"""
+    if fts_available():
+        expression = match_expression(q, school_id)
+        if expression is None:
+            return []
+        # bm25 越小越相关，同分时名称越短越贴近输入
+        return db.session.execute(text(
+            f"SELECT r.id, r.name, r.price, r.unit, r.school_id FROM {FTS_TABLE} "
+            f"JOIN repair_item r ON r.id = {FTS_TABLE}.rowid "
+            f"WHERE {FTS_TABLE} MATCH :expression "
+            f"ORDER BY bm25({FTS_TABLE}), length(r.name), r.id LIMIT :limit"),
+            {'expression': expression, 'limit': limit}).fetchall()
+    query = db.session.query(RepairItem.id, RepairItem.name, RepairItem.price, RepairItem.unit, RepairItem.school_id) \
+        .filter(RepairItem.name.contains(q, autoescape=True))
+    if school_id:
+        query = query.filter(RepairItem.school_id == school_id)
+    return query.order_by(func.length(RepairItem.name), RepairItem.id).limit(limit).all()
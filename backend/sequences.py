@@ -0,0 +1,35 @@
+# backend/sequences.py
+"""按天递增的编号分配器
+
+每次向数据库预留一段连续编号（一个 block），之后在进程内逐个发放，
+多个 worker 各自持有不同的区间，发放编号时不需要再写数据库。
+进程重启或跨天时未用完的编号会被丢弃，因此编号唯一但可能不连续。
+"""
+import datetime
+import os
+import threading
+
+
+class BlockAllocator:
+    def __init__(self, reserve, block_size=20):
+        """reserve(day, size) 在数据库中为 day 预留 size 个编号，返回区间的最后一个值"""
+        self.reserve = reserve
+        self.block_size = block_size
+        self._day = None
+        self._pid = None
+        self._next = 0
+        self._end = 0  # 不含
+        self._lock = threading.Lock()
+
+    def allocate(self, now=None):
+        """返回 (day, 序号)，day 形如 20240101"""
+        day = (now or datetime.datetime.now()).strftime('%Y%m%d')
+        with self._lock:
+            # fork 出的子进程不能沿用父进程预留的区间，否则会发出重复编号
+            if day != self._day or os.getpid() != self._pid or self._next >= self._end:
+                last = self.reserve(day, self.block_size)
+                self._day, self._pid = day, os.getpid()
+                self._next, self._end = last - self.block_size + 1, last + 1
+            value = self._next
+            self._next += 1
+            return day, value
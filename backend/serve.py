@@ -0,0 +1,121 @@
+# backend/serve.py
+"""生产环境启动入口
+
+app.py 末尾的 app.run(debug=True) 是单进程的调试服务器，只适合开发。
+这里用 gunicorn（Linux/macOS，多进程 × 多线程）或 waitress（Windows 等，单进程多线程）
+运行同一个应用：
+
+    python backend/serve.py --workers 4 --threads 4 --bind 0.0.0.0:5001
+
+各参数也可以用环境变量 WEB_SERVER、WEB_BIND、WEB_WORKERS、WEB_THREADS、WEB_TIMEOUT 设置。
+
+多个 worker 共用一个 SQLite 文件时：应用在主进程中创建一次（AUTO_MIGRATE 开启时同时建表和迁移），
+worker 由 fork 继承，不会再次创建；fork 之前关闭主进程的数据库连接，每个 worker 各自建立连接
+（SQLite 连接不能跨进程使用）。并发写入由 WAL 模式和忙等待超时处理，见 database.py。
+"""
+import argparse
+import os
+import sys
+
+DEFAULT_BIND = '0.0.0.0:5001'
+DEFAULT_THREADS = 4
+# 同步导出大文件可能较慢，超时时间比 gunicorn 默认的 30 秒宽松
+DEFAULT_TIMEOUT = 120
+
+
+def default_workers():
+    # SQLite 写入是串行的，进程数超过核数收益不大
+    return min(os.cpu_count() or 1, 8)
+
+
+def load_app():
+    """在主进程中创建应用、执行迁移并预热静态文件，然后断开数据库连接以便 fork"""
+    import app as app_module
+    from models import db
+    application = app_module.create_app()
+    print(application.config['DATABASE_DESCRIPTION'])
+    with application.app_context():
+        count = application.extensions['static_assets'].warm()
+        db.engine.dispose()
+    print(f"静态文件已预压缩: {count} 个")
+    return application
+
+
+def dispose_engine(application):
+    """fork 后丢弃从主进程继承的连接池，不关闭父进程的连接"""
+    from models import db
+    with application.app_context():
+        db.engine.dispose(close=False)
+
+
+def run_gunicorn(application, args):
+    from gunicorn.app.base import BaseApplication
+
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', args.bind)
+            self.cfg.set('workers', args.workers)
+            self.cfg.set('threads', args.threads)
+            self.cfg.set('worker_class', 'gthread' if args.threads > 1 else 'sync')
+            self.cfg.set('timeout', args.timeout)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('accesslog', args.access_log)
+            self.cfg.set('post_fork', lambda server, worker: dispose_engine(application))
+
+        def load(self):
+            return application
+
+    Server().run()
+
+
+def run_waitress(application, args):
+    from waitress import serve
+    if args.workers > 1:
+        print("Warning: waitress 只有单个进程，--workers 被忽略，并发由 --threads 决定")
+    host, _, port = args.bind.rpartition(':')
+    serve(application, host=host or '0.0.0.0', port=int(port), threads=args.threads,
+          channel_timeout=args.timeout)
+
+
+def available_server():
+    for name in ('gunicorn', 'waitress'):
+        try:
+            __import__(name)
+        except ImportError:
+            continue
+        if name == 'gunicorn' and sys.platform == 'win32':
+            continue
+        return name
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--server', choices=['gunicorn', 'waitress'], default=os.environ.get('WEB_SERVER'),
+                        help='默认优先使用已安装的 gunicorn，其次 waitress')
+    parser.add_argument('--bind', default=os.environ.get('WEB_BIND', DEFAULT_BIND), help='监听地址 host:port')
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', default_workers())),
+                        help='worker 进程数（仅 gunicorn）')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', DEFAULT_THREADS)),
+                        help='每个进程的线程数')
+    parser.add_argument('--timeout', type=int, default=int(os.environ.get('WEB_TIMEOUT', DEFAULT_TIMEOUT)),
+                        help='单个请求的超时秒数')
+    parser.add_argument('--access-log', default=os.environ.get('WEB_ACCESS_LOG'),
+                        help='访问日志文件，- 为标准输出，默认不记录（仅 gunicorn）')
+    args = parser.parse_args()
+
+    server = args.server or available_server()
+    if server is None:
+        parser.error('请先安装 gunicorn 或 waitress: pip install gunicorn')
+    application = load_app()
+    os.makedirs(application.config['UPLOADS_FOLDER'], exist_ok=True)
+    print(f"使用 {server} 监听 {args.bind}: {args.workers if server == 'gunicorn' else 1} 个进程 × "
+          f"{args.threads} 个线程")
+    if server == 'gunicorn':
+        run_gunicorn(application, args)
+    else:
+        run_waitress(application, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -224,32 +224,53 @@ document.addEventListener('DOMContentLoaded', () => {
     }
 
     /**
-     * 加载所有计价单
+     * 分页加载计价单（按 id 倒序），reset 为 true 时按当前查询条件从第一页重新加载
      */
-    async function fetchAllQuotations() {
-        try {
+    // 列表只展示这些字段，投影掉明细可避免后端加载全部 QuotationItem
+    const QUOTATION_LIST_FIELDS = 'id,quotation_number,school_name,total_price,created_at';
+    const QUOTATION_PAGE_SIZE = 100;
+    const loadMoreQuotationsBtn = document.getElementById('load-more-quotations-btn');
+    let quotationFilters = []; // 当前查询条件，如 ['school_id=1', 'start=2024-01-01']
+    let nextQuotationCursor = null; // 下一页的 after 参数，null 表示已加载完
+
+    async function loadQuotations(reset = true) {
+        const params = [`fields=${QUOTATION_LIST_FIELDS}`, `limit=${QUOTATION_PAGE_SIZE}`, ...quotationFilters];
+        if (reset) {
             quotationsTableBody.innerHTML = '<tr><td colspan="6">加载中...</td></tr>';
-            const response = await fetch(`${API_BASE_URL}/quotations`);
+        } else {
+            params.push(`after=${nextQuotationCursor}`);
+        }
+        loadMoreQuotationsBtn.disabled = true;
+        try {
+            const response = await fetch(`${API_BASE_URL}/quotations?${params.join('&')}`);
             if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const quotations = await response.json();
-            renderQuotationsTable(quotations);
+            const { quotations, next_after } = await response.json();
+            if (reset) quotationsTableBody.innerHTML = '';
+            appendQuotationRows(quotations);
+            nextQuotationCursor = next_after;
         } catch (error) {
             console.error("获取计价单列表失败:", error);
-            quotationsTableBody.innerHTML = '<tr><td colspan="6">加载计价单失败</td></tr>';
+            if (reset) {
+                quotationsTableBody.innerHTML = '<tr><td colspan="6">加载计价单失败</td></tr>';
+                nextQuotationCursor = null;
+            } else {
+                alert('加载更多计价单失败');
+            }
+        } finally {
+            loadMoreQuotationsBtn.disabled = false;
+            loadMoreQuotationsBtn.style.display = nextQuotationCursor === null ? 'none' : '';
         }
     }
 
     /**
-     * 渲染计价单到表格
+     * 把一页计价单追加到表格
      * @param {Array} quotations 计价单列表数据
      */
-    function renderQuotationsTable(quotations) {
-        quotationsTableBody.innerHTML = '';
-        if (quotations.length === 0) {
+    function appendQuotationRows(quotations) {
+        if (quotations.length === 0 && quotationsTableBody.rows.length === 0) {
             quotationsTableBody.innerHTML = '<tr><td colspan="6">暂无计价单</td></tr>';
             return;
         }
-        quotations.sort((a, b) => new Date(b.created_at) - new Date(a.created_at)); // 按创建时间降序
 
         quotations.forEach(q => {
             const row = quotationsTableBody.insertRow();
@@ -283,17 +304,15 @@ document.addEventListener('DOMContentLoaded', () => {
         const target = event.target;
         if (target.classList.contains('item-edit-btn')) {
             const itemId = parseInt(target.dataset.id);
-            // 需要先获取单个项目的详细信息，因为列表可能不包含所有学校ID
+            // 编辑前取该项目的最新信息
             try {
-                const res = await fetch(`${API_BASE_URL}/items`); // 获取所有项目，然后筛选
-                if (!res.ok) throw new Error('Failed to fetch item details for editing');
-                const allItems = await res.json();
-                const itemToEdit = allItems.find(item => item.id === itemId);
-                if (itemToEdit) {
-                    openItemModal(itemToEdit);
-                } else {
+                const res = await fetch(`${API_BASE_URL}/items/${itemId}`);
+                if (res.status === 404) {
                     alert('未找到要编辑的项目信息。');
+                    return;
                 }
+                if (!res.ok) throw new Error('Failed to fetch item details for editing');
+                openItemModal(await res.json());
             } catch (err) {
                 alert('加载编辑信息失败: ' + err.message);
             }
@@ -303,19 +322,24 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
-    // 批量导出Excel事件监听
+    // 批量导出Excel事件监听：创建后台导出任务，轮询进度，完成后下载
     document.getElementById('export-batch-excel-btn').addEventListener('click', async () => {
+        const button = document.getElementById('export-batch-excel-btn');
+        const buttonText = button.textContent;
+        const body = { kind: 'quotations_excel', layout: document.getElementById('export-layout').value };
         const schoolId = document.getElementById('export-school').value;
         const start = document.getElementById('export-start').value;
         const end = document.getElementById('export-end').value;
-        let params = [];
-        if (schoolId) params.push(`school_id=${encodeURIComponent(schoolId)}`);
-        if (start) params.push(`start=${encodeURIComponent(start)}`);
-        if (end) params.push(`end=${encodeURIComponent(end)}`);
-        let url = `${API_BASE_URL}/quotations/export_batch_excel`;
-        if (params.length > 0) url += '?' + params.join('&');
+        if (schoolId) body.school_id = schoolId;
+        if (start) body.start = start;
+        if (end) body.end = end;
+        button.disabled = true;
         try {
-            const response = await fetch(url);
+            const response = await fetch(`${API_BASE_URL}/exports`, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify(body)
+            });
             if (!response.ok) {
                 if (response.status === 404) {
                     alert("没有计价单可以导出。");
@@ -324,29 +348,63 @@ document.addEventListener('DOMContentLoaded', () => {
                 const errorData = await response.json();
                 throw new Error(errorData.error || `HTTP error! status: ${response.status}`);
             }
-            // 触发浏览器下载
-            const blob = await response.blob();
-            const contentDisposition = response.headers.get('content-disposition');
-            let filename = '批量导出计价单.xlsx';
-            if (contentDisposition) {
-                const filenameMatch = contentDisposition.match(/filename[^;=\n]*=((['"]).*?\2|[^;\n]*)/);
-                if (filenameMatch && filenameMatch[1]) {
-                    filename = filenameMatch[1].replace(/['"]/g, '');
-                }
+            const { status_url } = await response.json();
+            let job;
+            while (true) {
+                await new Promise(resolve => setTimeout(resolve, 1000));
+                const statusResponse = await fetch(`${API_BASE_URL.replace(/\/api$/, '')}${status_url}`);
+                if (!statusResponse.ok) throw new Error(`HTTP error! status: ${statusResponse.status}`);
+                job = await statusResponse.json();
+                if (job.status === 'done') break;
+                if (job.status === 'failed') throw new Error(job.error || '导出失败');
+                button.textContent = job.percent === null ? '导出中...' : `导出中 ${job.percent}%`;
             }
-            const urlBlob = window.URL.createObjectURL(blob);
-            const a = document.createElement('a');
-            a.style.display = 'none';
-            a.href = urlBlob;
-            a.download = decodeURIComponent(filename); // 解码文件名
-            document.body.appendChild(a);
-            a.click();
-            window.URL.revokeObjectURL(urlBlob);
-            document.body.removeChild(a);
-            alert('批量导出Excel文件已开始下载。');
+            // 导出文件由服务端保存，直接跳转下载
+            window.location.href = `${API_BASE_URL.replace(/\/api$/, '')}${job.download_url}`;
         } catch (error) {
             console.error("批量导出Excel失败:", error);
             alert(`批量导出Excel失败: ${error.message}`);
+        } finally {
+            button.disabled = false;
+            button.textContent = buttonText;
+        }
+    });
+
+    // 按导出的筛选条件批量删除计价单：先查询匹配数量，确认后删除
+    document.getElementById('bulk-delete-btn').addEventListener('click', async () => {
+        const body = {};
+        const schoolId = document.getElementById('export-school').value;
+        const start = document.getElementById('export-start').value;
+        const end = document.getElementById('export-end').value;
+        if (schoolId) body.school_id = schoolId;
+        if (start) body.start = start;
+        if (end) body.end = end;
+        if (!schoolId && !start && !end) {
+            alert('请先选择学校或日期范围。');
+            return;
+        }
+        const request = (extra) => fetch(`${API_BASE_URL}/quotations/bulk_delete`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify({ ...body, ...extra })
+        }).then(async response => {
+            const data = await response.json();
+            if (!response.ok) throw new Error(data.error || `HTTP error! status: ${response.status}`);
+            return data;
+        });
+        try {
+            const { matched } = await request({ dry_run: true });
+            if (!matched) {
+                alert('没有符合条件的计价单。');
+                return;
+            }
+            if (!confirm(`将删除 ${matched} 张计价单，此操作不可恢复。确定删除吗？`)) return;
+            const { message } = await request({});
+            alert(message);
+            loadQuotations();
+        } catch (error) {
+            console.error("批量删除计价单失败:", error);
+            alert(`批量删除计价单失败: ${error.message}`);
         }
     });
 
@@ -387,27 +445,19 @@ document.addEventListener('DOMContentLoaded', () => {
         const schoolId = document.getElementById('filter-school').value;
         const start = document.getElementById('filter-start').value;
         const end = document.getElementById('filter-end').value;
-        let url = `${API_BASE_URL}/quotations`;
-        const params = [];
-        if (schoolId) params.push(`school_id=${encodeURIComponent(schoolId)}`);
-        if (start) params.push(`start=${encodeURIComponent(start)}`);
-        if (end) params.push(`end=${encodeURIComponent(end)}`);
-        if (params.length > 0) url += '?' + params.join('&');
-        try {
-            const res = await fetch(url);
-            if (!res.ok) throw new Error('查询失败');
-            const data = await res.json();
-            renderQuotationsTable(data);
-        } catch (e) {
-            alert('查询失败');
-        }
+        quotationFilters = [];
+        if (schoolId) quotationFilters.push(`school_id=${encodeURIComponent(schoolId)}`);
+        if (start) quotationFilters.push(`start=${encodeURIComponent(start)}`);
+        if (end) quotationFilters.push(`end=${encodeURIComponent(end)}`);
+        await loadQuotations();
     });
+    loadMoreQuotationsBtn.addEventListener('click', () => loadQuotations(false));
 
     // --- 初始化加载 ---
     async function initializeAdminPage() {
         await fetchAllSchools(); // 先加载学校，因为项目表单需要学校列表
         await fetchAllRepairItems();
-        await fetchAllQuotations();
+        await loadQuotations();
         await initExportSchoolSelect(); // 初始化导出学校下拉
         await initFilterSchoolSelect(); // 初始化查询条件学校下拉
     }
@@ -450,7 +500,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 await initExportSchoolSelect();
             } catch (e) { alert('修改失败'); }
         } else if (target.classList.contains('delete-school-btn')) {
-            if (!confirm('确定删除该学校？')) return;
+            if (!confirm('确定删除该学校？该学校的维修项目和计价单将一并删除，此操作不可恢复。')) return;
             try {
                 const response = await fetch(`${API_BASE_URL}/schools/${id}`, { method: 'DELETE' });
                 if (!response.ok) throw new Error('删除失败');
@@ -471,7 +521,8 @@ document.addEventListener('DOMContentLoaded', () => {
                 const response = await fetch(`${API_BASE_URL}/quotations/${id}`, { method: 'DELETE' });
                 if (!response.ok) throw new Error('删除失败');
                 alert('删除成功');
-                fetchAllQuotations();
+                // 只移除这一行，保留已加载的页
+                target.closest('tr').remove();
             } catch (e) {
                 alert('删除失败');
             }
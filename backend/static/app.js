@@ -3,6 +3,7 @@ document.addEventListener('DOMContentLoaded', () => {
     const schoolSelect = document.getElementById('school-select');
     const itemsGrid = document.getElementById('items-grid');
     const repairItemSelect = document.getElementById('repair-item-select'); // 新增：维修项目下拉选择框
+    const repairItemSearchInput = document.getElementById('repair-item-search'); // 维修项目搜索框
     const repairQuantityInput = document.getElementById('repair-quantity'); // 新增：维修数量输入框
     const addItemToCartBtn = document.getElementById('add-item-to-cart-btn'); // 新增：添加到计价单按钮
     const repairPersonInput = document.getElementById('repair-person'); // 新增：维修人员输入框
@@ -17,6 +18,12 @@ document.addEventListener('DOMContentLoaded', () => {
     let currentSchoolId = null;
     let currentRepairItems = []; // 当前学校的维修项目
     let selectedQuotationItems = []; // 当前计价单中的项目
+    let submissionKey = null; // 同一张计价单重试提交时复用，避免网络不稳定时重复创建
+
+    // 学校、项目或维修信息变化后就是另一张计价单，须换新的 key，否则服务端会以 422 拒绝
+    function resetSubmissionKey() {
+        submissionKey = null;
+    }
 
     // 监听学校选择变化
     schoolSelect.addEventListener('change', function() {
@@ -55,14 +62,63 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     });
 
+    // 价目表本地缓存：首次全量同步，之后只取上次修订号之后的变化，网络不可用时沿用缓存
+    const CATALOG_CACHE_KEY = 'repair-catalog';
+    let catalogSync = null; // 进行中的同步，页面初始化时多处调用只发一次请求
+
+    function loadCatalogCache() {
+        try {
+            const cached = JSON.parse(localStorage.getItem(CATALOG_CACHE_KEY));
+            if (cached && cached.apiBase === API_BASE_URL) return cached;
+        } catch (e) {
+            // 缓存损坏时重新全量同步
+        }
+        return { apiBase: API_BASE_URL, revision: 0, schools: {}, items: {} };
+    }
+
+    async function syncCatalog() {
+        const catalog = loadCatalogCache();
+        try {
+            const response = await fetch(`${API_BASE_URL}/sync?since=${catalog.revision}`);
+            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+            const delta = await response.json();
+            if (delta.full) {
+                catalog.schools = {};
+                catalog.items = {};
+            }
+            delta.deleted.schools.forEach(id => { delete catalog.schools[id]; });
+            delta.deleted.items.forEach(id => { delete catalog.items[id]; });
+            delta.schools.forEach(({ id, name }) => { catalog.schools[id] = { id, name }; });
+            delta.items.forEach(({ id, name, price, unit, school_id }) => {
+                catalog.items[id] = { id, name, price, unit, school_id };
+            });
+            catalog.revision = delta.revision;
+            try {
+                localStorage.setItem(CATALOG_CACHE_KEY, JSON.stringify(catalog));
+            } catch (e) {
+                console.warn('价目表缓存写入失败:', e);
+            }
+        } catch (error) {
+            if (!catalog.revision) throw error;
+            console.warn('价目表同步失败，使用本地缓存:', error);
+        }
+        return catalog;
+    }
+
+    function getCatalog() {
+        if (!catalogSync) {
+            catalogSync = syncCatalog().finally(() => { catalogSync = null; });
+        }
+        return catalogSync;
+    }
+
     /**
      * 获取学校列表并填充选择框
      */
     async function fetchSchools() {
         try {
-            const response = await fetch(`${API_BASE_URL}/schools`);
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            const schools = await response.json();
+            const catalog = await getCatalog();
+            const schools = Object.values(catalog.schools);
             schoolSelect.innerHTML = ''; // 清空下拉框
             schools.forEach(school => {
                 const option = document.createElement('option');
@@ -81,6 +137,7 @@ document.addEventListener('DOMContentLoaded', () => {
      * @param {number} schoolId 学校ID
      */
     async function fetchRepairItems(schoolId) {
+        repairItemSearchInput.value = ''; // 切换学校时清空搜索
         if (!schoolId) {
             // itemsGrid.innerHTML = '<p>请先选择学校</p>'; // 旧的网格布局，不再使用
             repairItemSelect.innerHTML = '<option value="">请先选择学校</option>'; // 更新下拉框
@@ -90,9 +147,8 @@ document.addEventListener('DOMContentLoaded', () => {
         try {
             // itemsGrid.innerHTML = '<p>加载中...</p>'; // 旧的网格布局，不再使用
             repairItemSelect.innerHTML = '<option value="">加载中...</option>'; // 更新下拉框
-            const response = await fetch(`${API_BASE_URL}/schools/${schoolId}/items`);
-            if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
-            currentRepairItems = await response.json();
+            const catalog = await getCatalog();
+            currentRepairItems = Object.values(catalog.items).filter(item => item.school_id === Number(schoolId));
             renderRepairItemsDropdown(); // 修改为渲染下拉框
         } catch (error) {
             console.error(`获取学校 ${schoolId} 的维修项目失败:`, error);
@@ -104,14 +160,17 @@ document.addEventListener('DOMContentLoaded', () => {
 
     /**
      * 渲染维修项目到下拉选择框
+     * @param {Array} items 要显示的项目，默认为当前学校的全部项目
      */
-    function renderRepairItemsDropdown() {
+    function renderRepairItemsDropdown(items = currentRepairItems) {
         repairItemSelect.innerHTML = '<option value="">请选择维修项目</option>'; // 清空并添加默认选项
-        if (currentRepairItems.length === 0 && currentSchoolId) {
-            repairItemSelect.innerHTML = '<option value="">该学校暂无维修项目</option>';
+        if (items.length === 0 && currentSchoolId) {
+            repairItemSelect.innerHTML = items === currentRepairItems
+                ? '<option value="">该学校暂无维修项目</option>'
+                : '<option value="">没有匹配的维修项目</option>';
             return;
         }
-        currentRepairItems.forEach(item => {
+        items.forEach(item => {
             const option = document.createElement('option');
             option.value = item.id;
             option.textContent = `${item.name} (${item.price.toFixed(2)} 元 / ${item.unit})`;
@@ -122,6 +181,32 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    /**
+     * 在服务端搜索当前学校的维修项目，结果按相关度排列
+     */
+    let searchTimer = null;
+    let searchSeq = 0;
+    repairItemSearchInput.addEventListener('input', () => {
+        clearTimeout(searchTimer);
+        searchTimer = setTimeout(async () => {
+            const q = repairItemSearchInput.value.trim();
+            const seq = ++searchSeq;
+            if (!q || !currentSchoolId) {
+                renderRepairItemsDropdown();
+                return;
+            }
+            try {
+                const response = await fetch(`${API_BASE_URL}/items/search?school_id=${currentSchoolId}&q=${encodeURIComponent(q)}`);
+                if (!response.ok) throw new Error(`HTTP error! status: ${response.status}`);
+                const results = await response.json();
+                // 只显示最后一次输入的结果
+                if (seq === searchSeq) renderRepairItemsDropdown(results);
+            } catch (error) {
+                console.error('搜索维修项目失败:', error);
+            }
+        }, 200);
+    });
+
     /**
      * 获取指定项目在购物车中的数量
      * @param {number} itemId 项目ID
@@ -203,6 +288,7 @@ document.addEventListener('DOMContentLoaded', () => {
             });
         }
         // updateItemCardQuantity(itemId, quantity); // 旧的网格布局逻辑，不再需要
+        resetSubmissionKey();
         renderSelectedItems();
         calculateTotalPrice();
         // 清空选择和数量，以便添加下一个
@@ -216,6 +302,7 @@ document.addEventListener('DOMContentLoaded', () => {
      */
     function handleRemoveFromCart(itemId) {
         selectedQuotationItems = selectedQuotationItems.filter(item => item.item_id !== itemId);
+        resetSubmissionKey();
         updateItemCardQuantity(itemId, 0);
         renderSelectedItems();
         calculateTotalPrice();
@@ -304,6 +391,10 @@ document.addEventListener('DOMContentLoaded', () => {
             total_price: parseFloat(calculateTotalPrice())
         };
 
+        if (!submissionKey) {
+            submissionKey = `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        }
+
         try {
             submitQuotationBtn.disabled = true;
             submitQuotationBtn.textContent = '提交中...';
@@ -311,6 +402,7 @@ document.addEventListener('DOMContentLoaded', () => {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
+                    'Idempotency-Key': submissionKey,
                 },
                 body: JSON.stringify(quotationData),
             });
@@ -322,6 +414,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
             const result = await response.json();
             alert(`计价单 ${result.quotation_number} 提交成功！`);
+            submissionKey = null;
             // 重置表单
             selectedQuotationItems = [];
             renderSelectedItems();
@@ -346,12 +439,17 @@ document.addEventListener('DOMContentLoaded', () => {
     schoolSelect.addEventListener('change', (event) => {
         currentSchoolId = event.target.value;
         selectedQuotationItems = []; //切换学校时清空已选项目
+        resetSubmissionKey();
         renderSelectedItems();
         fetchRepairItems(currentSchoolId);
         repairItemSelect.value = ''; // 重置维修项目选择
         repairQuantityInput.value = '1'; // 重置数量
     });
 
+    [repairPersonInput, repairLocationInput, repairTimeInput].forEach(input => {
+        input.addEventListener('input', resetSubmissionKey);
+    });
+
     // itemsGrid.addEventListener('click', (event) => { ... }); // 旧的网格布局事件监听，移除
     // itemsGrid.addEventListener('change', (event) => { ... }); // 旧的网格布局事件监听，移除
 
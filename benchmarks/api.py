@@ -0,0 +1,372 @@
+# benchmarks/api.py
+"""后端热点接口的基准测试和并发压测
+
+先用 seed.py 生成合成数据库，再通过 Flask test client 逐个场景测量：
+顺序请求的延迟分位数（p50/p90/p99），以及多线程并发下的吞吐量。
+结果输出为 JSON，可保存后与其他提交的结果对比：
+
+    python benchmarks/api.py --output before.json
+    python benchmarks/api.py --output after.json --compare before.json
+
+--compare 时 p50 变慢或吞吐下降超过 --threshold 的场景记为回退，进程以状态码 1 退出。
+任一场景的错误率（状态码 >= 400 的请求占比）超过 --max-error-rate（默认 0，即出现任何错误）
+时同样以状态码 1 退出，避免接口返回 5xx 仍被当作通过。
+
+指定 --url 时改为通过 HTTP 压测已启动的服务（调试服务器或 serve.py），--db 须指向该服务
+使用的数据库，用于读取项目和计价单 id：
+
+    python benchmarks/api.py --url http://127.0.0.1:5001 --db instance/repair_system.db
+"""
+import argparse
+import datetime
+import http.client
+import json
+import math
+import os
+import platform
+import random
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import seed as seeding  # noqa: E402
+
+
+class Context:
+    """压测期间共享的数据：每校项目 id 和计价单 id 范围"""
+
+    def __init__(self, app, models):
+        with app.app_context():
+            db = models.db
+            self.items = {}
+            for item_id, school_id in db.session.query(models.RepairItem.id, models.RepairItem.school_id):
+                self.items.setdefault(school_id, []).append(item_id)
+            self.school_ids = sorted(self.items)
+            self.max_quotation_id = db.session.query(db.func.max(models.Quotation.id)).scalar() or 0
+            last = db.session.query(db.func.max(models.Quotation.created_at)).scalar()
+            self.catalog_revision = db.session.query(models.CacheVersion.version) \
+                .filter(models.CacheVersion.name == 'catalog_revision').scalar() or 0
+        self.export_end = last.date()
+        self.export_start = self.export_end - datetime.timedelta(days=6)
+
+    def cart(self, rng, lines=5):
+        school_id = rng.choice(self.school_ids)
+        item_ids = rng.sample(self.items[school_id], min(lines, len(self.items[school_id])))
+        return school_id, [{'item_id': item_id, 'quantity': rng.randint(1, 3), 'school_id': school_id}
+                           for item_id in item_ids]
+
+
+def encode_json(value):
+    return json.dumps(value).encode('utf-8')
+
+
+class HttpResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self.data = data
+
+    def get_data(self):
+        return self.data
+
+    def close(self):
+        pass
+
+
+class HttpClient:
+    """与 Flask test client 的 get/post 用法一致的 HTTP 客户端，复用 keep-alive 连接"""
+
+    def __init__(self, base_url):
+        url = urllib.parse.urlsplit(base_url)
+        self.prefix = url.path.rstrip('/')
+        self.connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=120)
+
+    def _request(self, method, path, body=None, headers=None):
+        for attempt in range(2):
+            try:
+                self.connection.request(method, self.prefix + path, body=body, headers=headers or {})
+                response = self.connection.getresponse()
+                return HttpResponse(response.status, response.read())
+            except (http.client.HTTPException, ConnectionError):
+                # 服务端关闭了空闲连接，重连后重试一次
+                self.connection.close()
+                if attempt:
+                    raise
+
+    def get(self, path):
+        return self._request('GET', path)
+
+    def post(self, path, json=None):
+        return self._request('POST', path, body=encode_json(json), headers={'Content-Type': 'application/json'})
+
+
+# 场景: 名称 -> (请求函数, 默认顺序请求次数)；请求函数返回响应
+def calculate_price(client, rng, ctx):
+    _, items = ctx.cart(rng)
+    return client.post('/api/calculate_price', json={'items': items})
+
+
+def submit_quotation(client, rng, ctx):
+    school_id, items = ctx.cart(rng)
+    return client.post('/api/quotations', json={
+        'school_id': school_id, 'items': items, 'repair_person': '压测', 'repair_location': '压测',
+        'repair_time': datetime.datetime.now().isoformat(timespec='minutes')})
+
+
+def get_quotations_page(client, rng, ctx):
+    after = rng.randint(100, ctx.max_quotation_id + 1)
+    return client.get(f"/api/quotations?limit=100&after={after}"
+                      f"&fields=id,quotation_number,school_name,total_price,created_at")
+
+
+def get_quotations_filtered(client, rng, ctx):
+    day = ctx.export_end - datetime.timedelta(days=rng.randint(0, 30))
+    return client.get(f"/api/quotations?school_id={rng.choice(ctx.school_ids)}&start={day}&end={day}")
+
+
+def get_items_all(client, rng, ctx):
+    return client.get('/api/items')
+
+
+def get_items_by_school(client, rng, ctx):
+    return client.get(f"/api/items?school_id={rng.choice(ctx.school_ids)}")
+
+
+def sync_catalog_delta(client, rng, ctx):
+    # 价目表没有变化时客户端的增量同步
+    return client.get(f"/api/sync?since={ctx.catalog_revision}&school_id={rng.choice(ctx.school_ids)}")
+
+
+def quotation_image(client, rng, ctx):
+    return client.get(f"/api/quotations/{rng.randint(1, ctx.max_quotation_id)}/image")
+
+
+def quotation_excel(client, rng, ctx):
+    return client.get(f"/api/quotations/{rng.randint(1, ctx.max_quotation_id)}/excel")
+
+
+def batch_excel_xlsx(client, rng, ctx):
+    return client.get(f"/api/quotations/export_batch_excel?start={ctx.export_start}&end={ctx.export_end}")
+
+
+def batch_excel_detail(client, rng, ctx):
+    return client.get(f"/api/quotations/export_batch_excel?layout=detail&start={ctx.export_start}&end={ctx.export_end}")
+
+
+def batch_excel_csv(client, rng, ctx):
+    return client.get(f"/api/quotations/export_batch_excel?format=csv&start={ctx.export_start}&end={ctx.export_end}")
+
+
+SCENARIOS = {
+    'calculate_price': (calculate_price, 500),
+    'submit_quotation': (submit_quotation, 200),
+    'get_quotations_page': (get_quotations_page, 200),
+    'get_quotations_filtered': (get_quotations_filtered, 200),
+    'get_items_all': (get_items_all, 50),
+    'get_items_by_school': (get_items_by_school, 200),
+    'sync_catalog_delta': (sync_catalog_delta, 200),
+    'quotation_image': (quotation_image, 30),
+    'quotation_excel': (quotation_excel, 50),
+    'batch_excel_xlsx': (batch_excel_xlsx, 10),
+    'batch_excel_detail': (batch_excel_detail, 10),
+    'batch_excel_csv': (batch_excel_csv, 10),
+}
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    # nearest-rank
+    return sorted_values[max(0, math.ceil(p / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, errors, wall):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 3),
+        'p90_ms': round(percentile(latencies, 90), 3),
+        'p99_ms': round(percentile(latencies, 99), 3),
+        'mean_ms': round(statistics.mean(latencies), 3),
+        'max_ms': round(latencies[-1], 3),
+        'throughput_rps': round(len(latencies) / wall, 1),
+    }
+
+
+def timed(request, client, rng, ctx):
+    start = time.perf_counter()
+    response = request(client, rng, ctx)
+    # 读完响应体，流式响应的生成时间也计入
+    response.get_data()
+    elapsed = (time.perf_counter() - start) * 1000
+    ok = response.status_code < 400
+    response.close()
+    return elapsed, ok
+
+
+def run_sequential(client_factory, request, ctx, requests, rng, warmup):
+    client = client_factory()
+    for _ in range(warmup):
+        timed(request, client, rng, ctx)
+    latencies, errors = [], 0
+    start = time.perf_counter()
+    for _ in range(requests):
+        elapsed, ok = timed(request, client, rng, ctx)
+        latencies.append(elapsed)
+        errors += not ok
+    return summarize(latencies, errors, time.perf_counter() - start)
+
+
+def run_concurrent(client_factory, request, ctx, requests, concurrency, seed):
+    """concurrency 个线程各用一个客户端，共发出 requests 个请求"""
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def worker(index, count):
+        client = client_factory()
+        rng = random.Random(seed + index)
+        for _ in range(count):
+            elapsed, ok = timed(request, client, rng, ctx)
+            with lock:
+                latencies.append(elapsed)
+                errors[0] += not ok
+
+    counts = [requests // concurrency + (i < requests % concurrency) for i in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker, i, n) for i, n in enumerate(counts) if n]:
+            future.result()
+    return summarize(latencies, errors[0], time.perf_counter() - start)
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=seeding.ROOT_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """返回回退列表：p50 变慢或并发吞吐下降超过 threshold 的场景"""
+    regressions = []
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            continue
+        old, new = previous['sequential']['p50_ms'], current['sequential']['p50_ms']
+        if old and new > old * (1 + threshold):
+            regressions.append({'scenario': name, 'metric': 'sequential.p50_ms', 'baseline': old, 'current': new})
+        if previous.get('concurrent') and current.get('concurrent'):
+            old, new = previous['concurrent']['throughput_rps'], current['concurrent']['throughput_rps']
+            if old and new < old * (1 - threshold):
+                regressions.append({'scenario': name, 'metric': 'concurrent.throughput_rps',
+                                    'baseline': old, 'current': new})
+    return regressions
+
+
+def failures(results, max_error_rate):
+    """返回错误率超过 max_error_rate 的场景及其错误统计"""
+    failed = []
+    for name, scenario in results['scenarios'].items():
+        for mode, summary in scenario.items():
+            rate = summary['errors'] / summary['requests']
+            if summary['errors'] and rate > max_error_rate:
+                failed.append({'scenario': name, 'mode': mode, 'errors': summary['errors'],
+                               'requests': summary['requests'], 'error_rate': round(rate, 4)})
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--db', help='数据库文件，默认在临时目录生成；配合 --reuse 可跳过生成')
+    parser.add_argument('--reuse', action='store_true', help='--db 已存在时直接使用')
+    parser.add_argument('--url', help='压测已启动的服务，如 http://127.0.0.1:5001；需同时指定已有的 --db')
+    seeding.add_arguments(parser)
+    parser.add_argument('--scenarios', help=f"逗号分隔，默认全部: {','.join(SCENARIOS)}")
+    parser.add_argument('--scale', type=float, default=1.0, help='各场景默认请求次数的倍数')
+    parser.add_argument('--warmup', type=int, default=3, help='每个场景正式测量前的预热请求数')
+    parser.add_argument('--concurrency', type=int, default=8, help='并发压测的线程数，0 为不做并发压测')
+    parser.add_argument('--output', help='结果 JSON 写入的文件，默认只打印')
+    parser.add_argument('--compare', help='作为基线对比的结果 JSON')
+    parser.add_argument('--threshold', type=float, default=0.2, help='判定回退的相对变化')
+    parser.add_argument('--max-error-rate', type=float, default=0.0,
+                        help='各场景允许的最大错误率（0~1），超过则以状态码 1 退出，默认 0')
+    args = parser.parse_args()
+
+    names = args.scenarios.split(',') if args.scenarios else list(SCENARIOS)
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"未知场景: {', '.join(unknown)}")
+
+    if args.url and not (args.db and os.path.exists(args.db)):
+        parser.error('--url 需要指定该服务使用的数据库 --db')
+
+    workdir = tempfile.mkdtemp(prefix='repair-bench-')
+    db_path = args.db or os.path.join(workdir, 'bench.db')
+    seeded = None
+    if not args.url and not (args.reuse and os.path.exists(db_path)):
+        start = time.perf_counter()
+        seeded = seeding.seed(db_path, **seeding.seed_options(args))
+        seeded['seconds'] = round(time.perf_counter() - start, 2)
+    # 图片缓存等产出写入临时目录，不影响仓库下的 uploads/
+    _, app = seeding.open_app(db_path, uploads_folder=os.path.join(workdir, 'uploads'))
+    import models
+    ctx = Context(app, models)
+    client_factory = (lambda: HttpClient(args.url)) if args.url else app.test_client
+
+    results = {
+        'revision': git_revision(),
+        'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'dataset': dict(seeding.seed_options(args), seeded=seeded),
+        'target': args.url or 'test_client',
+        'concurrency': args.concurrency,
+        'scenarios': {},
+    }
+    for name in names:
+        request, default_requests = SCENARIOS[name]
+        requests = max(1, int(default_requests * args.scale))
+        rng = random.Random(args.seed)
+        scenario = {'sequential': run_sequential(client_factory, request, ctx, requests, rng, args.warmup)}
+        if args.concurrency > 0:
+            scenario['concurrent'] = run_concurrent(client_factory, request, ctx, requests, args.concurrency, args.seed)
+        results['scenarios'][name] = scenario
+        print(f"{name:<26} p50 {scenario['sequential']['p50_ms']:>9.2f} ms  "
+              f"p99 {scenario['sequential']['p99_ms']:>9.2f} ms  "
+              f"{scenario.get('concurrent', scenario['sequential'])['throughput_rps']:>8.1f} req/s",
+              file=sys.stderr)
+
+    exit_code = 0
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+        results['baseline_revision'] = baseline.get('revision')
+        results['regressions'] = compare(results, baseline, args.threshold)
+        exit_code = 1 if results['regressions'] else 0
+    results['failures'] = failures(results, args.max_error_rate)
+    if results['failures']:
+        exit_code = 1
+        for failure in results['failures']:
+            print(f"{failure['scenario']} ({failure['mode']}): {failure['errors']}/{failure['requests']} "
+                  f"个请求失败，错误率 {failure['error_rate']:.2%} 超过 {args.max_error_rate:.2%}", file=sys.stderr)
+    output = json.dumps(results, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(output + '\n')
+    print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == '__main__':
+    main()
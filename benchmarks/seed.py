@@ -0,0 +1,159 @@
+# benchmarks/seed.py
+"""生成用于压测的合成 SQLite 数据库
+
+以 schoolRepairItems.ts 中的真实价目表为模板：学校按模板轮流复制，
+项目数不足时在模板项目名后追加编号补齐；计价单随机分布在最近一年内，
+每单的明细从本校项目中随机抽取。同样的参数和 --seed 生成同样的数据。
+
+    python benchmarks/seed.py /tmp/bench.db --schools 20 --quotations 20000 --lines 5
+"""
+import argparse
+import datetime
+import json
+import os
+import random
+import re
+import sys
+import time
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+BACKEND_DIR = os.path.join(ROOT_DIR, 'backend')
+TEMPLATE_PATH = os.path.join(ROOT_DIR, 'schoolRepairItems.ts')
+REPAIR_PEOPLE = ['张师傅', '李师傅', '王师傅', '刘师傅', '陈师傅', '杨师傅']
+LOCATIONS = ['教学楼', '实训楼', '图书馆', '食堂', '宿舍', '办公楼', '体育馆']
+INSERT_BATCH = 5000
+
+
+def load_template(path=TEMPLATE_PATH):
+    """解析 schoolRepairItems.ts，返回 [(学校名称, [(项目名称, 单价), ...]), ...]"""
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+    schools = []
+    for school_name, block in re.findall(r'\{\s*schoolId: \d+,\s*//\s*(.*?)\s*\n.*?items: \[(.*?)\]\s*\}',
+                                         content, re.S):
+        items = [(name, float(price)) for name, price in
+                 re.findall(r'\{\s*id: \d+,\s*name: "(.*?)",\s*basePrice: (\d+)\s*\}', block)]
+        schools.append((school_name, items))
+    return schools
+
+
+def open_app(db_path, uploads_folder=None):
+    """创建指向 db_path 的应用，并完成建表和迁移"""
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.abspath(db_path)}"
+    if BACKEND_DIR not in sys.path:
+        sys.path.insert(0, BACKEND_DIR)
+    import app as app_module
+    config = {'SQLALCHEMY_DATABASE_URI': os.environ['DATABASE_URL']}
+    if uploads_folder:
+        config['UPLOADS_FOLDER'] = uploads_folder
+    return app_module, app_module.create_app(config)
+
+
+def _insert(conn, table, rows):
+    for i in range(0, len(rows), INSERT_BATCH):
+        conn.execute(table.insert(), rows[i:i + INSERT_BATCH])
+
+
+def seed(db_path, schools=20, items=None, quotations=20000, lines=5, days=365, seed=42):
+    """生成数据库并返回各表行数；items 为每校项目数，默认使用模板中的全部项目"""
+    for path in (db_path, db_path + '-wal', db_path + '-shm'):
+        if os.path.exists(path):
+            os.remove(path)
+    app_module, app = open_app(db_path)
+    from models import db, School, RepairItem, Quotation, QuotationItem, QuotationSequence
+    import reports
+    import search
+
+    rng = random.Random(seed)
+    template = load_template()
+    now = datetime.datetime.now().replace(microsecond=0)
+    with app.app_context(), db.engine.begin() as conn:
+        school_rows, item_rows = [], []
+        catalog = {}  # school_id -> [(item_id, name, price, unit)]
+        item_id = 0
+        for school_id in range(1, schools + 1):
+            template_name, template_items = template[(school_id - 1) % len(template)]
+            school_rows.append({'id': school_id, 'name': f"{template_name}{school_id}"})
+            count = items or len(template_items)
+            catalog[school_id] = []
+            for i in range(count):
+                name, price = template_items[i % len(template_items)]
+                if i >= len(template_items):
+                    name = f"{name}-{i // len(template_items)}"
+                item_id += 1
+                row = {'id': item_id, 'name': name, 'price': price, 'unit': '项', 'school_id': school_id}
+                item_rows.append(row)
+                catalog[school_id].append((item_id, name, price, '项'))
+        _insert(conn, School.__table__, school_rows)
+        _insert(conn, RepairItem.__table__, item_rows)
+
+        # 创建时间按时间先后分配，使 id 顺序与时间顺序一致
+        created = sorted(now - datetime.timedelta(seconds=rng.randrange(days * 86400)) for _ in range(quotations))
+        sequences = {}
+        quotation_rows, line_rows = [], []
+        for quotation_id, created_at in enumerate(created, 1):
+            school_id = rng.randint(1, schools)
+            day = created_at.strftime('%Y%m%d')
+            sequences[day] = sequences.get(day, 0) + 1
+            picked = rng.sample(catalog[school_id], min(len(catalog[school_id]), rng.randint(1, 2 * lines - 1)))
+            total = 0.0
+            for picked_id, name, price, unit in picked:
+                quantity = rng.randint(1, 4)
+                subtotal = round(price * quantity, 2)
+                total += subtotal
+                line_rows.append({'quotation_id': quotation_id, 'item_id': picked_id, 'name': name, 'price': price,
+                                  'unit': unit, 'quantity': quantity, 'subtotal': subtotal})
+            quotation_rows.append({
+                'id': quotation_id,
+                'quotation_number': f"Q{day}{sequences[day]:06d}",
+                'school_id': school_id,
+                'school_name': school_rows[school_id - 1]['name'],
+                'repair_person': rng.choice(REPAIR_PEOPLE),
+                'repair_location': rng.choice(LOCATIONS),
+                'repair_time': created_at - datetime.timedelta(hours=rng.randint(1, 72)),
+                'total_price': round(total, 2),
+                'created_at': created_at,
+            })
+        _insert(conn, Quotation.__table__, quotation_rows)
+        _insert(conn, QuotationItem.__table__, line_rows)
+        # 让服务端新分配的单号从已占用的序号之后开始
+        _insert(conn, QuotationSequence.__table__, [{'day': day, 'last_value': value} for day, value in sequences.items()])
+        reports.rebuild_rollups(conn)
+        search.create_index(conn)
+    with app.app_context():
+        # 与真实数据一致，每个学校都带"其他"项目
+        app_module.backfill_custom_items()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        items_count = RepairItem.query.count()
+    return {'schools': len(school_rows), 'items': items_count, 'quotations': len(quotation_rows),
+            'quotation_items': len(line_rows)}
+
+
+def add_arguments(parser):
+    parser.add_argument('--schools', type=int, default=20, help='学校数量')
+    parser.add_argument('--items', type=int, default=None, help='每校项目数，默认使用模板中的全部项目')
+    parser.add_argument('--quotations', type=int, default=20000, help='计价单数量')
+    parser.add_argument('--lines', type=int, default=5, help='每单平均明细行数')
+    parser.add_argument('--days', type=int, default=365, help='计价单分布的天数')
+    parser.add_argument('--seed', type=int, default=42, help='随机数种子')
+
+
+def seed_options(args):
+    return {'schools': args.schools, 'items': args.items, 'quotations': args.quotations,
+            'lines': args.lines, 'days': args.days, 'seed': args.seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('db_path', help='生成的数据库文件，已存在时覆盖')
+    add_arguments(parser)
+    args = parser.parse_args()
+    start = time.perf_counter()
+    counts = seed(args.db_path, **seed_options(args))
+    counts['seconds'] = round(time.perf_counter() - start, 2)
+    print(json.dumps(counts, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/startup.py
+"""测量后端冷启动耗时（导入 app 模块并创建应用）
+
+每次在新的子进程中执行，取中位数；可用 --backend 指向旧版本的 backend 目录做对比：
+
+    python benchmarks/startup.py
+    python benchmarks/startup.py --backend /tmp/old/backend --runs 15
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+
+
+def measure(code, cwd, runs, env):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], cwd=cwd, env=env, check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backend', default=BACKEND_DIR, help='backend 目录')
+    parser.add_argument('--runs', type=int, default=9, help='每项测量的次数')
+    args = parser.parse_args()
+
+    env = dict(os.environ, PYTHONPATH=args.backend, PYTHONDONTWRITEBYTECODE='0')
+    # 先导入一次，生成字节码缓存并完成建表/迁移，避免计入首次开销
+    measure('import app; app.create_app()', args.backend, 1, env)
+    result = {
+        'python': measure('pass', args.backend, args.runs, env),
+        'flask': measure('import flask, flask_sqlalchemy', args.backend, args.runs, env),
+        'app': measure('import app; app.create_app()', args.backend, args.runs, env),
+        'heavy_modules_loaded': subprocess.run(
+            [sys.executable, '-c', "import sys, app; app.create_app(); print(sorted(m for m in ('openpyxl', 'PIL') if m in sys.modules))"],
+            cwd=args.backend, env=env, capture_output=True, text=True).stdout.strip(),
+    }
+    result['app_minus_flask'] = result['app'] - result['flask']
+    print(json.dumps({k: round(v, 1) if isinstance(v, float) else v for k, v in result.items()},
+                     ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,20 +6,17 @@ import requests
 with open('schoolRepairItems.ts', 'r', encoding='utf-8') as f:
     content = f.read()
 
-# 提取学校和项目
-school_blocks = re.findall(r'\{\s*schoolId: \d+,.*?items: \[(.*?)\]\s*\}', content, re.S)
-school_names = [
-    '两江职业教育中心',
-    '重庆市育才中学'
-]
-schools = []
-for idx, block in enumerate(school_blocks):
+# 提取学校和项目，学校名称取自 schoolId 后面的注释
+school_blocks = re.findall(r'\{\s*schoolId: \d+,\s*//\s*(.*?)\s*\n.*?items: \[(.*?)\]\s*\}', content, re.S)
+
+# 转为 NDJSON，每行一个维修项目
+lines = []
+for school_name, block in school_blocks:
     items = re.findall(r'\{\s*id: \d+,\s*name: "(.*?)",\s*basePrice: (\d+)\s*\}', block)
-    schools.append({
-        'name': school_names[idx],
-        'items': [{'name': name, 'price': float(price)} for name, price in items]
-    })
+    for name, price in items:
+        lines.append(json.dumps({'school': school_name, 'name': name, 'price': float(price)}, ensure_ascii=False))
 
-# 调用API导入
-resp = requests.post('http://127.0.0.1:5001/api/dev/import_school_repair_items', json={'schools': schools})
-print(resp.text) 
\ No newline at end of file
+# 调用批量导入API，已存在的 (学校, 项目) 只更新价格
+resp = requests.post('http://127.0.0.1:5001/api/dev/import_catalog?format=ndjson',
+                     data='\n'.join(lines).encode('utf-8'))
+print(resp.text)